@@ -16,12 +16,14 @@ public class ArgParser {
 	 * @param resource This is the resource you want to query.
 	 * @param procs The processors used by JSONpedia
 	 * @param filters The filters to be used
+	 * @param server Run as a long-lived process answering JSON-lines requests on stdin.
+	 * @param input A file (or "-" for stdin) listing one resource per line, processed in a single run.
 	 */
 
-	@Parameter(names = { "-l", "--lang" }, description = "Resource Language", required = true)
+	@Parameter(names = { "-l", "--lang" }, description = "Resource Language")
 	private String lang;
 
-	@Parameter(names = {"-r", "--resource"}, description = "Wikipedia Resource Name", required = true)
+	@Parameter(names = {"-r", "--resource"}, description = "Wikipedia Resource Name")
 	private String resource;
 
 	@Parameter(names = {"-p", "--procs"}, description = "JSONpedia Processors to be used")
@@ -30,6 +32,13 @@ public class ArgParser {
 	@Parameter(names = {"-f", "--filters"}, description = "Filters to be used")
 	private List<String> filters = new ArrayList<String>();
 
+	@Parameter(names = {"--server"}, description = "Keep running and answer one JSON request per stdin line")
+	private boolean server = false;
+
+	@Parameter(names = {"-i", "--input"}, description = "File with one resource per line (- for stdin), "
+			+ "answered with one JSON record per line")
+	private String input;
+
 	/** returns the language used by the resource
 	 * 
 	 * @return A String "lang"
@@ -65,4 +74,20 @@ public class ArgParser {
 		return filters;
 	}
 
+	/** returns whether the wrapper should run in server mode
+	 * 
+	 * @return A boolean "server"
+	 */
+	public boolean isServer() {
+		return server;
+	}
+
+	/** returns the file listing the resources to be processed in batch mode, if any
+	 * 
+	 * @return A String "input"
+	 */
+	public String getInput() {
+		return input;
+	}
+
 }
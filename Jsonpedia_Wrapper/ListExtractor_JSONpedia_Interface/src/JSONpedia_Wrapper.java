@@ -1,4 +1,12 @@
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
 import java.io.FileNotFoundException;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.util.ArrayList;
 import java.util.List;
 
 import com.beust.jcommander.*;
@@ -7,9 +15,11 @@ import com.machinelinking.main.JSONpedia;
 import com.machinelinking.main.JSONpediaException;
 import com.machinelinking.wikimedia.WikiPage;
 import org.codehaus.jackson.JsonNode;
+import org.codehaus.jackson.map.ObjectMapper;
+import org.codehaus.jackson.node.ObjectNode;
 
-/** The main wrapper class for JSONpedia written for GSoC 2017 List-Extractor project. 
- * 
+/** The main wrapper class for JSONpedia written for GSoC 2017 List-Extractor project.
+ *
  * @author Krishanu Konar
  * @version 1.0
  */
@@ -17,31 +27,65 @@ public class JSONpedia_Wrapper {
 
 	/** Main method to take the commandline parameters and make appropriate calls to Jsonpedia.
 	 * Prints the output on stdout.
-	 * 
+	 *
 	 * @param args commandline arguments.
 	 * @throws JSONpediaException
-	 * @throws FileNotFoundException
+	 * @throws IOException
 	 */
-	public static void main(String[] args) throws JSONpediaException, FileNotFoundException {
+	public static void main(String[] args) throws JSONpediaException, IOException {
 
 		//creating instance of the JCommander annotated Commandline parser class
 		ArgParser parser = new ArgParser();
 		new JCommander(parser, args);
 
+		//make a Jsonpedia instance, shared by every request handled by this process
+		JSONpedia jsonpedia = JSONpedia.instance();
+
+		if (parser.isServer()) {
+			serve(jsonpedia);
+			return;
+		}
+
 		//parsed parameters
 		String lang = parser.getLang();
 		String resource_name = parser.getResourceName();
+		if (lang != null && parser.getInput() != null) {
+			batch(jsonpedia, lang, parser.getInput(), parser.getProcs(), parser.getFilters());
+			return;
+		}
+		if (lang == null || resource_name == null) {
+			System.err.println("Both -l/--lang and -r/--resource (or -i/--input) are required outside of --server mode.");
+			System.exit(1);
+		}
+
+		JsonNode node = processFollowingRedirects(jsonpedia, lang, resource_name, parser.getProcs(),
+				parser.getFilters());
+		System.out.println(node);
+	}
+
+	/** Queries Jsonpedia for a single resource with the given processors and filters.
+	 *
+	 * @param jsonpedia the Jsonpedia instance to be used.
+	 * @param lang language (wikipedia edition) of the resource.
+	 * @param resource_name the resource to query.
+	 * @param procs the Jsonpedia processors to be used.
+	 * @param fltr the filters to be used.
+	 * @return the JSON representation of the resource.
+	 * @throws JSONpediaException
+	 * @throws FileNotFoundException
+	 */
+	static JsonNode process(JSONpedia jsonpedia, String lang, String resource_name, List<String> procs,
+			List<String> fltr) throws JSONpediaException, FileNotFoundException {
+
 		String resource = lang + ":" + resource_name;
 		String processors = "" , filters = "";
-		List<String> procs = parser.getProcs();
-		List<String> fltr = parser.getFilters();
-		
+
 		//creating final flags to be passed to Jsonpedia
 		for(String s: procs){
 			processors += s + ",";
 		}
 		processors = processors.substring(0, processors.length()-1);
-		
+
 		//creating final filters to be passed to Jsonpedia
 		if(!(fltr.isEmpty())){
 			for(String s: fltr){
@@ -49,14 +93,142 @@ public class JSONpedia_Wrapper {
 			}
 			filters = filters.substring(0,filters.length()-1);
 		}
-		
-		//make a Jsonpedia instance and query with given parameters
-		JSONpedia jsonpedia = JSONpedia.instance();
-		JsonNode node = jsonpedia.process(resource).flags(processors).
-				filter(filters).json();
 
-		System.out.println(node);
+		return jsonpedia.process(resource).flags(processors).filter(filters).json();
+	}
+
+	/** Queries Jsonpedia like {@link #process}, but if the filtered result is empty because the resource is a
+	 * redirect, resolves it and returns the result of the target page instead, in the same answer. The target
+	 * is reported in a <code>"redirect"</code> field, so that the caller never needs a second call.
+	 *
+	 * @param jsonpedia the Jsonpedia instance to be used.
+	 * @param lang language (wikipedia edition) of the resource.
+	 * @param resource_name the resource to query.
+	 * @param procs the Jsonpedia processors to be used.
+	 * @param fltr the filters to be used.
+	 * @return the JSON representation of the resource, or of the page it redirects to.
+	 * @throws JSONpediaException
+	 * @throws FileNotFoundException
+	 */
+	static JsonNode processFollowingRedirects(JSONpedia jsonpedia, String lang, String resource_name,
+			List<String> procs, List<String> fltr) throws JSONpediaException, FileNotFoundException {
+
+		JsonNode node = process(jsonpedia, lang, resource_name, procs, fltr);
+		if (fltr.isEmpty() || !node.isObject() || node.path("result").size() > 0)
+			return node;
+
+		//empty result: look for a redirect in the unfiltered page structure
+		JsonNode full = process(jsonpedia, lang, resource_name, procs, new ArrayList<String>());
+		String target = full.path("wikitext-dom").path(0).path("structure").path(1).path("label").getTextValue();
+		if (target == null)
+			return node;
+		target = target.replace(" ", "_");
+
+		JsonNode redirected = process(jsonpedia, lang, target, procs, fltr);
+		if (redirected.isObject()) {
+			((ObjectNode) redirected).put("redirect", target);
+			return redirected;
+		}
+		return node;
 	}
 
+	/** Server loop: reads one JSON request per line from stdin and writes one JSON response per line
+	 * on stdout, until stdin is closed. A request looks like
+	 * <code>{"id": "12", "lang": "en", "resource": "William_Gibson", "procs": ["Structure"], "filters": ["section"]}</code>,
+	 * and its response is prefixed by the id of the request and a tab, e.g. <code>12\t{...}</code>.
+	 * Failures are reported in the same form used by Jsonpedia, <code>{"success": "false", "message": ...}</code>,
+	 * so that a single bad page never stops the server.
+	 * Anything printed on System.out by the libraries goes to stderr instead, so that stdout only carries
+	 * the responses.
+	 *
+	 * @param jsonpedia the Jsonpedia instance to be used.
+	 * @throws IOException
+	 */
+	static void serve(JSONpedia jsonpedia) throws IOException {
+		BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+		PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+		System.setOut(System.err);
+		ObjectMapper mapper = new ObjectMapper();
+
+		String line;
+		while ((line = in.readLine()) != null) {
+			if (line.trim().isEmpty())
+				continue;
+
+			String id = "";
+			JsonNode response;
+			try {
+				JsonNode request = mapper.readTree(line);
+				if (request.path("id").isTextual())
+					id = request.path("id").getTextValue();
+				List<String> procs = new ArrayList<String>();
+				for (JsonNode p : request.path("procs"))
+					procs.add(p.getTextValue());
+				if (procs.isEmpty())
+					procs.add("Structure");
+				List<String> filters = new ArrayList<String>();
+				for (JsonNode f : request.path("filters"))
+					filters.add(f.getTextValue());
+
+				response = processFollowingRedirects(jsonpedia, request.path("lang").getTextValue(),
+						request.path("resource").getTextValue(), procs, filters);
+			} catch (Exception e) {
+				ObjectNode error = mapper.createObjectNode();
+				error.put("success", "false");
+				error.put("message", String.valueOf(e.getMessage()));
+				response = error;
+			}
+			out.print(id + "\t");
+			out.println(response);
+			out.flush();
+		}
+	}
+
+	/** Batch mode: processes every resource listed in the input (one per line) and streams one NDJSON record
+	 * per resource on stdout, as soon as it is ready. Each record is tagged with the language and the resource,
+	 * e.g. <code>{"lang": "en", "resource": "William_Gibson", "success": "true", "output": {...}}</code>, while
+	 * failed pages produce <code>{"lang": ..., "resource": ..., "success": "false", "message": ...}</code>
+	 * and do not stop the batch. As in {@link #serve}, System.out is redirected to stderr.
+	 *
+	 * @param jsonpedia the Jsonpedia instance to be used.
+	 * @param lang language (wikipedia edition) of the resources.
+	 * @param input path of the file listing the resources, or "-" to read them from stdin.
+	 * @param procs the Jsonpedia processors to be used.
+	 * @param filters the filters to be used.
+	 * @throws IOException
+	 */
+	static void batch(JSONpedia jsonpedia, String lang, String input, List<String> procs, List<String> filters)
+			throws IOException {
+		BufferedReader in;
+		if (input.equals("-"))
+			in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+		else
+			in = new BufferedReader(new InputStreamReader(new FileInputStream(input), "UTF-8"));
+		PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+		System.setOut(System.err);
+		ObjectMapper mapper = new ObjectMapper();
+
+		String resource_name;
+		while ((resource_name = in.readLine()) != null) {
+			resource_name = resource_name.trim();
+			if (resource_name.isEmpty())
+				continue;
+
+			ObjectNode record = mapper.createObjectNode();
+			record.put("lang", lang);
+			record.put("resource", resource_name);
+			try {
+				JsonNode node = processFollowingRedirects(jsonpedia, lang, resource_name, procs, filters);
+				record.put("success", "true");
+				record.put("output", node);
+			} catch (Exception e) {
+				record.put("success", "false");
+				record.put("message", String.valueOf(e.getMessage()));
+			}
+			out.println(record);
+			out.flush();
+		}
+		in.close();
+	}
 
-}
\ No newline at end of file
+}
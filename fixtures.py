@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+'''
+##########
+ Fixtures
+##########
+
+* This module records the answers of every external service used by the list-extractor (JSONpedia, the
+  DBpedia SPARQL endpoint and the Wikidata API) in a fixture store, and replays them later, so that a whole
+  run can be reproduced offline and timed deterministically.
+
+* The functions calling those services are wrapped with ``recorded()`` (or ``recorded_stream()`` for
+  generators). The wrappers do nothing until ``start()`` is called:
+
+    * in ``record`` mode, every call is made as usual and its answer is stored, keyed by the service and the
+      call arguments, together with the time it took.
+    * in ``replay`` mode, no service is called: answers are read from the store, optionally after an
+      injected delay (a fixed one, or the one recorded with the answer). Calls missing from the store raise
+      ``FixtureMissing``.
+
+* The store is a SQLite file (``fixtures.db``) inside the directory given to ``start()``. It can be shared
+  by threads and by the processes forked by ``--workers``.
+
+'''
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+MODES = ['record', 'replay']
+
+mode = None  # None (fixtures not used), 'record' or 'replay'
+latency = None  # delay injected in replay mode, in seconds; 'recorded' to reproduce the recorded one
+store = None
+
+
+class FixtureMissing(KeyError):
+    ''' Raised in ``replay`` mode when a call has not been recorded. '''
+    pass
+
+
+class FixtureStore(object):
+    ''' SQLite store of recorded answers. '''
+
+    def __init__(self, path):
+        '''
+        :param path: path of the SQLite file.
+        '''
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def connect(self):
+        ''' Returns the connection of the current process, opening it if needed (a connection must not be
+        used across a fork). Must be called holding the lock.
+
+        :return: a SQLite connection.
+        '''
+        if self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.text_factory = str
+            self.conn.execute("CREATE TABLE IF NOT EXISTS answers (kind TEXT, key TEXT, duration REAL, data BLOB, "
+                              "PRIMARY KEY (kind, key))")
+            self.conn.commit()
+            self.pid = os.getpid()
+        return self.conn
+
+    def get(self, kind, key):
+        ''' Reads a recorded answer.
+
+        :param kind: service name, e.g. ``sparql``.
+        :param key: call arguments, as returned by ``make_key()``.
+
+        :return: a tuple ``(answer, duration)``.
+        :raise FixtureMissing: if the call has not been recorded.
+        '''
+        with self.lock:
+            row = self.connect().execute("SELECT data, duration FROM answers WHERE kind = ? AND key = ?",
+                                         (kind, key)).fetchone()
+        if row is None:
+            raise FixtureMissing(kind + ' ' + key)
+        return json.loads(zlib.decompress(row[0])), row[1]
+
+    def put(self, kind, key, answer, duration):
+        ''' Stores an answer, replacing any previous recording of the same call.
+
+        :param kind: service name, e.g. ``sparql``.
+        :param key: call arguments, as returned by ``make_key()``.
+        :param answer: answer of the call; must be JSON serializable.
+        :param duration: time taken by the call, in seconds.
+
+        :return: void.
+        '''
+        data = zlib.compress(json.dumps(answer, separators=(',', ':')))
+        with self.lock:
+            conn = self.connect()
+            conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?)",
+                         (kind, key, duration, sqlite3.Binary(data)))
+            conn.commit()
+
+    def iter_answers(self, kind):
+        ''' Yields every recorded answer of a service, e.g. to benchmark the parser on the recorded pages.
+
+        :param kind: service name, e.g. ``jsonpedia``.
+
+        :return: yields ``(args, answer)`` tuples, where ``args`` is the list of positional arguments of the call.
+        '''
+        with self.lock:
+            rows = self.connect().execute("SELECT key, data FROM answers WHERE kind = ? ORDER BY key",
+                                          (kind,)).fetchall()
+        for key, data in rows:
+            yield json.loads(key)[0], json.loads(zlib.decompress(data))
+
+
+def start(fixture_mode, directory, replay_latency=None):
+    ''' Starts recording or replaying the answers of the external services.
+
+    :param fixture_mode: ``record`` or ``replay``.
+    :param directory: directory holding the fixture store; created if needed.
+    :param replay_latency: delay injected before every replayed answer, in seconds, or ``'recorded'`` to
+                           wait as long as the recorded call took.
+
+    :return: void.
+    '''
+    global mode, latency, store
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    store = FixtureStore(os.path.join(directory, 'fixtures.db'))
+    mode = fixture_mode
+    latency = replay_latency
+
+
+def make_key(args, kwargs):
+    ''' Builds the key of a call from its arguments.
+
+    :param args: positional arguments.
+    :param kwargs: keyword arguments.
+
+    :return: a JSON string.
+    '''
+    return json.dumps([args, kwargs], sort_keys=True)
+
+
+def replay(kind, key):
+    ''' Returns a recorded answer, waiting the injected latency first.
+
+    :param kind: service name.
+    :param key: call key.
+
+    :return: the recorded answer.
+    '''
+    answer, duration = store.get(kind, key)
+    delay = duration if latency == 'recorded' else latency
+    if delay:
+        time.sleep(delay)
+    return answer
+
+
+def recorded(kind):
+    ''' Decorator for a function calling an external service, whose answers must be recorded or replayed.
+
+    :param kind: service name, used to tell apart the answers of different services.
+
+    :return: the decorator.
+    '''
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            if mode is None:
+                return function(*args, **kwargs)
+            key = make_key(args, kwargs)
+            if mode == 'replay':
+                return replay(kind, key)
+            started = time.time()
+            answer = function(*args, **kwargs)
+            store.put(kind, key, answer, time.time() - started)
+            return answer
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
+
+
+def recorded_stream(kind):
+    ''' Like ``recorded()``, for generators: the items are recorded as a list once the generator is exhausted.
+
+    :param kind: service name, used to tell apart the answers of different services.
+
+    :return: the decorator.
+    '''
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            if mode is None:
+                for item in function(*args, **kwargs):
+                    yield item
+                return
+            key = make_key(args, kwargs)
+            if mode == 'replay':
+                for item in replay(kind, key):
+                    yield item
+                return
+            started = time.time()
+            items = []
+            for item in function(*args, **kwargs):
+                items.append(item)
+                yield item
+            store.put(kind, key, items, time.time() - started)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
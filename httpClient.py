@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+'''
+############
+ HttpClient
+############
+
+* This module provides the HTTP client shared by every call to the online services (the DBpedia SPARQL
+  endpoint, the Wikidata and MediaWiki APIs, DBpedia Lookup). ``urllib.urlopen()`` opens a new TCP (and TLS)
+  connection for every request, while a class run makes hundreds of thousands of them to a few hosts: here
+  connections are kept alive and reused, from a pool of idle connections for every host.
+
+* Responses are asked gzip-compressed and decoded transparently, redirects are followed, and every request
+  carries the same few headers (``DEFAULT_HEADERS``). The timeout of a request can be set with
+  ``--http-timeout``.
+
+* A pooled connection closed by the server while it was idle is detected on the next request, which is sent
+  again, once, on a new connection; only the errors of a stale connection (``STALE_ERRORS``, or no status line)
+  raised before any answer is read are retried. A timeout or an error while reading the answer fails the
+  request at once, as does a gzip answer that cannot be decoded.
+
+* The client can be shared by threads; a process forked by ``--workers`` starts with empty pools, since
+  connections must not be shared across a fork. The number of requests made and connections opened is
+  reported at the end of the run.
+
+'''
+
+import errno
+import httplib
+import os
+import socket
+import threading
+import urlparse
+import zlib
+
+TIMEOUT = 30.0  # seconds to wait for a connection or an answer
+POOL_SIZE = 8  # idle connections kept for every host
+MAX_REDIRECTS = 5
+STALE_ERRORS = (errno.ECONNRESET, errno.EPIPE)  # socket errors of a connection closed by the server
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'list-extractor (https://github.com/dbpedia/list-extractor)',
+    'Accept-Encoding': 'gzip',
+    'Connection': 'keep-alive',
+}
+
+client = None  # HttpClient used by utilities.json_req() and the mapper, see get_client()
+
+
+class HTTPError(IOError):
+    ''' Raised when a request fails, either because of the connection or because of the status of the
+    answer (``code``, ``None`` for connection errors). '''
+
+    def __init__(self, message, code=None):
+        IOError.__init__(self, message)
+        self.code = code
+
+
+class HttpClient(object):
+    ''' HTTP client keeping a pool of keep-alive connections for every host. '''
+
+    def __init__(self, timeout=TIMEOUT, pool_size=POOL_SIZE):
+        '''
+        :param timeout: seconds to wait for a connection or an answer.
+        :param pool_size: maximum number of idle connections kept for every host.
+        '''
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.lock = threading.Lock()
+        self.pools = dict()  # (scheme, host) -> idle connections
+        self.pid = os.getpid()
+        self.requests = 0
+        self.connections = 0
+
+    def check_process(self):
+        ''' Empties the pools and the counters in a process forked after they were filled, since connections
+        must not be shared with the parent process. Must be called holding the lock.
+
+        :return: void.
+        '''
+        if self.pid != os.getpid():
+            self.pools = dict()
+            self.pid = os.getpid()
+            self.requests = 0
+            self.connections = 0
+
+    def acquire(self, scheme, host, fresh=False):
+        ''' Takes an idle connection to a host from its pool, or opens a new one.
+
+        :param scheme: ``http`` or ``https``.
+        :param host: host name, with the port if any.
+        :param fresh: if ``True``, always open a new connection.
+
+        :return: a tuple ``(connection, reused)``.
+        '''
+        with self.lock:
+            self.check_process()
+            idle = self.pools.get((scheme, host))
+            if idle and not fresh:
+                return idle.pop(), True
+            self.connections += 1
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, timeout=self.timeout), False
+        return httplib.HTTPConnection(host, timeout=self.timeout), False
+
+    def release(self, scheme, host, conn):
+        ''' Puts a connection whose answer has been read back in the pool of its host, or closes it if the
+        pool is full.
+
+        :return: void.
+        '''
+        with self.lock:
+            idle = self.pools.setdefault((scheme, host), [])
+            if len(idle) < self.pool_size and self.pid == os.getpid():
+                idle.append(conn)
+                return
+        conn.close()
+
+    def get(self, url, headers=None, timeout=None):
+        ''' Makes a GET request, following redirects.
+
+        :param url: URL of the request.
+        :param headers: headers added to ``DEFAULT_HEADERS`` (e.g. ``Accept``).
+        :param timeout: seconds to wait for a connection or an answer, instead of the timeout of the client.
+
+        :return: body of the answer, decompressed.
+        :raise HTTPError: if the request fails or the answer has an error status.
+        '''
+        req_headers = dict(DEFAULT_HEADERS)
+        if headers:
+            req_headers.update(headers)
+        for redirect in range(MAX_REDIRECTS + 1):
+            status, location, body = self.request(url, req_headers, timeout)
+            if status in (301, 302, 303, 307, 308) and location:
+                url = urlparse.urljoin(url, location)
+                continue
+            if status >= 400:
+                raise HTTPError('HTTP ' + str(status) + ' on request ' + url, status)
+            return body
+        raise HTTPError('too many redirects on request ' + url)
+
+    def request(self, url, headers, timeout=None):
+        ''' Sends a single request on a pooled connection, and reads the whole answer so that the connection
+        can be reused.
+
+        :param url: URL of the request.
+        :param headers: request headers.
+        :param timeout: seconds to wait for a connection or an answer, instead of the timeout of the client.
+
+        :return: a tuple ``(status, location, body)``.
+        :raise HTTPError: if the connection fails.
+        '''
+        parts = urlparse.urlsplit(url)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        with self.lock:
+            self.check_process()
+            self.requests += 1
+        retried = False
+        while True:
+            conn, reused = self.acquire(parts.scheme, parts.netloc, fresh=retried)
+            conn.timeout = timeout or self.timeout
+            if conn.sock is not None:  # pooled connection, opened with another timeout
+                conn.sock.settimeout(conn.timeout)
+            try:
+                conn.request('GET', path, headers=headers)
+                resp = conn.getresponse()
+            except (httplib.HTTPException, socket.error) as error:
+                conn.close()
+                if reused and not retried and is_stale(error):  # closed by the server while it was idle
+                    retried = True
+                    continue
+                raise HTTPError(describe(error) + ' on request ' + url)
+            break
+        try:
+            body = resp.read()
+        except (httplib.HTTPException, socket.error) as error:  # part of the answer may be lost: never retried
+            conn.close()
+            raise HTTPError(describe(error) + ' on request ' + url)
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self.release(parts.scheme, parts.netloc, conn)
+        if (resp.getheader('content-encoding') or '').lower() == 'gzip':
+            try:
+                body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            except zlib.error as error:
+                raise HTTPError('invalid gzip answer (' + str(error) + ') on request ' + url)
+        return resp.status, resp.getheader('location'), body
+
+    def stats(self):
+        ''' Returns the requests made and connections opened by the current process.
+
+        :return: a tuple ``(requests, connections)``.
+        '''
+        with self.lock:
+            if self.pid != os.getpid():  # nothing asked yet by this forked process
+                return 0, 0
+            return self.requests, self.connections
+
+    def report(self):
+        ''' Prints the number of requests made and connections opened during the current run.
+
+        :return: void.
+        '''
+        reused = 100.0 * (self.requests - self.connections) / self.requests if self.requests else 0.0
+        print "HTTP requests:", self.requests, "over", self.connections, "connections (" + \
+            str(round(reused, 1)) + "% reused)"
+
+
+def is_stale(error):
+    ''' Tells whether an error raised while sending a request on a pooled connection means that the server
+    closed the connection while it was idle, so that the request can be sent again on a new one.
+
+    :param error: exception raised by ``httplib``.
+
+    :return: ``True`` for a missing status line or a reset connection, ``False`` for a timeout or other errors.
+    '''
+    if isinstance(error, httplib.BadStatusLine):
+        return True
+    return isinstance(error, socket.error) and not isinstance(error, socket.timeout) and \
+        error.errno in STALE_ERRORS
+
+
+def describe(error):
+    ''' Returns the message of an error, or its class name if it has none. '''
+    return str(error) or error.__class__.__name__
+
+
+def get_client():
+    ''' Returns the shared client, creating it with the default settings if needed.
+
+    :return: the ``HttpClient``.
+    '''
+    global client
+    if client is None:
+        client = HttpClient()
+    return client
+
+
+def configure(timeout=TIMEOUT, pool_size=POOL_SIZE):
+    ''' Replaces the shared client with one using the given settings.
+
+    :param timeout: seconds to wait for a connection or an answer.
+    :param pool_size: maximum number of idle connections kept for every host.
+
+    :return: the new ``HttpClient``.
+    '''
+    global client
+    client = HttpClient(timeout, pool_size)
+    return client
+
+
+def get(url, headers=None, timeout=None):
+    ''' Makes a GET request with the shared client, see ``HttpClient.get()``. '''
+    return get_client().get(url, headers, timeout)
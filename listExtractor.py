@@ -25,6 +25,18 @@ import rdflib
 import wikiParser
 import utilities
 import mapper
+import pageCache
+import wikiDump
+import redirectMap
+import sameAsIndex
+import pipeline
+import fixtures
+import runState
+import sectionMemo
+import sparqlCache
+import time
+import itertools
+import httpClient
 
 
 def main():
@@ -45,6 +57,59 @@ def main():
 
     * **-c --classname**: a string representing classnames you want to associate your resource with. Applicable only for ``collect_mode="s"``. 
 
+    * **--fetch**: ``server``, ``spawn`` or ``batch``. How the JSONpedia wrapper is run for ``collect_mode="a"``: \
+      a single long-lived wrapper process (default), a new process for every resource, or a new process for \
+      every ``--batch-size`` resources, streaming one record per page.
+
+    * **--parser**: ``jsonpedia`` or ``native``. With ``native``, pages are fetched as wikitext from the \
+      MediaWiki API and converted by ``wikitextParser``, instead of being parsed by the Java JSONpedia library.
+
+    * **--cache**: ``use``, ``offline``, ``refresh`` or ``bypass``. How the on-disk cache of JSONpedia results \
+      is used (see ``pageCache``). ``--cache-size`` (MB) and ``--cache-ttl`` (days) bound its size and age.
+
+    * **--sparql-cache**: ``use``, ``refresh`` or ``bypass``. How the on-disk cache of SPARQL answers is used \
+      (see ``sparqlCache``); ``--sparql-cache-size`` (MB) bounds its size.
+
+    * **--dump**: path of a local ``pages-articles-multistream.xml.bz2`` dump to read pages from, instead of \
+      JSONpedia (see ``wikiDump``). ``--dump-index`` gives its index file, and ``--dump-scan`` makes \
+      ``collect_mode="a"`` scan the whole dump sequentially instead of seeking each page (in a single process, \
+      so it cannot be combined with ``--workers``).
+
+    * **--fetch-workers**, **--map-workers**, **--chunk-size**: number of concurrent fetch and mapping threads of \
+      ``collect_mode="a"``, whose stages are connected by queues holding at most ``--queue-size`` resources \
+      (see ``pipeline``). Sections with more than ``--chunk-size`` list elements are split in chunks, mapped \
+      as independent jobs and merged back for every resource.
+
+    * **--workers**: number of processes sharing the resources of ``collect_mode="a"``, each one building \
+      a partial graph with its own pipeline; partial graphs and counters are merged at the end.
+
+    * **--retries**, **--retry-backoff**, **--page-deadline**: retry policy for failing JSONpedia calls: \
+      maximum attempts for a page, delay before the first retry (doubled, with jitter, at every attempt) and \
+      time after which a page is given up on. Pages given up on are listed in ``--failed-file``.
+
+    * **--http-timeout**: timeout of the requests to SPARQL, Wikidata and the MediaWiki API, made on pooled \
+      keep-alive connections (see ``httpClient``).
+
+    * **--record**, **--replay**: record the answers of JSONpedia, the SPARQL endpoint and the Wikidata API \
+      in a fixture store, or replay them without calling any service, optionally adding ``--replay-latency`` \
+      to every answer (see ``fixtures``).
+
+    * **--no-section-filter**: parse every section of the pages in ``collect_mode="a"``; by default only the \
+      sections whose title matches a header keyword of the class (and is not excluded) are parsed.
+
+    * **--delta**: in ``collect_mode="a"``, only extract the pages edited since the previous delta run of the \
+      class, reusing the triples stored for the other ones (see ``runState``). The triples added and removed \
+      are written next to the ``.ttl`` file.
+
+    * **--section-memo**: how the memo of the triples produced for every section is used (``use``, ``refresh`` \
+      or ``bypass``); unchanged sections reuse their triples instead of being mapped again (see ``sectionMemo``).
+
+    * **--redirects**: a redirect map built with ``redirectMap.py``, used to resolve redirected resources \
+      before fetching them. Defaults to ``redirects/<language>.tsv.gz``, if present.
+
+    * **--sameas-index**: a Wikidata to DBpedia sameAs index built with ``sameAsIndex.py``, used by the mapper \
+      instead of the SPARQL endpoint. Defaults to ``sameas/<language>.db``, if present.
+
     """
     
     # initialize argparse parameters
@@ -65,9 +130,136 @@ def main():
                             "\nen: English (Default)\nit: Italian\nde: German\nes: Spanish\n")
     parser.add_argument("-c", "--classname", type=str, help="Provide a classname from settings.json and use its"
                             "\nmapper functions")
+    parser.add_argument("--fetch", type=str, choices=['server', 'spawn', 'batch'], default='server',
+                        help="How the JSONpedia wrapper is run for collect_mode 'a':"
+                            "\nserver: one long-lived wrapper process (Default)"
+                            "\nspawn: a new wrapper process for every resource"
+                            "\nbatch: one wrapper process for every --batch-size resources\n")
+    parser.add_argument("--parser", type=str, choices=wikiParser.PARSERS, default='jsonpedia',
+                        help="How pages are parsed into sections:"
+                            "\njsonpedia: with the JSONpedia library (Default)"
+                            "\nnative: from their wikitext, obtained from the MediaWiki API\n")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="Number of resources handled by a single wrapper process with --fetch batch\n")
+    parser.add_argument("--cache", type=str, choices=pageCache.CACHE_MODES, default='use',
+                        help="How the on-disk page cache is used:"
+                            "\nuse: read cached pages and store new ones (Default)"
+                            "\noffline: only use cached pages, never fetch"
+                            "\nrefresh: fetch every page again and update the cache"
+                            "\nbypass: don't use the cache\n")
+    parser.add_argument("--cache-size", type=int, default=pageCache.DEFAULT_SIZE,
+                        help="Maximum size of the page cache in MB; least recently used pages are evicted\n")
+    parser.add_argument("--cache-ttl", type=int, default=pageCache.DEFAULT_TTL,
+                        help="Days after which a cached page is fetched again\n")
+    parser.add_argument("--sparql-cache", type=str, choices=sparqlCache.CACHE_MODES, default='use',
+                        help="How the on-disk cache of SPARQL answers is used:"
+                            "\nuse: reuse cached answers and store new ones (Default)"
+                            "\nrefresh: ask every query again and update the cache"
+                            "\nbypass: don't use the cache\n")
+    parser.add_argument("--sparql-cache-size", type=int, default=sparqlCache.DEFAULT_SIZE,
+                        help="Maximum size of the SPARQL cache in MB; least recently used answers are evicted\n")
+    parser.add_argument("--section-memo", type=str, choices=sectionMemo.MEMO_MODES, default='use',
+                        help="How the memo of the triples mapped from every section is used:"
+                            "\nuse: reuse the triples of unchanged sections and store new ones (Default)"
+                            "\nrefresh: map every section again and update the memo"
+                            "\nbypass: don't use the memo\n")
+    parser.add_argument("--dump", type=str, help="Read pages from a local pages-articles-multistream.xml.bz2 dump"
+                            "\ninstead of JSONpedia\n")
+    parser.add_argument("--dump-index", type=str, help="Index of the --dump (default: the"
+                            "\nmultistream-index.txt.bz2 file next to it)\n")
+    parser.add_argument("--redirects", type=str, help="Redirect map built with redirectMap.py"
+                            "\n(default: redirects/<language>.tsv.gz, if present)\n")
+    parser.add_argument("--sameas-index", type=str, help="Wikidata to DBpedia sameAs index built with sameAsIndex.py"
+                            "\n(default: sameas/<language>.db, if present)\n")
+    parser.add_argument("--fetch-workers", type=int, default=1,
+                        help="Number of pages fetched concurrently in collect_mode 'a'\n")
+    parser.add_argument("--map-workers", type=int, default=1,
+                        help="Number of resources mapped concurrently in collect_mode 'a'"
+                            "\n(overlaps the Wikidata/SPARQL reconciliation calls)\n")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes sharing the resources of collect_mode 'a'"
+                            "\n(each one runs its own pipeline and JSONpedia wrappers)\n")
+    parser.add_argument("--queue-size", type=int, default=100,
+                        help="Maximum number of resources waiting between two stages of collect_mode 'a'\n")
+    parser.add_argument("--chunk-size", type=int, default=pipeline.CHUNK_SIZE,
+                        help="Sections with more list elements are split in chunks mapped"
+                            "\nindependently in collect_mode 'a' (0: never split)\n")
+    parser.add_argument("--retries", type=int, default=wikiParser.RETRY_ATTEMPTS,
+                        help="Maximum number of attempts for a page when JSONpedia fails\n")
+    parser.add_argument("--retry-backoff", type=float, default=wikiParser.RETRY_BACKOFF,
+                        help="Seconds waited before the first retry, doubled (with jitter) at every attempt\n")
+    parser.add_argument("--page-deadline", type=float, default=wikiParser.PAGE_DEADLINE,
+                        help="Seconds after which a failing page is given up on\n")
+    parser.add_argument("--http-timeout", type=float, default=httpClient.TIMEOUT,
+                        help="Seconds to wait for a connection or an answer of SPARQL, Wikidata"
+                            "\nand the MediaWiki API\n")
+    parser.add_argument("--failed-file", type=str, help="File listing the resources given up on (default:"
+                            "\nextracted/Failed_<source>_<language>_<date>.txt)\n")
+    parser.add_argument("--record", type=str, metavar="DIR", help="Record the answers of JSONpedia, SPARQL and Wikidata"
+                            "\nin a fixture store inside DIR\n")
+    parser.add_argument("--replay", type=str, metavar="DIR", help="Replay the answers recorded with --record in DIR,"
+                            "\nwithout calling any external service\n")
+    parser.add_argument("--replay-latency", type=str, default='0',
+                        help="Delay added to every replayed answer, in milliseconds,"
+                            "\nor 'recorded' to reproduce the recorded one\n")
+    parser.add_argument("--delta", action='store_true', help="In collect_mode 'a', only extract the pages edited since"
+                            "\nthe previous --delta run, and write the added/removed triples\n")
+    parser.add_argument("--no-section-filter", action='store_true', help="In collect_mode 'a', parse every section"
+                            "\ninstead of only the ones matching the header keywords of the class\n")
+    parser.add_argument("--dump-scan", action='store_true', help="With --dump and collect_mode 'a', scan the whole dump"
+                            "\nsequentially instead of seeking each page\n")
 
     args = parser.parse_args()
 
+    # record or replay the answers of the external services (see fixtures.py)
+    if args.record or args.replay:
+        if args.replay_latency == 'recorded':
+            latency = 'recorded'
+        else:
+            latency = float(args.replay_latency) / 1000
+        fixtures.start('replay' if args.replay else 'record', args.replay or args.record, latency)
+        if args.fetch == 'batch':  # batches are not recorded page by page
+            args.fetch = 'server'
+        if args.replay:  # no JSONpedia wrapper is needed
+            args.fetch = 'spawn'
+
+    # shared HTTP client, keeping connections alive across the requests to the same host (see httpClient.py)
+    httpClient.configure(args.http_timeout)
+
+    # open the on-disk cache of JSONpedia results, used by wikiParser
+    wikiParser.page_cache = pageCache.open_cache(args.cache, args.cache_size, args.cache_ttl)
+    # memo of the triples mapped from every section, used by mapper (entries expire with the cached pages)
+    sectionMemo.open_memo(args.section_memo, args.cache_ttl)
+    # cache of the answers of the SPARQL endpoint, used by utilities.sparql_query()
+    utilities.sparql_cache = sparqlCache.open_cache(args.sparql_cache, args.sparql_cache_size)
+    # load the local redirect map, so that redirected resources are resolved before fetching them
+    if args.redirects:
+        wikiParser.redirect_map = redirectMap.load_redirect_map(args.redirects)
+    else:
+        wikiParser.redirect_map = redirectMap.load_default_map(args.language)
+    # load the local sameAs index, so that the DBpedia equivalents of Wikidata URIs are found without the endpoint
+    if sameAsIndex.open_index(args.language, args.sameas_index) is None and args.sameas_index:
+        print 'sameAs index not found: ' + args.sameas_index + ', using the SPARQL endpoint'
+    # bounded retry policy for failing JSONpedia calls; pages given up on are listed in the failed file
+    wikiParser.RETRY_ATTEMPTS = args.retries
+    wikiParser.RETRY_BACKOFF = args.retry_backoff
+    wikiParser.PAGE_DEADLINE = args.page_deadline
+    if args.failed_file:
+        wikiParser.failed_resources = args.failed_file
+    else:
+        wikiParser.failed_resources = utilities.get_subdirectory('extracted', "Failed_" + args.source + "_" +
+                                                                 args.language + "_" + utilities.getDate() + ".txt")
+    # convert the wikitext of the pages natively instead of asking JSONpedia (see wikitextParser.py)
+    wikiParser.parser_backend = args.parser
+    if args.parser == 'native':  # no JSONpedia wrapper is needed
+        args.fetch = 'native'
+    if args.dump:  # read pages from a local Wikipedia dump, no JSONpedia needed
+        wikiParser.wiki_dump = wikiDump.MultistreamDump(args.dump, args.dump_index)
+        args.fetch = 'scan' if args.dump_scan else 'dump'
+        if args.dump_scan and args.workers > 1:  # every worker would read the whole dump for its own shard
+            print '--dump-scan reads the whole dump in a single process and cannot be used with --workers'
+            sys.exit(1)
+
     # initialize RDF graph which will contain the triples
     g = rdflib.Graph()
     g.bind("dbo", "http://dbpedia.org/ontology/")
@@ -104,50 +296,88 @@ def main():
         if utilities.check_existing_class(args.source) == True: #Check if the domain has already been mapped (in settings.json)
             try:
                 print 'Fetching resources, please wait......'
-                resources = utilities.get_resources(args.language, args.source)
-                res_num = len(resources)  # total number of resources
-                curr_num = 1  # current resource to be analyzed
+                # resources are enumerated page by page while the first ones are already being extracted
+                resources = utilities.iter_resources(args.language, args.source)
+                first = next(resources, None)  # asked now, so that a wrong class is reported at once
             except:
                 print("Could not find specified class of resources: " + args.source)
                 sys.exit(0)
+            if first is None:
+                print("Could not retrieve any resource! Check if the domain exists in the dbpedia ontology!")
+                sys.exit(0)
+            resources = itertools.chain([first], resources)
         else: 
             print '\nThis domain has not been mapped yet!'
             print 'You can add a mapping for this domain using rulesGenerator.py and try again...'
             sys.exit(0)
         
-        tot_extracted_elems = 0  # Used to keep track of the number of list elements extracted
-        tot_elems = 0 # Used to keep track of total number of list elements
-        total_res_failed = 0
-        print 'Completed! Found', str(res_num), 'resources.\nStarting extraction....\n' 
-        for res in resources:
+        res_num = None  # total number of resources, known once they have all been enumerated
+        if args.delta or args.workers > 1:  # the whole class is needed to plan the run or to split it
+            resources = list(resources)
+            res_num = len(resources)
+            print 'Completed! Found', str(res_num), 'resources.\nStarting extraction....\n'
+        else:
+            print 'Starting extraction....\n'
+        if not args.no_section_filter:  # don't parse the sections the mapper would ignore
+            wikiParser.section_filter = wikiParser.build_section_filter(args.language, args.source,
+                                                                        utilities.load_settings(),
+                                                                        utilities.load_custom_mappers())
+        extract_resources = resources
+        if args.delta:  # only extract the pages edited since the last delta run (see runState.py)
+            state = runState.open_state()
+            print 'Fetching current revisions, please wait......'
+            wikiParser.page_revisions = runState.current_revisions(args.language, resources)
+            changed, removed = state.plan(args.language, args.source, resources, wikiParser.page_revisions)
+            previous = dict(state.triples(args.language, args.source, changed + removed))
+            print str(len(changed)), 'of', str(res_num), 'pages changed since the last run,', str(len(removed)), \
+                'resources removed from the class\n'
+            started = time.time()
+            extract_resources = changed
+
+        if args.workers > 1:  # split the resources across worker processes, each with its own pipeline
+            total_res_failed, tot_extracted_elems, tot_elems = pipeline.run_workers(args, extract_resources, g)
+        else:
+            if args.fetch == 'server':
+                # keep JSONpedia wrappers warm for the whole run, one for each fetch worker
+                wikiParser.start_jsonpedia_server(args.fetch_workers)
             try:
-                print(res + " (" + str(curr_num) + " of " + str(res_num) + ")")
-                resDict = wikiParser.main_parser(args.language, res)  # create a dict representing each resource
-                tot_elems += utilities.count_listelem_dict(resDict)
-                
-                '''Decomment the line below to create a file inside a resources folder containing the dictionary'''
-                # utilities.createResFile(resDict, args.language, res)
-            
-            except:  #handle parsing errors; no dict found or no relevant sections found
-                print("Could not parse " + args.language + ":" + res)
-                total_res_failed +=1
-                curr_num+=1
-            
-            else:  #succesfully parsed; proceed and form triples
-                curr_num += 1
-                print(">>> " + args.language + ":" + res + " has been successfully parsed <<<")
-                extr_elems = mapper.select_mapping(resDict, res, args.language, args.source, g)
-                mapper.mapped_domains = []  # reset domains already mapped for next resource
-                tot_extracted_elems += extr_elems
-                print(">>> Mapped " + args.language + ":" + res + ", extracted elements: " + str(extr_elems) + "  <<<\n")
-        
+                # fetch, parse, map and write resources in concurrent stages (see pipeline.py)
+                extraction = pipeline.Pipeline(args.language, args.source, args.fetch, args.batch_size,
+                                               args.fetch_workers, args.map_workers, args.queue_size,
+                                               args.chunk_size)
+                total_res_failed, tot_extracted_elems, tot_elems = extraction.run(extract_resources, g)
+            finally:
+                wikiParser.stop_jsonpedia_server()
+            if res_num is None:
+                res_num = extraction.res_num
+
+        if wikiParser.page_cache is not None:
+            wikiParser.page_cache.report()
+        if wikiParser.section_filter is not None:
+            wikiParser.section_filter.report()
+
+        if args.delta:  # complete the dataset with the unchanged pages, and write what changed
+            added, deleted = runState.finish_delta(args.language, args.source, resources, changed, removed, previous,
+                                                   started, g)
+            diff_name = "ListExtractor_" + args.source + "_" + args.language + "_" + utilities.getDate()
+            runState.write_lines(utilities.get_subdirectory('extracted', diff_name + "_added.nt"), added)
+            runState.write_lines(utilities.get_subdirectory('extracted', diff_name + "_removed.nt"), deleted)
+            print 'Delta:', str(len(added)), 'triples added,', str(len(deleted)), 'triples removed'
+            res_num = len(extract_resources)  # the evaluation covers the pages extracted by this run
+
         # evaluation metrics for the extraction process; store relevant stats in evaluation.csv
+        memo_stats = sectionMemo.memo.stats() if sectionMemo.memo is not None else None
         utilities.evaluate(args.language, args.source, res_num, res_num - total_res_failed,
-                             tot_extracted_elems, tot_elems, len(g))
+                             tot_extracted_elems, tot_elems, len(g), memo_stats)
+
+    httpClient.get_client().report()
+    if utilities.sparql_cache is not None:
+        utilities.sparql_cache.report()
 
-    # If the graph contains at least one statement, create a .ttl file with the RDF triples created
+    # If the graph contains at least one statement, create a .ttl file with the RDF triples created; a --delta
+    # run always writes the whole dataset, next to the _added/_removed files
     g_length = len(g)
-    if g_length > 0:
+    if g_length > 0 or args.delta:
         file_name = "ListExtractor_" + args.source + "_" + args.language + "_" + utilities.getDate() + ".ttl"
         file_path = utilities.get_subdirectory('extracted', file_name)
         g.serialize(file_path, format="turtle")
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+'''
+###########
+ ListItem
+###########
+
+* This module contains the representation of a single list element produced by ``wikiParser``.
+
+* A ``ListItem`` is the same flattened text used so far (references marked with ``{{...}}``), so it can be
+  handled as any other string, but it also carries the **typed spans** found while parsing it:
+
+    * ``reference``: an internal link; the value is its label.
+    * ``link``: an external link; the value is its URL.
+    * ``italic``: a ``''...''`` range; the value is the matched text.
+    * ``quote``: a ``"..."`` range; the value is the matched text.
+
+  Spans are tuples ``(kind, start, end, value)``, with offsets in the text of the item. The extractors of
+  ``mapper`` (``italic_mapper()``, ``reference_mapper()``, ``quote_mapper()``) read them directly instead
+  of scanning every element again with regular expressions.
+
+* Nested list elements are kept in the resource dictionary as before, and are also linked to the element
+  they belong to (``children``).
+
+* Oversized sections can be split in ``SectionChunk`` parts, mapped independently by ``pipeline``.
+
+'''
+
+import re
+
+APOSTROPHES = re.compile(ur"'+")
+
+
+class ListItem(unicode):
+    ''' Text of a list element, together with the spans found in it. '''
+
+    __slots__ = ('spans', 'children')
+
+    def __new__(cls, text, spans=None):
+        '''
+        :param text: flattened text of the element.
+        :param spans: tuple of ``(kind, start, end, value)`` spans, or ``None`` if they are not known (the
+                      extractors will then scan the text as for any other string).
+        '''
+        item = unicode.__new__(cls, text)
+        item.spans = spans
+        item.children = ()
+        return item
+
+
+class EncodedItem(str):
+    ''' utf-8 encoded version of a ``ListItem``, as handled by the mapper functions. The spans are the same
+    of the ``ListItem``: offsets refer to the unicode text, values are unicode.
+    '''
+
+    def __new__(cls, text, spans=None):
+        item = str.__new__(cls, text)
+        item.spans = spans
+        return item
+
+
+class ItemBuilder(object):
+    ''' Builds a ``ListItem`` piece by piece, keeping track of the offsets of the spans.
+
+    Italic and quoted ranges are found while the pieces are appended, as the regular expressions
+    ``\'{2,}(.*?)\'{2,}`` and ``"(.*?)"`` would find them in the whole text: a run of two or more apostrophes
+    opens an italic range, closed by the next such run on the same line (a run of four or more apostrophes
+    left open is a range on its own), and a double quote opens a quoted range, closed by the next one on
+    the same line.
+    '''
+
+    # state of the search for italic and quoted ranges, set on the instance once a delimiter is found
+    italics = ()  # (start, end) of the italic ranges
+    quotes = ()  # (start, end) of the quoted ranges
+    run_start = 0  # start of the last run of apostrophes, which may go on in the next piece
+    run_length = 0
+    italic_open = None  # (start, length) of the run of apostrophes opening an italic range
+    quote_open = None  # start of the double quote opening a quoted range
+
+    def __init__(self):
+        self.pieces = []
+        self.spans = []
+        self.length = 0
+        self.exact = True  # False when the text could be confused with the reference markers
+
+    def add(self, text):
+        ''' Appends plain text.
+
+        :param text: text to be appended.
+
+        :return: void.
+        '''
+        if u'{{' in text or u'}}' in text:
+            self.exact = False
+        self.append(text)
+
+    def append(self, text):
+        ''' Appends a piece of text, looking for the delimiters of the italic and quoted ranges in it.
+
+        :param text: text to be appended.
+
+        :return: void.
+        '''
+        if u'\n' in text:
+            offset = self.length
+            for num, line in enumerate(text.split(u'\n')):
+                if num:  # ranges don't go past the end of a line
+                    if self.run_length:
+                        self.end_run()
+                    self.end_line()
+                    offset += 1
+                self.scan(line, offset)
+                offset += len(line)
+        elif u"'" in text or u'"' in text:
+            self.scan(text, self.length)
+        elif self.run_length and text:
+            self.end_run()
+        self.pieces.append(text)
+        self.length += len(text)
+
+    def scan(self, line, offset):
+        ''' Looks for the delimiters of the italic and quoted ranges in a piece of text without line ends.
+
+        :param line: piece of text.
+        :param offset: offset of the piece in the text of the item.
+
+        :return: void.
+        '''
+        if self.run_length and line and line[0] != u"'":
+            self.end_run()
+        if u'"' in line:
+            quote_open = self.quote_open
+            pos = line.find(u'"')
+            while pos >= 0:
+                if quote_open is None:
+                    quote_open = offset + pos
+                else:
+                    self.quotes += ((quote_open, offset + pos + 1),)
+                    quote_open = None
+                pos = line.find(u'"', pos + 1)
+            self.quote_open = quote_open
+        if u"'" in line:
+            size = len(line)
+            run_start, run_length, italic_open = self.run_start, self.run_length, self.italic_open
+            for match in APOSTROPHES.finditer(line):
+                begin, end = match.span()
+                if begin == 0 and run_length:  # the run of the previous piece goes on
+                    run_length += end
+                else:
+                    run_start, run_length = offset + begin, end - begin
+                if end < size:  # the run is over, as in end_run()
+                    if run_length >= 2:
+                        if italic_open is None:
+                            italic_open = (run_start, run_length)
+                        else:
+                            self.italics += ((italic_open[0], run_start + run_length),)
+                            italic_open = None
+                    run_length = 0
+            self.run_start, self.run_length, self.italic_open = run_start, run_length, italic_open
+
+    def end_run(self):
+        ''' Handles the end of a run of apostrophes: a run of two or more opens an italic range, or closes the
+        one already open.
+
+        :return: void.
+        '''
+        start, length = self.run_start, self.run_length
+        self.run_length = 0
+        if length < 2:
+            return
+        if self.italic_open is None:
+            self.italic_open = (start, length)
+        else:
+            self.italics += ((self.italic_open[0], start + length),)
+            self.italic_open = None
+
+    def end_line(self):
+        ''' Drops the ranges left open at the end of a line (or of the text). A run of four or more apostrophes
+        is an italic range on its own.
+
+        :return: void.
+        '''
+        if self.italic_open is not None and self.italic_open[1] >= 4:
+            self.italics += ((self.italic_open[0], self.italic_open[0] + self.italic_open[1]),)
+        self.italic_open = None
+        self.quote_open = None
+
+    def add_reference(self, label):
+        ''' Appends a reference, marked as `` {{label}} ``.
+
+        :param label: label (target) of the reference.
+
+        :return: void.
+        '''
+        if '{' in label or '}' in label or '\n' in label:
+            self.exact = False
+        start = self.length + 1
+        self.spans.append(('reference', start, start + len(label) + 4, label))
+        self.append(u" {{" + label + u"}} ")
+
+    def add_link(self, url, texts):
+        ''' Appends the text of an external link.
+
+        :param url: target of the link.
+        :param texts: pieces of text shown by the link.
+
+        :return: void.
+        '''
+        start = self.length
+        for text in texts:
+            self.add(text)
+        self.spans.append(('link', start, self.length, url))
+
+    def build(self):
+        ''' Returns the ``ListItem``, adding the italic and quoted ranges found in its text.
+
+        :return: a ``ListItem``.
+        '''
+        text = u''.join(self.pieces)
+        if '&nbsp;' in text:  # removed, as ``utilities.remove_symbols()`` would do, shifting the offsets
+            return ListItem(text.replace('&nbsp;', ''))
+        if not self.exact:
+            return ListItem(text)
+        if self.run_length:
+            self.end_run()
+        if self.italic_open is not None:
+            self.end_line()
+        spans = self.spans
+        spans += [('italic', start, end, text[start:end]) for start, end in self.italics]
+        spans += [('quote', start, end, text[start:end]) for start, end in self.quotes]
+        return ListItem(text, tuple(spans))
+
+
+class SectionChunk(tuple):
+    ''' Part of the list elements of an oversized section, mapped independently of the other parts (see
+    ``pipeline.split_resource()``). ``chunk_index`` tells apart the parts of the same section.
+    '''
+
+    def __new__(cls, elems, chunk_index):
+        chunk = tuple.__new__(cls, elems)
+        chunk.chunk_index = chunk_index
+        return chunk
+
+
+def encode_item(elem):
+    ''' utf-8 encodes a list element, keeping its spans if it is a ``ListItem``.
+
+    :param elem: a list element.
+
+    :return: the encoded element (an ``EncodedItem`` for a ``ListItem``).
+    '''
+    if isinstance(elem, ListItem):
+        return EncodedItem(elem.encode('utf-8'), elem.spans)
+    return elem.encode('utf-8')
+
+
+def get_spans(elem):
+    ''' Returns the spans of a list element, if they are known.
+
+    :param elem: a list element (``ListItem``, ``EncodedItem`` or plain string).
+
+    :return: tuple of spans, or ``None`` for plain strings and for elements whose spans are not known.
+    '''
+    return getattr(elem, 'spans', None)
+
+
+def first_span(spans, kind):
+    ''' Returns the value of the first span of a given kind.
+
+    :param spans: tuple of spans.
+    :param kind: ``reference``, ``link``, ``italic`` or ``quote``.
+
+    :return: the value of the span, or ``None`` if there is no such span.
+    '''
+    for span in spans:
+        if span[0] == kind:
+            return span[3]
+    return None
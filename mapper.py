@@ -25,6 +25,12 @@ import rdflib
 import utilities
 import sys
 import time
+import threading
+import fixtures
+import httpClient
+import listItem
+import sameAsIndex
+import sectionMemo
 from mapping_rules import *
 
 
@@ -41,8 +47,78 @@ resource_class = ""
 MAPPING = dict()
 CUSTOM_MAPPERS = dict()
 
+# Domains whose mapper functions read the triples added by other sections of the resource (e.g. ``map_staff``
+# looks for alumni), so their triples can't be reused when only their own section is unchanged.
+GRAPH_DEPENDENT = ['STAFF']
 
-def select_mapping(resDict, res, lang, res_class, g):
+SAMEAS_BATCH = 100  # Wikidata URIs resolved by a single owl:sameAs query (they are sent in the query string)
+API_ATTEMPTS = 3  # maximum number of attempts for a Wikidata/DBpedia API call
+API_RETRY_DELAY = 5  # seconds waited before retrying a failed API call
+
+sameas_batches = threading.local()  # SameAsBatch of the resource being mapped by the current thread, if any
+
+
+class SameAsBatch(object):
+    ''' Collects the Wikidata URIs found while mapping one or more resources, so that their DBpedia equivalents
+    are asked with a few ``VALUES`` queries instead of one query each. Until then the Wikidata URIs are added to
+    the graph, and they are replaced once the batch is resolved (see ``resolve()``). '''
+
+    def __init__(self, lang):
+        '''
+        :param lang: language of the resource, and of the endpoint to be queried.
+        '''
+        self.lang = lang
+        self.uris = []
+        self.seen = set()
+        self.callbacks = []  # functions to be called with the resolved URIs, e.g. to store memo entries
+
+    def add(self, wk_uri):
+        ''' Registers a Wikidata URI to be resolved.
+
+        :param wk_uri: URI found using the WikiData API.
+
+        :return: void.
+        '''
+        if wk_uri not in self.seen:
+            self.seen.add(wk_uri)
+            self.uris.append(wk_uri)
+
+    def defer(self, callback):
+        ''' Registers a function to be called with the dict of resolved URIs, once the batch is resolved.
+
+        :return: void.
+        '''
+        self.callbacks.append(callback)
+
+    def extend(self, other):
+        ''' Adds the URIs and the deferred functions of another batch, to be resolved with this one.
+
+        :param other: a ``SameAsBatch`` of the same language.
+
+        :return: void.
+        '''
+        for wk_uri in other.uris:
+            self.add(wk_uri)
+        self.callbacks += other.callbacks
+
+    def resolve(self, *graphs):
+        ''' Finds the DBpedia equivalents of the collected URIs, and replaces them in the graphs.
+
+        :param graphs: RDF graphs filled while the batch was collected.
+
+        :return: dict mapping each resolved Wikidata URI to its DBpedia equivalent.
+        '''
+        found = dict()
+        for num in range(0, len(self.uris), SAMEAS_BATCH):
+            found.update(find_DBpedia_uris(self.uris[num:num + SAMEAS_BATCH], self.lang))
+        for g in graphs:
+            replace_uris(g, found)
+        for callback in self.callbacks:
+            callback(found)
+        return found
+
+
+def select_mapping(resDict, res, lang, res_class, g, domains_mapped=None, failed=None, sameas_batch=None):
     ''' Calls mapping functions for each matching section of the resource, thus constructing the associated RDF graph.
 
     Firstly selects the mapping type(s) to apply from ``MAPPING`` (loaded from ``settings.json``) based on resource class (domain).
@@ -54,6 +130,13 @@ def select_mapping(resDict, res, lang, res_class, g):
     :param res_class: resource class/type (e.g. ``Writer``).
     :param lang: resource language.
     :param g: RDF graph to be created.
+    :param domains_mapped: list of the domains already mapped for this resource; defaults to the global
+                   ``mapped_domains``. Concurrent callers must pass their own list.
+    :param failed: if given, list collecting the ``(domain, section)`` pairs whose mapping raised an exception
+                   (the rest of such a section is skipped).
+    :param sameas_batch: if given, the ``SameAsBatch`` collecting the Wikidata URIs to be resolved by the caller,
+                   e.g. together with those of other resources (see ``pipeline.Pipeline.write_stage()``);
+                   otherwise they are resolved before returning.
 
     :return: number of list elements actually mapped in the graph.
     '''
@@ -68,11 +151,14 @@ def select_mapping(resDict, res, lang, res_class, g):
         MAPPING = utilities.load_settings()
         CUSTOM_MAPPERS = utilities.load_custom_mappers()
     
+    if domains_mapped is None:
+        domains_mapped = mapped_domains
+
     # initialize the number of triples extracted
     res_elems = 0
 
     #if required class is a valid and existing class in the mapping, run suitable mapper functions
-    if res_class in MAPPING and MAPPING[res_class] not in mapped_domains:
+    if res_class in MAPPING and MAPPING[res_class] not in domains_mapped:
         if lang != 'en':  # correct dbpedia resource domain for non-english language
             global dbr
             dbr = rdflib.Namespace("http://" + lang + ".dbpedia.org/resource/")
@@ -82,8 +168,14 @@ def select_mapping(resDict, res, lang, res_class, g):
         domain_keys = []
         resource_class = res_class
 
+        # owl:sameAs lookups are batched, except when a mapper reads the triples of other sections
+        batch = None
+        if not [domain for domain in domains if domain in GRAPH_DEPENDENT]:
+            batch = sameas_batch if sameas_batch is not None else SameAsBatch(lang)
+        sameas_batches.batch = batch
+
         for domain in domains:
-            if domain in mapped_domains:
+            if domain in domains_mapped:
                 continue
             
             is_custom_map_fn = False
@@ -104,7 +196,7 @@ def select_mapping(resDict, res, lang, res_class, g):
                     is_custom_map_fn = True
                     domain_keys = CUSTOM_MAPPERS[domain]["headers"][lang]
 
-            mapped_domains.append(domain)  #this domain won't be used again for mapping
+            domains_mapped.append(domain)  #this domain won't be used again for mapping
     
             for res_key in resDict.keys():  # iterate on resource dictionary keys
                 mapped = False
@@ -114,17 +206,19 @@ def select_mapping(resDict, res, lang, res_class, g):
                     dk = dk.decode('utf-8') #make sure utf-8 mismatches don't skip sections 
                     if not mapped and re.search(dk, res_key, re.IGNORECASE):
                         try:
-                            if is_custom_map_fn == False:
-                                #use the pre-defined mapper functions
-                                mapper = "map_" + domain.lower() + "(resDict[res_key], res_key, db_res, lang, g, 0)"
-                                res_elems += eval(mapper)  # calls the proper mapping for that domain and counts extracted elements
-                                mapped = True  # prevents the same section to be mapped again
-                            else:
-                                mapper = map_user_defined_mappings(domain, resDict[res_key], res_key, db_res, lang, g, 0)
-                                res_elems += mapper  # calls the proper mapping for that domain and counts extracted elements
-                                mapped = True  # prevents the same section to be mapped again
+                            # calls the proper mapping for that domain (or reuses its triples, if the section
+                            # did not change) and counts extracted elements
+                            res_elems += memoized_mapping(domain, is_custom_map_fn, resDict[res_key], res_key, res,
+                                                          db_res, lang, g)
+                            mapped = True  # prevents the same section to be mapped again
                         except:
                             print 'exception occured in resDict, skipping....'
+                            if failed is not None:
+                                failed.append((domain, res_key))
+
+        sameas_batches.batch = None
+        if batch is not None and batch is not sameas_batch:
+            batch.resolve(g)
 
     else:
         # print 'This domain has not been mapped yet!'
@@ -134,6 +228,75 @@ def select_mapping(resDict, res, lang, res_class, g):
     return res_elems
 
 
+def call_mapper(domain, is_custom_map_fn, elem_list, sect_name, db_res, lang, g):
+    ''' Applies the mapper function of a domain to the list elements of a section.
+
+    :param domain: domain to be mapped (e.g. ``BIBLIOGRAPHY``).
+    :param is_custom_map_fn: whether the domain is a user-defined mapping from ``custom_mappers.json``.
+    :param elem_list: list elements of the section.
+    :param sect_name: section title.
+    :param db_res: URI of the resource.
+    :param lang: resource language.
+    :param g: RDF graph to be filled.
+
+    :return: number of list elements extracted.
+    '''
+    if is_custom_map_fn == False:
+        #use the pre-defined mapper functions
+        mapper = "map_" + domain.lower() + "(elem_list, sect_name, db_res, lang, g, 0)"
+        return eval(mapper)
+    return map_user_defined_mappings(domain, elem_list, sect_name, db_res, lang, g, 0)
+
+
+def memoized_mapping(domain, is_custom_map_fn, elem_list, sect_name, res, db_res, lang, g):
+    ''' Like ``call_mapper()``, but reuses the triples produced by a previous run for the same section content,
+    if the section memo is in use (see ``sectionMemo``).
+
+    :param domain: domain to be mapped (e.g. ``BIBLIOGRAPHY``).
+    :param is_custom_map_fn: whether the domain is a user-defined mapping from ``custom_mappers.json``.
+    :param elem_list: list elements of the section.
+    :param sect_name: section title.
+    :param res: resource name.
+    :param db_res: URI of the resource.
+    :param lang: resource language.
+    :param g: RDF graph to be filled.
+
+    :return: number of list elements extracted.
+    '''
+    memo = sectionMemo.memo
+    if memo is None or domain in GRAPH_DEPENDENT:
+        return call_mapper(domain, is_custom_map_fn, elem_list, sect_name, db_res, lang, g)
+
+    digest = sectionMemo.section_digest(elem_list, memo.signature)
+    section = sect_name
+    if getattr(elem_list, 'chunk_index', None) is not None:  # a part of an oversized section
+        section = sect_name + u' #' + unicode(elem_list.chunk_index)
+    found = memo.get(lang, res, domain, section, digest)
+    if found is not None:
+        elems, lines = found
+        if lines:
+            g.parse(data='\n'.join(lines), format='nt')
+        return elems
+
+    sect_graph = rdflib.Graph()  # collects exactly the triples produced for this section
+    try:
+        elems = call_mapper(domain, is_custom_map_fn, elem_list, sect_name, db_res, lang, sect_graph)
+    finally:
+        for triple in sect_graph:
+            g.add(triple)
+
+    def store(found):
+        replace_uris(sect_graph, found)
+        memo.put(lang, res, domain, section, digest, elems, sect_graph)
+
+    batch = getattr(sameas_batches, 'batch', None)
+    if batch is not None:  # the entry must hold the DBpedia URIs, known once the batch is resolved
+        batch.defer(store)
+    else:
+        store(dict())
+    return elems
+
+
 def map_user_defined_mappings(mapper_fn_name, elem_list, sect_name, res, lang, g, elems):
     ''' **This is the made module that runs all user-defined mapper functions.**
 
@@ -165,12 +328,12 @@ def map_user_defined_mappings(mapper_fn_name, elem_list, sect_name, res, lang, g
         return 0
 
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_user_defined_mappings(mapper_fn_name, elem, sect_name, res, lang, g, elems)   # handle recursive lists
 
         else:
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             years = []
             if mapper_settings["years"] == "Yes": #extract years related to the resource.
                 years = month_year_mapper(elem)
@@ -268,14 +431,14 @@ def map_discography(elem_list, sect_name, res, lang, g, elems):
     '''
 
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_discography(elem, sect_name, res, lang, g, elems)   # handle recursive lists
         
         else:
             year = month_year_mapper(elem) #map years present in the list
             uri = None
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             res_name = italic_mapper(elem)
             if res_name == None: res_name = quote_mapper(elem)
             
@@ -334,14 +497,14 @@ def map_concert_tours(elem_list, sect_name, res, lang, g, elems):
     '''
     
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_concert_tours(elem, sect_name, res, lang, g, elems)   # handle recursive lists
         
         else:
             year = month_year_mapper(elem)
             uri = None
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             res_name = italic_mapper(elem)
             if res_name == None: res_name = quote_mapper(elem)
            
@@ -400,13 +563,13 @@ def map_alumni(elem_list, sect_name, res, lang, g, elems):
     '''
     
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_alumni(elem, sect_name, res, lang, g, elems)   # handle recursive lists
         
         else:
             uri = None
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             res_name = italic_mapper(elem)
             
             if res_name:
@@ -463,13 +626,13 @@ def map_programs_offered(elem_list, sect_name, res, lang, g, elems):
     '''
     
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_programs_offered(elem, sect_name, res, lang, g, elems)   # handle recursive lists
         
         else:
             uri = None
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             res_name = italic_mapper(elem)
             
             if res_name:
@@ -526,7 +689,7 @@ def map_honors(elem_list, sect_name, res, lang, g, elems):
     
     award_status = award_status_mapper(sect_name, lang)  # if award status is found in the section name.
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_honors(elem, sect_name, res, lang, g, elems)
         
@@ -537,7 +700,7 @@ def map_honors(elem_list, sect_name, res, lang, g, elems):
             if award_status == None: award_status = award_status_mapper(elem, lang)
             if award_status == None: award_status = "Winner" #if no information is found, assume winner.
 
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
 
             #remove status from the element
             elem = elem.replace("Winner","").replace("Won","").replace("Nominated","").replace("Nominee","")
@@ -604,13 +767,13 @@ def map_staff(elem_list, sect_name, res, lang, g, elems):
     '''
     
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_staff(elem, sect_name, res, lang, g, elems)   # handle recursive lists
         
         else:
             uri = None
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             res_name = italic_mapper(elem)
             
             if res_name:
@@ -666,13 +829,13 @@ def map_other_person_details(elem_list, sect_name, res, lang, g, elems):
     '''
     
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_other_person_details(elem, sect_name, res, lang, g, elems)   # handle recursive lists
         
         else:
             uri = None
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             res_name = italic_mapper(elem)
             
             other_details = None
@@ -746,14 +909,14 @@ def map_career(elem_list, sect_name, res, lang, g, elems):
     '''
     
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_career(elem, sect_name, res, lang, g, elems)
         
         else:
             year = month_year_mapper(elem)            
             uri = None
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
 
             other_details = None
             for other_type in CAREER[lang]:
@@ -801,14 +964,14 @@ def map_filmography(elem_list, sect_name, res, lang, g, elems):
     film_particip = filmpart_mapper(sect_name, lang)  # applied to every list element of the section, default:starring
     filmography_type = filmtype_mapper(sect_name, lang)  #same as above
     for elem in elem_list:
-        if type(elem) == list:  #for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  #for nested lists (recursively call this function)
             elems += 1
             map_filmography(elem, sect_name, res, lang, g, elems)
         
         else:
             year = month_year_mapper(elem)
             uri = None
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             res_name = italic_mapper(elem)  # Try to extract italic formatted text (more precise)
             
             if res_name:
@@ -855,14 +1018,14 @@ def map_bibliography(elem_list, sect_name, res, lang, g, elems):
     # literary genre depends on the name of the section, so it is the same for every element of the list
     lit_genre = litgenre_mapper(sect_name, lang)  #literary genre is the same for every element of the list
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_bibliography(elem, sect_name, res, lang, g, elems)
         
         else:
             uri = None
             year = month_year_mapper(elem)
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             res_name = italic_mapper(elem)
             if res_name:
                 elem = elem.replace(res_name, "")  #delete resource name found from element for further mapping
@@ -925,13 +1088,13 @@ def map_band_members(elem_list, sect_name, res, lang, g, elems):
     :return: number of list elements extracted.
     '''
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_members(elem, sect_name, res, lang, g, elems)
 
         else:
             uri = None
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             res_name = italic_mapper(elem)
             if res_name:
                 elem = elem.replace(res_name, "")  #delete resource name found from element for further mapping
@@ -987,7 +1150,7 @@ def map_contributors(elem_list, sect_name, res, lang, g, elems):
     :return: number of list elements extracted.
     '''
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_contributors(elem, sect_name, res, lang, g, elems)
 
@@ -1030,7 +1193,7 @@ def map_contributors(elem_list, sect_name, res, lang, g, elems):
                 elem = elem.strip()
 
             uri = None
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             
             if True:
                 ref = reference_mapper(elem)  # look for resource references
@@ -1090,7 +1253,7 @@ def map_other_literature_details(elem_list, sect_name, res, lang, g, elems):
             return 0
 
     for elem in elem_list:
-        if type(elem) == list:  # for nested lists (recursively call this function)
+        if type(elem) in (list, tuple):  # for nested lists (recursively call this function)
             elems += 1
             map_other_literature_details(elem, sect_name, res, lang, g, elems)
 
@@ -1126,7 +1289,7 @@ def map_other_literature_details(elem_list, sect_name, res, lang, g, elems):
 
 
             uri = None
-            elem = elem.encode('utf-8')  # apply utf-8 encoding
+            elem = listItem.encode_item(elem)  # apply utf-8 encoding, keeping the spans found by the parser
             
             if True:
                 ref = reference_mapper(elem)  # look for resource references
@@ -1531,10 +1694,7 @@ def lookup_call(keyword):
     base_req = 'http://lookup.dbpedia.org/api/search/PrefixSearch?MaxHits=1&QueryString='
     req = base_req + str(keyword)
     try:
-        call = urllib2.Request(req)
-        call.add_header('Accept', 'application/json')
-        resp = urllib2.urlopen(call)
-        answer = resp.read()
+        answer = httpClient.get(req, {'Accept': 'application/json'})
         parsed_ans = json.loads(answer)
     
     except:
@@ -1544,6 +1704,29 @@ def lookup_call(keyword):
     return parsed_ans
 
 
+def call_api(call, service):
+    ''' Makes an API call, retrying it after ``API_RETRY_DELAY`` seconds if it fails on the connection or on the
+    server (e.g. because the host refuses too many connections), at most ``API_ATTEMPTS`` times in all.
+    Client errors (HTTP 4xx, except 429 Too Many Requests) are not retried, since they would fail again.
+
+    :param call: function making the call.
+    :param service: name of the service, used in the messages.
+
+    :return: the result of the call.
+    :raise IOError: the error of the last attempt.
+    '''
+    for attempt in range(API_ATTEMPTS):
+        try:
+            return call()
+        except IOError as error:
+            code = getattr(error, 'code', None)
+            if attempt == API_ATTEMPTS - 1 or (code is not None and 400 <= code < 500 and code != 429):
+                raise
+        time.sleep(API_RETRY_DELAY)
+        print("retrying " + service + " API call...")
+
+
+@fixtures.recorded('wikidata')
 def wikidataAPI_call(res, lang):
     '''Calls Wikidata API service to get a corresponding URI from a string.
 
@@ -1556,20 +1739,13 @@ def wikidataAPI_call(res, lang):
     enc_res = urllib2.quote(res)  # then encode the string to be used in a URL
     req = 'https://www.wikidata.org/w/api.php?action=wbsearchentities&format=json&search=' + enc_res + '&language=' + lang
     try:
-        call = urllib2.Request(req)
-        resp = urllib2.urlopen(call)
-        answer = resp.read()
+        answer = call_api(lambda: httpClient.get(req), 'Wikidata')
         parsed_ans = json.loads(answer)
         result = parsed_ans['search']
         if result == []:  # no URis found
             return None
         uri = result[0]['concepturi']
     
-    except urllib2.URLError:  # sometimes the host can refuse too many connections and returns a socket error
-        time.sleep(5)  #wait 5 seconds and then retry
-        print("retrying Wikidata API call...")
-        wikidataAPI_call(res, lang)
-    
     except:
         print ("Wikidata API error on request " + req)
     
@@ -1580,28 +1756,83 @@ def wikidataAPI_call(res, lang):
 def find_DBpedia_uri(wk_uri, lang):
     ''' Used to find an equivalent URI in DBpedia from a Wikidata one obtained by `Wikidata API`.
 
+    The local index built with ``sameAsIndex.py`` is used first, if loaded. Otherwise, while a resource is
+    mapped by ``select_mapping()``, the URI is only added to the ``SameAsBatch`` of the resource and ``None`` is
+    returned: the Wikidata URI is used, and replaced when the batch is resolved (at the end of the resource, or
+    by the writer of the pipeline for several resources at once).
+
     :param wk_uri: URI found using the WikiData API.
     :param lang: resource/endpoint language.
 
     :return: DBpedia equivalent URI if found.
     '''
+    index = sameAsIndex.index
+    if index is not None and index.lang == lang:  # local lookup, no endpoint call
+        return index.get(wk_uri)
+
+    batch = getattr(sameas_batches, 'batch', None)
+    if batch is not None and batch.lang == lang:
+        batch.add(wk_uri)
+        return None
+
     query = "select distinct ?s where {?s <http://www.w3.org/2002/07/owl#sameAs> <" + wk_uri + "> }"
     try:
-        json = utilities.sparql_query(query, lang)
-    
-    except IOError:
-        time.sleep(5)
-        print("retrying DBpedia API call...")
-        find_DBpedia_uri(wk_uri, lang)
-    
-    try:
+        json = call_api(lambda: utilities.sparql_query(query, lang), 'DBpedia')
         result = json['results']['bindings'][0]['s']['value']
+    except IOError:
+        print("DBpedia API error on query " + query)
+        result = None
     except:
         result = None
     
     return result
 
 
+def find_DBpedia_uris(wk_uris, lang):
+    ''' Finds the DBpedia equivalents of several Wikidata URIs with a single ``VALUES`` query. If the query
+    fails, every URI is asked on its own with ``find_DBpedia_uri()``.
+
+    :param wk_uris: list of at most ``SAMEAS_BATCH`` URIs found using the WikiData API.
+    :param lang: resource/endpoint language.
+
+    :return: dict mapping each Wikidata URI to its DBpedia equivalent; URIs without one are left out.
+    '''
+    query = "select distinct ?s ?wd where { VALUES ?wd { <" + "> <".join(wk_uris) + "> } " \
+            "?s <http://www.w3.org/2002/07/owl#sameAs> ?wd }"
+    found = dict()
+    try:
+        json = utilities.sparql_query(query, lang)
+        for binding in json['results']['bindings']:
+            if binding['wd']['value'] not in found:
+                found[binding['wd']['value']] = binding['s']['value']
+    except Exception:
+        print("batched DBpedia API call failed, asking every URI...")
+        for wk_uri in wk_uris:
+            result = find_DBpedia_uri(wk_uri, lang)
+            if result:
+                found[wk_uri] = result
+    return found
+
+
+def replace_uris(g, found):
+    ''' Replaces some URIs with others in the subjects and objects of a graph.
+
+    :param g: RDF graph to be modified.
+    :param found: dict mapping the URIs to be replaced to their replacement, as returned by
+                  ``find_DBpedia_uris()``.
+
+    :return: void.
+    '''
+    for old_uri, new_uri in found.items():
+        old, new = rdflib.URIRef(old_uri), rdflib.URIRef(new_uri)
+        for s, p, o in list(g.triples((old, None, None))):
+            g.remove((s, p, o))
+            g.add((new, p, new if o == old else o))
+        for s, p, o in list(g.triples((None, None, old))):
+            g.remove((s, p, o))
+            g.add((s, p, new))
+
+
 def list_elem_clean(list_elem):
     ''' Used to clean a list elements from forbidden or futile characters in a URI.
 
@@ -1649,6 +1880,13 @@ def italic_mapper(list_elem):
     :return: a match if found, ``None`` otherwise.
     '''
     
+    spans = listItem.get_spans(list_elem)
+    if spans is not None:  # italic ranges already found by the parser
+        match_italic = listItem.first_span(spans, 'italic')
+        if match_italic:
+            match_italic = list_elem_clean(match_italic.encode('utf-8'))
+        return match_italic
+
     # match_ref_italic = re.search(r'\'{2,}(.*?)\'{2,}', list_elem)
     match_italic = re.search(r'\'{2,}(.*?)\'{2,}', list_elem)
     if match_italic:
@@ -1666,6 +1904,13 @@ def reference_mapper(list_elem):
 
     :return: a match if found, excluding number references.
     '''
+    spans = listItem.get_spans(list_elem)
+    if spans is not None:  # references already found by the parser
+        match_ref = listItem.first_span(spans, 'reference')
+        if match_ref is None or re.search(r'[0-9]{4}', match_ref):  # date references must be ignored
+            return None
+        return "{{" + match_ref.encode('utf-8') + "}}"
+
     match_ref = re.search(r'\{\{.*?\}\}', list_elem)
     if match_ref:
         match_ref = match_ref.group()
@@ -1715,6 +1960,13 @@ def quote_mapper(list_elem):
 
     :return: a match if found, excluding number references.
     '''
+    spans = listItem.get_spans(list_elem)
+    if spans is not None:  # quoted ranges already found by the parser
+        match_ref = listItem.first_span(spans, 'quote')
+        if match_ref is None or re.search(r'[0-9]{4}', match_ref):  # date references must be ignored
+            return None
+        return match_ref.encode('utf-8')
+
     match_ref = re.search(r'\"(.*?)\"', list_elem)
     if match_ref:
         match_ref = match_ref.group(0)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+#################
+ MemoryBenchmark
+#################
+
+* This module measures the memory held by the resource dictionaries built by ``wikiParser`` when many parsed
+  pages are kept at the same time (e.g. while waiting in the queues of ``pipeline``). It compares the compact
+  layout of the dictionaries (section titles shared by every page, tuples of list elements) with the previous
+  one (a new title string for every page, growable lists).
+
+* Pages are read from a fixture store recorded with ``listExtractor.py --record DIR`` (see ``fixtures``), so
+  no service is called and the figures can be compared between runs.
+
+* ``tracemalloc`` is not available in Python 2: the memory is measured by walking the dictionaries with
+  ``sys.getsizeof()``, counting every object once even if it is shared, which is the peak held by the
+  dictionaries when every page is in flight.
+
+* Usage: ``python memoryBenchmark.py DIR [--language en] [--limit N]``
+
+'''
+
+import argparse
+import os
+import sys
+
+import fixtures
+import wikiParser
+
+
+def deep_size(obj, seen):
+    ''' Returns the memory taken by an object and by every object it holds, not counted yet.
+
+    :param obj: a resource dictionary, or any of its values.
+    :param seen: set of the ids of the objects already counted; updated.
+
+    :return: size in bytes.
+    '''
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if type(obj) == dict:
+        size += sum(deep_size(key, seen) + deep_size(val, seen) for key, val in obj.items())
+    elif type(obj) in (list, tuple):
+        size += sum(deep_size(val, seen) for val in obj)
+    elif hasattr(obj, 'spans'):  # ListItem
+        size += deep_size(obj.spans, seen) + deep_size(getattr(obj, 'children', ()), seen)
+    return size
+
+
+def previous_layout(res_dict):
+    ''' Converts a resource dictionary to the layout used before, with a title string of its own and growable
+    lists, sharing the list elements with the compact dictionary.
+
+    :param res_dict: a resource dictionary built by ``wikiParser``.
+
+    :return: the converted dictionary.
+    '''
+    converted = dict()
+    for key, values in res_dict.items():
+        title = (key + u' ')[:-1]  # a new string, as each page used to build its own titles
+        converted[title] = [list(val) if type(val) == tuple else val for val in values]
+    return converted
+
+
+def run_benchmark(store, language, limit=None):
+    ''' Parses the pages recorded in a fixture store, keeping all of them in memory, and prints the memory
+    held by their dictionaries in both layouts.
+
+    :param store: a ``fixtures.FixtureStore``.
+    :param language: language of the pages to be parsed.
+    :param limit: maximum number of pages, or ``None`` for all of them.
+
+    :return: a tuple ``(pages, compact_size, previous_size)``.
+    '''
+    res_dicts = []
+    for args, sections in store.iter_answers('jsonpedia'):
+        if args[0] != language:
+            continue
+        res_dicts.append(wikiParser.parse_result(language, args[1], sections, follow_redirects=False))
+        if limit is not None and len(res_dicts) >= limit:
+            break
+
+    compact_size = deep_size(res_dicts, set())
+    previous_size = deep_size([previous_layout(res_dict) for res_dict in res_dicts], set())
+    return len(res_dicts), compact_size, previous_size
+
+
+def main():
+    ''' Entry point: runs the benchmark on a fixture directory.
+
+    :return: void.
+    '''
+    parser = argparse.ArgumentParser(description='Compare the memory held by compact and previous resource '
+                                                 'dictionaries.\nExample: `python memoryBenchmark.py fixtures/`',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('fixtures', type=str, help="Directory of a fixture store recorded with listExtractor.py"
+                                                   " --record")
+    parser.add_argument('--language', type=str, default='en', help="Language of the pages to be parsed\n")
+    parser.add_argument('--limit', type=int, help="Maximum number of pages to be parsed\n")
+    args = parser.parse_args()
+
+    path = os.path.join(args.fixtures, 'fixtures.db')
+    if not os.path.exists(path):
+        print 'No fixture store found in ' + args.fixtures
+        sys.exit(1)
+    pages, compact_size, previous_size = run_benchmark(fixtures.FixtureStore(path), args.language, args.limit)
+    if pages == 0:
+        print 'No recorded ' + args.language + ' pages found in ' + args.fixtures
+        sys.exit(1)
+
+    print 'Pages parsed:', pages, '(' + str(len(wikiParser.section_paths)), 'distinct section titles)'
+    print 'Previous layout:', str(previous_size / 1024) + 'KB,', str(previous_size / pages), 'bytes per page'
+    print 'Compact layout:', str(compact_size / 1024) + 'KB,', str(compact_size / pages), 'bytes per page'
+    print 'Saved:', str(round(100.0 * (previous_size - compact_size) / previous_size, 1)) + '%'
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+'''
+############
+ Page Cache
+############
+
+* This module contains a persistent, on-disk cache for the sections obtained from JSONpedia, so that a rerun
+  of the extractor (e.g. after changing a mapping rule) does not need to fetch and convert every page again.
+
+* Entries are keyed by language and resource, and store the revision of the page (if known) together with
+  the date it was fetched. The ``result`` section list is stored as zlib-compressed JSON in a SQLite file.
+
+* The cache is bounded in size (least recently used entries are evicted first; the access time of an entry
+  is updated at most once every ``TOUCH_INTERVAL``, so that hits don't write to the file) and entries expire
+  after a configurable time-to-live.
+
+* The cache can be used in four modes:
+
+    * ``use``: read entries from the cache and store new pages in it (default).
+    * ``offline``: only read entries from the cache; pages not in the cache are not fetched.
+    * ``refresh``: ignore the cached entries, fetch every page again and store it.
+    * ``bypass``: don't use the cache at all.
+
+'''
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+import utilities
+
+CACHE_MODES = ['use', 'offline', 'refresh', 'bypass']
+DEFAULT_SIZE = 2048  # default size cap, in MB
+DEFAULT_TTL = 7  # default time-to-live of an entry, in days
+TOUCH_INTERVAL = 3600  # seconds between two updates of the access time of an entry
+
+
+class CacheMiss(Exception):
+    ''' Raised in ``offline`` mode when a page is not available in the cache. '''
+    pass
+
+
+class PageCache(object):
+    ''' A size-bounded, LRU-evicted, on-disk cache for JSONpedia section lists.
+
+    The underlying SQLite connection is shared between threads and protected by a lock.
+    '''
+
+    def __init__(self, path, mode='use', max_size=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+        '''
+        :param path: path of the SQLite file holding the cache.
+        :param mode: one of ``CACHE_MODES``.
+        :param max_size: maximum size of the cached data, in MB.
+        :param ttl: time-to-live of an entry, in days.
+        '''
+        self.mode = mode
+        self.max_size = max_size * 1024 * 1024
+        self.ttl = ttl * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.text_factory = str
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pages (lang TEXT, resource TEXT, revision INTEGER, "
+                          "fetched REAL, accessed REAL, size INTEGER, data BLOB, PRIMARY KEY (lang, resource))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def get(self, lang, resource, revision=None):
+        ''' Looks for a page in the cache.
+
+        :param lang: language of the resource.
+        :param resource: name of the resource.
+        :param revision: current revision of the page, if known; a cached entry of a different revision is
+                         considered stale.
+
+        :return: the cached ``result`` list, or ``None`` if the page is missing, expired or stale.
+        '''
+        if self.mode in ('refresh', 'bypass'):
+            return None
+        with self.lock:
+            row = self.conn.execute("SELECT revision, fetched, data, accessed FROM pages "
+                                    "WHERE lang = ? AND resource = ?", (lang, resource)).fetchone()
+            now = time.time()
+            fresh = row is not None and now - row[1] < self.ttl
+            if fresh and revision is not None and row[0] is not None and row[0] != revision:
+                fresh = False
+            if not fresh:
+                self.misses += 1
+                return None
+            if now - row[3] >= TOUCH_INTERVAL:  # keep popular entries from being evicted
+                self.conn.execute("UPDATE pages SET accessed = ? WHERE lang = ? AND resource = ?",
+                                  (now, lang, resource))
+                self.conn.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(row[2]))
+
+    def put(self, lang, resource, result, revision=None):
+        ''' Stores the ``result`` of a page in the cache, evicting the least recently used entries if the
+        cache grows over its size cap.
+
+        :param lang: language of the resource.
+        :param resource: name of the resource.
+        :param result: list of sections obtained from JSONpedia.
+        :param revision: revision of the page, if known.
+
+        :return: void.
+        '''
+        self.put_data(lang, resource, zlib.compress(json.dumps(result, separators=(',', ':'))), revision)
+
+    def put_data(self, lang, resource, data, revision=None):
+        ''' Stores an already compressed ``result`` in the cache; see ``put()``.
+
+        :param lang: language of the resource.
+        :param resource: name of the resource.
+        :param data: zlib-compressed JSON of the list of sections.
+        :param revision: revision of the page, if known.
+
+        :return: void.
+        '''
+        if self.mode in ('offline', 'bypass'):
+            return
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM pages WHERE lang = ? AND resource = ?",
+                                    (lang, resource)).fetchone()
+            if old is not None:
+                self.size -= old[0]
+            self.conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (lang, resource, revision, now, now, len(data), sqlite3.Binary(data)))
+            self.size += len(data)
+            if self.size > self.max_size:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        ''' Deletes the least recently used entries until the cache is back to 90% of its size cap.
+        Must be called holding the lock.
+
+        :return: void.
+        '''
+        # other processes may have stored or evicted entries in the meantime
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        target = self.max_size * 0.9
+        rows = self.conn.execute("SELECT lang, resource, size FROM pages ORDER BY accessed")
+        evicted = []
+        for lang, resource, size in rows:
+            if self.size <= target:
+                break
+            evicted.append((lang, resource))
+            self.size -= size
+        self.conn.executemany("DELETE FROM pages WHERE lang = ? AND resource = ?", evicted)
+
+    def report(self):
+        ''' Prints the number of cache hits and misses of the current run.
+
+        :return: void.
+        '''
+        print "Page cache:", self.hits, "hits,", self.misses, "misses,", \
+            str(self.size / (1024 * 1024)) + "MB stored"
+
+    def close(self):
+        ''' Closes the underlying SQLite file.
+
+        :return: void.
+        '''
+        self.conn.close()
+
+
+def open_cache(mode='use', max_size=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+    ''' Opens the page cache stored in the ``cache`` subdirectory.
+
+    :param mode: one of ``CACHE_MODES``.
+    :param max_size: maximum size of the cached data, in MB.
+    :param ttl: time-to-live of an entry, in days.
+
+    :return: a ``PageCache``, or ``None`` in ``bypass`` mode.
+    '''
+    if mode == 'bypass':
+        return None
+    return PageCache(utilities.get_subdirectory('cache', 'pages.db'), mode, max_size, ttl)
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+#################
+ ParserBenchmark
+#################
+
+* This module measures the throughput of the parsing stages run on every page: ``parse_list()`` on the list
+  elements, ``SectionParser.parse_section()`` on the sections (``parse_list()`` included) and
+  ``utilities.clean_dictionary()`` on the resulting dictionary. For each stage it reports pages/sec,
+  items/sec (list elements) and the peak memory allocated for a single page.
+
+* Pages are read from a fixture store recorded with ``listExtractor.py --record DIR`` (see ``fixtures``), so
+  no service is called and the figures can be compared between runs. With ``--record`` the corpus is grown
+  first: the resources of the datasets in ``extracted/``, plus ``--per-class`` resources of every class
+  evaluated in ``evaluation.csv``, are fetched once from JSONpedia and recorded in the same store.
+
+* Results are written in a JSON file, and compared with a stored baseline (``benchmarks/parser_baseline.json``
+  by default): a stage whose items/sec dropped by more than ``--tolerance`` percent is reported as a
+  regression, and the exit status is 1. ``--save-baseline`` makes the current results the new baseline.
+
+* ``tracemalloc`` is not available in Python 2: as in ``memoryBenchmark``, the memory allocated by a stage is
+  measured by walking its output with ``sys.getsizeof()``, leaving out the objects it shares with its input.
+
+* Usage: ``python parserBenchmark.py DIR [--language en] [--record [--per-class N]] [--limit N] [--repeat N]
+  [--output results.json] [--baseline path] [--save-baseline] [--tolerance 10]``
+
+'''
+
+import argparse
+import csv
+import json
+import os
+import platform
+import re
+import sys
+import time
+
+import fixtures
+import memoryBenchmark
+import utilities
+import wikiParser
+
+STAGES = ['parse_list', 'parse_section', 'clean_dictionary']
+
+EXTRACTED_FILE = re.compile(r'^ListExtractor_(.+)_([a-z]+)_\d{4}_\d{2}_\d{2}\.ttl$')  # datasets in extracted/
+
+
+def corpus_resources(language, per_class=0):
+    ''' Lists the resources of the benchmark corpus: the ones of the datasets in ``extracted/`` and, if
+    required, a sample of every class evaluated in ``evaluation.csv``.
+
+    :param language: language of the resources.
+    :param per_class: number of resources to be taken from every class; 0 for none.
+
+    :return: list of utf-8 encoded resource names, without duplicates.
+    '''
+    resources = []
+    if os.path.isdir('extracted'):
+        for filename in sorted(os.listdir('extracted')):
+            match = EXTRACTED_FILE.match(filename)
+            if match and match.group(2) == language:
+                resources.append(match.group(1))
+
+    if per_class > 0 and os.path.exists('evaluation.csv'):
+        with open('evaluation.csv', 'rb') as eval_file:
+            classes = [row[1] for row in csv.reader(eval_file) if len(row) > 1 and row[0] == language]
+        for res_class in sorted(set(classes)):
+            resources += class_sample(language, res_class, per_class)
+
+    seen = set()
+    return [res for res in resources if not (res in seen or seen.add(res))]
+
+
+def class_sample(language, res_class, num):
+    ''' Asks the DBpedia endpoint for some resources of a class.
+
+    :param language: language of the endpoint.
+    :param res_class: ontology class (e.g. ``Writer``).
+    :param num: number of resources.
+
+    :return: list of utf-8 encoded resource names.
+    '''
+    query = "SELECT DISTINCT (?s AS ?res) WHERE{ ?s a <http://dbpedia.org/ontology/" + res_class + \
+            "> .?s <http://dbpedia.org/ontology/wikiPageID> ?f} LIMIT " + str(num)
+    try:
+        bindings = utilities.sparql_query(query, language)['results']['bindings']
+    except Exception:
+        print 'Could not retrieve the resources of ' + res_class
+        return []
+    return [binding['res']['value'].split("/")[-1].encode('utf-8') for binding in bindings]
+
+
+def record_corpus(directory, language, resources):
+    ''' Fetches the pages of the corpus not recorded yet, and records them in the fixture store.
+
+    :param directory: directory of the fixture store.
+    :param language: language of the pages.
+    :param resources: resources of the corpus.
+
+    :return: number of pages recorded.
+    '''
+    fixtures.start('record', directory)
+    missing = []
+    for res in resources:
+        try:
+            fixtures.store.get('jsonpedia', fixtures.make_key((language, res), {}))
+        except fixtures.FixtureMissing:
+            missing.append(res)
+
+    recorded = 0
+    wikiParser.start_jsonpedia_server()
+    try:
+        for num, res in enumerate(missing):
+            print 'Recording ' + res + ' (' + str(num + 1) + ' of ' + str(len(missing)) + ')'
+            try:
+                for section in wikiParser.jsonpedia_sections(language, res):
+                    pass
+                recorded += 1
+            except Exception as error:
+                print 'Could not record ' + res + ': ' + str(error)
+    finally:
+        wikiParser.stop_jsonpedia_server()
+        fixtures.mode = None
+    return recorded
+
+
+def load_pages(store, language, limit=None):
+    ''' Reads the recorded pages of a language.
+
+    :param store: a ``fixtures.FixtureStore``.
+    :param language: language of the pages.
+    :param limit: maximum number of pages, or ``None`` for all of them.
+
+    :return: list of lists of sections, as returned by ``wikiParser.jsonpedia_sections()``.
+    '''
+    pages = []
+    for args, sections in store.iter_answers('jsonpedia'):
+        if args[0] != language or not sections:
+            continue
+        pages.append(sections)
+        if limit is not None and len(pages) >= limit:
+            break
+    return pages
+
+
+def list_nodes(sections):
+    ''' Collects the list element nodes of a page, outer and nested ones, as given to ``parse_list()``.
+
+    :param sections: sections of the page.
+
+    :return: list of list element nodes.
+    '''
+    nodes = []
+    for section in sections:
+        if section.get('@type') != 'section' or not section.get('content'):
+            continue
+        for val in section['content'].values():
+            if type(val) == dict and val.get('@type') == 'list':
+                nodes += val['content']
+    return nodes
+
+
+def parse_sections(sections):
+    ''' Parses the sections of a page, as ``wikiParser.parse_result()`` does before cleaning the dictionary.
+
+    :param sections: sections of the page.
+
+    :return: dictionary of the lists found in the page.
+    '''
+    parser = wikiParser.SectionParser()
+    lists = {}
+    for section in sections:
+        if '@type' in section and section['@type'] == 'section':
+            lists.update(parser.parse_section(section))
+    return lists
+
+
+def count_items(lists):
+    ''' Counts the list elements (outer and nested) of a dictionary of lists. '''
+    return sum(len(values) for values in lists.values())
+
+
+def time_stage(stage, inputs, repeat, copy=None):
+    ''' Runs a stage on the input of every page, ``repeat`` times, and keeps the fastest run.
+
+    :param stage: function run on the input of a page.
+    :param inputs: inputs of the pages.
+    :param repeat: number of runs.
+    :param copy: if the stage changes its input, function copying the input of a page before every run (the
+                 copies are not timed).
+
+    :return: a tuple ``(seconds, outputs)``, with the time of the fastest run and the outputs of the last one.
+    '''
+    best = None
+    outputs = None
+    for run in range(max(1, repeat)):
+        run_inputs = [copy(page_input) for page_input in inputs] if copy is not None else inputs
+        started = time.time()
+        outputs = [stage(page_input) for page_input in run_inputs]
+        elapsed = time.time() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, outputs
+
+
+def allocated(inputs, outputs):
+    ''' Computes the largest memory allocated by a stage for a single page.
+
+    :param inputs: inputs of the pages.
+    :param outputs: outputs of the stage for the same pages.
+
+    :return: size in bytes.
+    '''
+    peak = 0
+    for page_input, page_output in zip(inputs, outputs):
+        seen = set()
+        memoryBenchmark.deep_size(page_input, seen)  # objects shared with the input were not allocated
+        peak = max(peak, memoryBenchmark.deep_size(page_output, seen))
+    return peak
+
+
+def run_benchmark(pages, language, repeat=3):
+    ''' Runs every stage on the recorded pages.
+
+    :param pages: pages as returned by ``load_pages()``.
+    :param language: language of the pages.
+    :param repeat: number of runs of every stage; the fastest one is kept.
+
+    :return: dict mapping each stage to its figures (``seconds``, ``pages``, ``items``, ``pages_per_sec``,
+             ``items_per_sec``, ``peak_kb``).
+    '''
+    nodes = [list_nodes(sections) for sections in pages]
+    seconds, items = time_stage(lambda page_nodes: [wikiParser.parse_list(node) for node in page_nodes], nodes,
+                                repeat)
+    results = {'parse_list': (seconds, sum(len(page_items) for page_items in items), allocated(nodes, items))}
+
+    seconds, lists = time_stage(parse_sections, pages, repeat)
+    results['parse_section'] = (seconds, sum(count_items(page_lists) for page_lists in lists),
+                                allocated(pages, lists))
+
+    seconds, cleaned = time_stage(lambda page_lists: utilities.clean_dictionary(language, page_lists), lists,
+                                  repeat, dict)
+    results['clean_dictionary'] = (seconds, sum(count_items(page_lists) for page_lists in cleaned),
+                                   allocated(lists, cleaned))
+
+    figures = dict()
+    for stage in STAGES:
+        seconds, items, peak = results[stage]
+        seconds = max(seconds, 1e-6)
+        figures[stage] = {'seconds': round(seconds, 4), 'pages': len(pages), 'items': items,
+                          'pages_per_sec': round(len(pages) / seconds, 1),
+                          'items_per_sec': round(items / seconds, 1), 'peak_kb': round(peak / 1024.0, 1)}
+    return figures
+
+
+def compare(figures, baseline, tolerance):
+    ''' Compares the figures of the current run with a baseline.
+
+    :param figures: figures of every stage, see ``run_benchmark()``.
+    :param baseline: results stored by a previous run (as written by ``main()``).
+    :param tolerance: largest drop of items/sec not reported as a regression, in percent.
+
+    :return: a tuple ``(lines, regressions)``, with a line to be printed for every stage and the names of the
+             stages slower than the baseline.
+    '''
+    lines = []
+    regressions = []
+    for stage in STAGES:
+        old = baseline.get('stages', {}).get(stage)
+        if not old or not old.get('items_per_sec'):
+            lines.append(stage + ': not in the baseline')
+            continue
+        change = 100.0 * (figures[stage]['items_per_sec'] - old['items_per_sec']) / old['items_per_sec']
+        line = stage + ': ' + str(old['items_per_sec']) + ' -> ' + str(figures[stage]['items_per_sec']) + \
+               ' items/sec (' + ('+' if change >= 0 else '') + str(round(change, 1)) + '%)'
+        if change < -tolerance:
+            line += ' REGRESSION'
+            regressions.append(stage)
+        lines.append(line)
+    if baseline.get('pages') != figures[STAGES[0]]['pages']:
+        lines.append('Warning: the baseline was measured on ' + str(baseline.get('pages')) + ' pages')
+    return lines, regressions
+
+
+def main():
+    ''' Entry point: runs the benchmark on a fixture directory.
+
+    :return: void.
+    '''
+    parser = argparse.ArgumentParser(description='Measure the throughput of the parsing stages on recorded '
+                                                 'pages.\nExample: `python parserBenchmark.py fixtures/`',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('fixtures', type=str, help="Directory of a fixture store recorded with listExtractor.py"
+                                                   " --record")
+    parser.add_argument('--language', type=str, default='en', help="Language of the pages to be parsed\n")
+    parser.add_argument('--record', action='store_true',
+                        help="Record the corpus pages missing from the store first (needs JSONpedia)\n")
+    parser.add_argument('--per-class', type=int, default=0,
+                        help="With --record, resources of every class in evaluation.csv added to the corpus\n")
+    parser.add_argument('--limit', type=int, help="Maximum number of pages to be parsed\n")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs of every stage; the fastest one is kept\n")
+    parser.add_argument('--output', type=str, help="JSON file for the results (default: printed only)\n")
+    parser.add_argument('--baseline', type=str,
+                        default=utilities.get_subdirectory('benchmarks', 'parser_baseline.json'),
+                        help="JSON file of the baseline results\n")
+    parser.add_argument('--save-baseline', action='store_true', help="Store the results as the new baseline\n")
+    parser.add_argument('--tolerance', type=float, default=10.0,
+                        help="Drop of items/sec (percent) reported as a regression\n")
+    args = parser.parse_args()
+
+    if args.record:
+        resources = corpus_resources(args.language, args.per_class)
+        print 'Recorded pages:', record_corpus(args.fixtures, args.language, resources), 'of', len(resources)
+
+    path = os.path.join(args.fixtures, 'fixtures.db')
+    if not os.path.exists(path):
+        print 'No fixture store found in ' + args.fixtures
+        sys.exit(1)
+    pages = load_pages(fixtures.FixtureStore(path), args.language, args.limit)
+    if not pages:
+        print 'No recorded ' + args.language + ' pages found in ' + args.fixtures
+        sys.exit(1)
+
+    figures = run_benchmark(pages, args.language, args.repeat)
+    results = {'language': args.language, 'pages': len(pages), 'python': platform.python_version(),
+               'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'stages': figures}
+    for stage in STAGES:
+        stage_figures = figures[stage]
+        print stage + ':', stage_figures['pages_per_sec'], 'pages/sec,', stage_figures['items_per_sec'], \
+            'items/sec,', stage_figures['peak_kb'], 'KB peak per page'
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(results, out_file, indent=2, sort_keys=True)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as baseline_file:
+            lines, regressions = compare(figures, json.load(baseline_file), args.tolerance)
+        print '\nCompared with the baseline:'
+        for line in lines:
+            print line
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print 'Baseline stored in ' + args.baseline
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+###################
+ ParserEquivalence
+###################
+
+* This module compares the native parser (``--parser native``: wikitext from the MediaWiki API converted by
+  ``wikitextParser``) with JSONpedia, on the pages recorded in a fixture store with
+  ``listExtractor.py --record DIR`` (see ``fixtures``). With ``--record`` the wikitext of the recorded pages
+  is fetched first and stored next to their JSONpedia answers.
+
+* For every page, both resource dictionaries are built with ``wikiParser.parse_result()`` and compared: the
+  sections found by a parser only, and the list elements of the common sections that are identical (same
+  text and spans) or equivalent (same text once whitespace is collapsed). The run fails (exit status 1) if
+  less than ``--min-match`` percent of the JSONpedia elements have an equivalent native one.
+
+* The throughput of both backends is compared as well: ``parse_result()`` on the recorded JSONpedia sections,
+  against the wikitext conversion followed by ``parse_result()``. The time taken by the recorded calls
+  (JSONpedia and its Java process, or the MediaWiki API) is reported separately.
+
+* Usage: ``python parserEquivalence.py DIR [--language en] [--record] [--limit N] [--repeat N]
+  [--min-match 90] [--output results.json] [--verbose]``
+
+'''
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import fixtures
+import listItem
+import parserBenchmark
+import wikiParser
+import wikitextParser
+
+MIN_MATCH = 90.0  # default percentage of JSONpedia list elements that must have an equivalent native one
+
+
+def record_wikitext(directory, language):
+    ''' Fetches and records the wikitext of the pages recorded from JSONpedia, if not recorded yet.
+
+    :param directory: directory of the fixture store.
+    :param language: language of the pages.
+
+    :return: number of pages recorded.
+    '''
+    fixtures.start('record', directory)
+    recorded = 0
+    try:
+        for args, sections in fixtures.store.iter_answers('jsonpedia'):
+            if args[0] != language:
+                continue
+            try:
+                fixtures.store.get('wikitext', fixtures.make_key(tuple(args), {}))
+                continue
+            except fixtures.FixtureMissing:
+                pass
+            try:
+                wikiParser.fetch_wikitext(language, args[1].encode('utf-8'))
+                recorded += 1
+            except Exception as error:
+                print 'Could not record the wikitext of ' + args[1] + ': ' + str(error)
+    finally:
+        fixtures.mode = None
+    return recorded
+
+
+def load_pairs(store, language, limit=None):
+    ''' Reads the pages recorded both from JSONpedia and as wikitext.
+
+    :param store: a ``fixtures.FixtureStore``.
+    :param language: language of the pages.
+    :param limit: maximum number of pages, or ``None`` for all of them.
+
+    :return: list of ``(resource, sections, wikitext)`` tuples, plus the mean time of the recorded JSONpedia
+             and MediaWiki API calls.
+    '''
+    pairs = []
+    jsonpedia_time = wikitext_time = 0.0
+    for args, sections in store.iter_answers('jsonpedia'):
+        if args[0] != language or not sections:
+            continue
+        try:
+            jsonpedia_answer, jsonpedia_duration = store.get('jsonpedia', fixtures.make_key(tuple(args), {}))
+            page, wikitext_duration = store.get('wikitext', fixtures.make_key(tuple(args), {}))
+        except fixtures.FixtureMissing:
+            continue
+        if page is None:
+            continue
+        pairs.append((args[1], sections, page['text']))
+        jsonpedia_time += jsonpedia_duration
+        wikitext_time += wikitext_duration
+        if limit is not None and len(pairs) >= limit:
+            break
+    if not pairs:
+        return pairs, 0.0, 0.0
+    return pairs, jsonpedia_time / len(pairs), wikitext_time / len(pairs)
+
+
+def normalize(elem):
+    ''' Collapses the whitespace of a list element, which JSONpedia and the native parser place differently
+    around links and templates.
+
+    :param elem: list element.
+
+    :return: normalized unicode string.
+    '''
+    return re.sub(r'\s+', ' ', unicode(elem)).strip()
+
+
+def flatten(values):
+    ''' Lists the elements of a section, unwrapping nested ones. '''
+    elems = []
+    for val in values:
+        if type(val) in (list, tuple):
+            elems += flatten(val)
+        else:
+            elems.append(val)
+    return elems
+
+
+def compare_dicts(expected, found):
+    ''' Compares the resource dictionaries built from JSONpedia and natively for the same page.
+
+    :param expected: dictionary built from the JSONpedia answer.
+    :param found: dictionary built from the wikitext.
+
+    :return: dict with the counters of the comparison (``sections``, ``missing_sections``, ``extra_sections``,
+             ``elems``, ``identical``, ``equivalent``) and the ``missing`` and ``extra`` section titles.
+    '''
+    counts = {'sections': len(expected), 'missing': sorted(set(expected) - set(found)),
+              'extra': sorted(set(found) - set(expected)), 'elems': 0, 'identical': 0, 'equivalent': 0}
+    counts['missing_sections'] = len(counts['missing'])
+    counts['extra_sections'] = len(counts['extra'])
+    for title, values in expected.items():
+        expected_elems = flatten(values)
+        counts['elems'] += len(expected_elems)
+        if title not in found:
+            continue
+        identical = dict()
+        equivalent = dict()
+        for elem in flatten(found[title]):
+            key = (unicode(elem), listItem.get_spans(elem))
+            identical[key] = identical.get(key, 0) + 1
+            equivalent[normalize(elem)] = equivalent.get(normalize(elem), 0) + 1
+        for elem in expected_elems:
+            key = (unicode(elem), listItem.get_spans(elem))
+            if identical.get(key):
+                identical[key] -= 1
+                counts['identical'] += 1
+            if equivalent.get(normalize(elem)):
+                equivalent[normalize(elem)] -= 1
+                counts['equivalent'] += 1
+    return counts
+
+
+def run_comparison(pairs, language, repeat=3, verbose=False):
+    ''' Compares both parsers on every recorded page, and times them.
+
+    :param pairs: pages as returned by ``load_pairs()``.
+    :param language: language of the pages.
+    :param repeat: number of runs of every backend; the fastest one is kept.
+    :param verbose: print the sections found by a single parser, for every page.
+
+    :return: dict with the totals of ``compare_dicts()`` and the throughput of both backends.
+    '''
+    totals = dict((key, 0) for key in ['sections', 'missing_sections', 'extra_sections', 'elems', 'identical',
+                                       'equivalent'])
+    parse_jsonpedia = lambda page: wikiParser.parse_result(language, page[0], page[1], follow_redirects=False)
+    parse_native = lambda page: wikiParser.parse_result(language, page[0], wikitextParser.parse_wikitext(page[2]),
+                                                        follow_redirects=False)
+    jsonpedia_seconds, expected = parserBenchmark.time_stage(parse_jsonpedia, pairs, repeat)
+    native_seconds, found = parserBenchmark.time_stage(parse_native, pairs, repeat)
+
+    for page, expected_dict, found_dict in zip(pairs, expected, found):
+        counts = compare_dicts(expected_dict, found_dict)
+        for key in totals:
+            totals[key] += counts[key]
+        if verbose and (counts['missing'] or counts['extra']):
+            print page[0] + ':'
+            for title in counts['missing']:
+                print '  only JSONpedia: ' + title
+            for title in counts['extra']:
+                print '  only native: ' + title
+
+    items = sum(parserBenchmark.count_items(res_dict) for res_dict in expected)
+    for name, seconds in [('jsonpedia', jsonpedia_seconds), ('native', native_seconds)]:
+        seconds = max(seconds, 1e-6)
+        totals[name] = {'seconds': round(seconds, 4), 'pages_per_sec': round(len(pairs) / seconds, 1),
+                        'items_per_sec': round(items / seconds, 1)}
+    return totals
+
+
+def main():
+    ''' Entry point: compares the parsers on a fixture directory.
+
+    :return: void.
+    '''
+    parser = argparse.ArgumentParser(description='Compare the native wikitext parser with JSONpedia on recorded '
+                                                 'pages.\nExample: `python parserEquivalence.py fixtures/`',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('fixtures', type=str, help="Directory of a fixture store recorded with listExtractor.py"
+                                                   " --record")
+    parser.add_argument('--language', type=str, default='en', help="Language of the pages to be compared\n")
+    parser.add_argument('--record', action='store_true',
+                        help="Record the wikitext of the recorded pages first (needs the MediaWiki API)\n")
+    parser.add_argument('--limit', type=int, help="Maximum number of pages to be compared\n")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs of every parser; the fastest one is kept\n")
+    parser.add_argument('--min-match', type=float, default=MIN_MATCH,
+                        help="Percentage of JSONpedia list elements that must have an equivalent native one\n")
+    parser.add_argument('--output', type=str, help="JSON file for the results (default: printed only)\n")
+    parser.add_argument('--verbose', action='store_true', help="Print the sections found by a single parser\n")
+    args = parser.parse_args()
+
+    path = os.path.join(args.fixtures, 'fixtures.db')
+    if not os.path.exists(path):
+        print 'No fixture store found in ' + args.fixtures
+        sys.exit(1)
+    if args.record:
+        print 'Recorded pages:', record_wikitext(args.fixtures, args.language)
+
+    pairs, jsonpedia_call, wikitext_call = load_pairs(fixtures.FixtureStore(path), args.language, args.limit)
+    if not pairs:
+        print 'No ' + args.language + ' pages recorded both from JSONpedia and as wikitext in ' + args.fixtures
+        sys.exit(1)
+    totals = run_comparison(pairs, args.language, args.repeat, args.verbose)
+    totals['pages'] = len(pairs)
+    totals['jsonpedia']['recorded_call'] = round(jsonpedia_call, 4)
+    totals['native']['recorded_call'] = round(wikitext_call, 4)
+
+    elems = max(totals['elems'], 1)
+    match = 100.0 * totals['equivalent'] / elems
+    print 'Pages compared:', len(pairs)
+    print 'Sections:', totals['sections'], '(' + str(totals['missing_sections']), 'only JSONpedia,', \
+        totals['extra_sections'], 'only native)'
+    print 'List elements:', totals['elems'], '(' + str(round(100.0 * totals['identical'] / elems, 1)) + \
+        '% identical, ' + str(round(match, 1)) + '% equivalent)'
+    for name in ['jsonpedia', 'native']:
+        print name + ':', totals[name]['pages_per_sec'], 'pages/sec,', totals[name]['items_per_sec'], \
+            'items/sec, recorded call', str(totals[name]['recorded_call']) + 's per page'
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(totals, out_file, indent=2, sort_keys=True)
+    if match < args.min_match:
+        print 'Equivalence below ' + str(args.min_match) + '%'
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,538 @@
+# -*- coding: utf-8 -*-
+
+'''
+##########
+ Pipeline
+##########
+
+* This module runs the extraction of a whole class of resources (``collect_mode="a"``) as a set of concurrent
+  stages connected by bounded queues, so that pages are fetched and parsed while others are mapped:
+
+    * **fetch**: ``fetch_workers`` threads obtaining the sections of the pages (JSONpedia or local dump) and
+      building the resource dictionaries with ``wikiParser`` while the sections are read, with a
+      ``SectionParser`` for every page: only the lists of a page are held, never the whole page.
+    * **map**: ``map_workers`` threads running ``mapper.select_mapping()``, each on a graph of its own, so that
+      the blocking Wikidata and SPARQL reconciliation calls of different resources overlap.
+    * **write**: the calling thread, which merges every resource graph into the final one and keeps the
+      evaluation counters.
+
+* Queues are bounded by ``queue_size``, so a slow stage slows down the ones before it instead of letting
+  parsed pages pile up in memory. The depth of every queue is printed with the progress of the run.
+
+* With ``--fetch batch`` or ``--dump-scan`` pages are fetched and parsed by a single producer, which feeds
+  the mapping stage directly.
+
+* The writer holds the mapped resources back until their ``owl:sameAs`` lookups (see ``mapper.SameAsBatch``)
+  add up to a full ``VALUES`` query, or ``SAMEAS_WINDOW`` resources are waiting, and resolves them together
+  before merging their graphs: pages with only a few links each share the queries.
+
+* Sections with more than ``chunk_size`` list elements (e.g. the discography of a prolific artist) are split
+  in chunks, mapped by the mapping workers as independent jobs; the writer merges the graphs of all the
+  parts of a resource before handling it. Nested elements stay in the chunk of the element they belong to,
+  and every chunk is mapped under the title of its section.
+
+* Threads share a single core for the pure-Python parsing and mapping work, so ``run_workers()`` can also
+  split the resources across ``--workers`` processes, each running its own pipeline on its shard and
+  writing a partial graph; partial graphs and counters are merged at the end.
+
+'''
+
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import multiprocessing
+import Queue
+
+import rdflib
+
+import wikiParser
+import mapper
+import listItem
+import utilities
+import pageCache
+import runState
+import sectionMemo
+import httpClient
+
+DONE = object()  # sentinel sent by every worker of a stage once it has finished
+CHUNK_SIZE = 500  # default maximum number of list elements of a section mapped as a single job
+SAMEAS_WINDOW = 50  # mapped resources waiting at most for their owl:sameAs lookups to be resolved together
+
+
+class Pipeline(object):
+    ''' Staged extraction of a list of resources of the same class. '''
+
+    def __init__(self, language, res_class, fetch='server', batch_size=1000, fetch_workers=1, map_workers=1,
+                 queue_size=100, chunk_size=CHUNK_SIZE):
+        '''
+        :param language: language of the resources.
+        :param res_class: class of the resources (e.g. ``Writer``), used to select the mappings.
+        :param fetch: fetch strategy, see ``parse_resources()``.
+        :param batch_size: number of resources handled by a single wrapper invocation in ``batch`` mode.
+        :param fetch_workers: number of concurrent fetch threads.
+        :param map_workers: number of concurrent mapping threads.
+        :param queue_size: maximum number of items waiting between two stages.
+        :param chunk_size: maximum number of list elements of a section mapped as a single job; 0 not to split
+                           sections.
+        '''
+        self.language = language
+        self.res_class = res_class
+        self.fetch = fetch
+        self.batch_size = batch_size
+        self.fetch_workers = max(1, fetch_workers)
+        self.map_workers = max(1, map_workers)
+        self.chunk_size = chunk_size
+        self.queues = [('fetch', Queue.Queue(queue_size)), ('map', Queue.Queue(queue_size)),
+                       ('write', Queue.Queue(queue_size))]
+        self.fetch_q, self.map_q, self.write_q = [q for name, q in self.queues]
+        self.lock = threading.Lock()
+        self.fetching = self.fetch_workers  # fetch workers still running; the last one stops the mapping stage
+        self.peak = dict((name, 0) for name, q in self.queues)
+        self.error = None  # first exception raised by a worker, re-raised by run()
+        self.res_num = 0  # resources handled by the writer, known at the end of the run if they were streamed
+
+    def run(self, resources, g):
+        ''' Extracts the lists of every resource and adds the resulting triples to ``g``.
+
+        :param resources: list of resource names, or an iterable enumerating them while the run goes on (e.g.
+                          ``utilities.iter_resources()``).
+        :param g: RDF graph to be filled.
+
+        :return: a tuple ``(res_failed, tot_extracted_elems, tot_elems)``.
+        '''
+        if len(mapper.MAPPING) == 0:  # load the mapping rules once, before the mapping threads share them
+            mapper.MAPPING = utilities.load_settings()
+            mapper.CUSTOM_MAPPERS = utilities.load_custom_mappers()
+        if any(domain in mapper.GRAPH_DEPENDENT for domain in mapper.MAPPING.get(self.res_class, [])):
+            self.chunk_size = 0  # these mappers need the triples of the whole resource
+
+        section_filter = wikiParser.section_filter
+        skipped = section_filter.elems if section_filter is not None else 0  # before any page is parsed
+        if self.fetch in ('batch', 'scan'):
+            threads = [threading.Thread(target=self.produce, args=(resources,))]
+        else:
+            threads = [threading.Thread(target=self.feed, args=(resources,))]
+            threads += [threading.Thread(target=self.fetch_stage) for num in range(self.fetch_workers)]
+        threads += [threading.Thread(target=self.map_stage) for num in range(self.map_workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        res_num = len(resources) if hasattr(resources, '__len__') else None
+        res_failed, tot_extracted_elems, tot_elems = self.write_stage(g, res_num)
+        for thread in threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        print 'Peak queue depths: ' + self.depths(self.peak)
+        if section_filter is not None:  # elements of the sections not parsed still count as found
+            tot_elems += section_filter.elems - skipped
+        return res_failed, tot_extracted_elems, tot_elems
+
+    def fail(self):
+        ''' Records the exception being handled by a worker; from now on the stages only forward their
+        sentinels, so that the run stops quickly.
+
+        :return: void.
+        '''
+        if self.error is None:
+            self.error = sys.exc_info()
+
+    def feed(self, resources):
+        ''' Puts every resource in the fetch queue, followed by one sentinel for each fetch worker. '''
+        try:
+            for res in resources:
+                if self.error is not None:
+                    break
+                self.fetch_q.put(res)
+        except BaseException:
+            self.fail()
+        for num in range(self.fetch_workers):
+            self.fetch_q.put(DONE)
+
+    def fetch_stage(self):
+        ''' Fetch worker: obtains the sections of the resources in the fetch queue and builds their
+        dictionaries, parsing every section as soon as it is read (see ``wikiParser.parse_result()``). Parsing
+        is pure-Python work, sharing a single core with the other threads; see ``run_workers()`` to use more
+        cores.
+        '''
+        for res in iter(self.fetch_q.get, DONE):
+            if self.error is not None:
+                continue
+            try:
+                resDict = wikiParser.parse_result(self.language, res, wikiParser.fetch_sections(self.language, res),
+                                                  follow_redirects=wikiParser.uses_jsonpedia())
+            except KeyboardInterrupt:
+                self.fail()
+                continue
+            except:  #handle fetching errors, or no dict found; the resource will be reported as not parsed
+                resDict = None
+            self.schedule(res, resDict)
+        with self.lock:
+            self.fetching -= 1
+            last = self.fetching == 0
+        if last:
+            for num in range(self.map_workers):
+                self.map_q.put(DONE)
+
+    def produce(self, resources):
+        ''' Fetches and parses every resource in a single thread (``batch`` and ``scan`` strategies, which
+        handle many resources at once), feeding the mapping stage directly.
+        '''
+        try:
+            for res, resDict in parse_resources(self.language, resources, self.fetch, self.batch_size):
+                if self.error is not None:
+                    break
+                self.schedule(res, resDict)
+        except BaseException:
+            self.fail()
+        for num in range(self.map_workers):
+            self.map_q.put(DONE)
+
+    def schedule(self, res, resDict):
+        ''' Sends a parsed resource to the mapping workers, as a single job or, if it has oversized sections,
+        as one job for each part (see ``split_resource()``).
+
+        :param res: resource name.
+        :param resDict: resource dictionary, or ``None`` if the resource could not be parsed.
+
+        :return: void.
+        '''
+        if resDict is None:
+            self.map_q.put((res, None, None, 1))
+            return
+        parts = split_resource(resDict, self.chunk_size)
+        for part in parts:
+            self.map_q.put((res, resDict, part, len(parts)))
+
+    def map_stage(self):
+        ''' Mapping worker: maps every parsed resource (or part of it) on graphs of its own. '''
+        for res, resDict, part, parts in iter(self.map_q.get, DONE):
+            if self.error is not None:
+                continue
+            mapped = None
+            batch = mapper.SameAsBatch(self.language)  # resolved by the writer, see write_stage()
+            if part is not None:
+                try:
+                    mapped = self.map_part(res, part, batch)
+                except BaseException:  # e.g. sys.exit() on a missing mapping rule
+                    self.fail()
+                    continue
+            self.write_q.put((res, resDict, mapped, parts, batch))
+        self.write_q.put(DONE)
+
+    def map_part(self, res, part, batch):
+        ''' Maps a resource dictionary, or a part of it made of a single chunk. Each domain maps a chunk on a
+        graph of its own, so that the writer can tell which domains failed on which chunks.
+
+        :param res: resource name.
+        :param part: resource dictionary, or part of it (see ``split_resource()``).
+        :param batch: ``mapper.SameAsBatch`` collecting the Wikidata URIs found, left unresolved.
+
+        :return: list of ``(key, graph, extracted elements, failed)`` tuples, where ``key`` is ``None`` for a
+                 whole dictionary and ``(section title, domain, chunk index)`` for a chunk.
+        '''
+        chunk_index = None
+        if len(part) == 1:
+            title, values = part.items()[0]
+            chunk_index = getattr(values, 'chunk_index', None)
+        if chunk_index is None:
+            res_graph = rdflib.Graph()
+            extr_elems = mapper.select_mapping(part, res, self.language, self.res_class, res_graph,
+                                               domains_mapped=[], sameas_batch=batch)
+            return [(None, res_graph, extr_elems, False)]
+
+        mapped = []
+        domains = mapper.MAPPING.get(self.res_class, [])
+        for domain in domains:
+            res_graph = rdflib.Graph()
+            failed = []
+            extr_elems = mapper.select_mapping(part, res, self.language, self.res_class, res_graph,
+                                               domains_mapped=[other for other in domains if other != domain],
+                                               failed=failed, sameas_batch=batch)
+            mapped.append(((title, domain, chunk_index), res_graph, extr_elems, len(failed) > 0))
+        return mapped
+
+    def write_stage(self, g, res_num):
+        ''' Writer: merges the graph of every mapped resource into ``g``, printing the progress of the run. The
+        ``owl:sameAs`` lookups of the mapped resources are resolved together, see ``write_window()``.
+
+        :param g: RDF graph to be filled.
+        :param res_num: total number of resources, for the progress; ``None`` if not known yet.
+
+        :return: a tuple ``(res_failed, tot_extracted_elems, tot_elems)``.
+        '''
+        res_failed = 0
+        tot_extracted_elems = 0
+        tot_elems = 0
+        curr_num = 1
+        pending = dict()  # resource -> [parts still to be mapped, mapped parts, SameAsBatch of the parts]
+        window = mapper.SameAsBatch(self.language)  # owl:sameAs lookups of the resources waiting to be written
+        waiting = []  # (resource, graph, extracted elements) of the mapped resources waiting to be written
+        running = self.map_workers
+        while running:
+            item = self.write_q.get()
+            if item is DONE:
+                running -= 1
+                continue
+            res, resDict, mapped, parts, batch = item
+            res_graph = None
+            extr_elems = 0
+            if mapped is not None and parts == 1 and mapped[0][0] is None:
+                res_graph, extr_elems = mapped[0][1], mapped[0][2]
+            elif mapped is not None:  # merge the parts of a resource whose sections were split
+                merging = pending.setdefault(res, [parts, [], mapper.SameAsBatch(self.language)])
+                merging[0] -= 1
+                merging[1] += mapped
+                merging[2].extend(batch)
+                if merging[0] > 0:
+                    continue
+                del pending[res]
+                res_graph, extr_elems = merge_parts(merging[1])
+                batch = merging[2]
+            depths = dict((name, q.qsize()) for name, q in self.queues)
+            for name in depths:
+                self.peak[name] = max(self.peak[name], depths[name])
+            print(res + " (" + str(curr_num) + " of " + (str(res_num) if res_num is not None else "?") +
+                  ") [queues: " + self.depths(depths) + "]")
+            self.res_num = curr_num
+            curr_num += 1
+            if resDict is None:
+                print("Could not parse " + self.language + ":" + res)
+                res_failed += 1
+                continue
+
+            tot_elems += utilities.count_listelem_dict(resDict)
+            tot_extracted_elems += extr_elems
+            window.extend(batch)
+            waiting.append((res, res_graph, extr_elems))
+            if len(window.uris) >= mapper.SAMEAS_BATCH or len(waiting) >= SAMEAS_WINDOW:
+                self.write_window(g, window, waiting)
+                window = mapper.SameAsBatch(self.language)
+                waiting = []
+        if waiting and self.error is None:
+            self.write_window(g, window, waiting)
+        return res_failed, tot_extracted_elems, tot_elems
+
+    def write_window(self, g, window, waiting):
+        ''' Resolves the ``owl:sameAs`` lookups of the mapped resources waiting to be written, with a few batched
+        queries for all of them, then merges their graphs into ``g``.
+
+        :param g: RDF graph to be filled.
+        :param window: ``mapper.SameAsBatch`` holding the lookups of the waiting resources.
+        :param waiting: list of ``(resource, graph, extracted elements)`` tuples.
+
+        :return: void.
+        '''
+        window.resolve(*[res_graph for res, res_graph, extr_elems in waiting])
+        for res, res_graph, extr_elems in waiting:
+            for triple in res_graph:
+                g.add(triple)
+            if runState.state is not None:  # --delta: remember the revision extracted and its triples
+                runState.state.put(self.language, self.res_class, res, wikiParser.page_revisions.get(res), res_graph)
+            print(">>> Mapped " + self.language + ":" + res + ", extracted elements: " + str(extr_elems) + "  <<<\n")
+
+    def depths(self, depths):
+        ''' Formats the depth of every queue, e.g. ``fetch 3, map 1, write 0``. '''
+        return ', '.join(name + ' ' + str(depths[name]) for name, q in self.queues)
+
+
+def merge_parts(mapped):
+    ''' Merges the graphs mapped from the parts of a resource. The chunks of a section are handled as if the
+    section had been mapped as a whole: when a domain fails on a chunk, its later chunks are left out (as the
+    rest of a section is skipped after an exception) and none of its elements are counted.
+
+    :param mapped: ``(key, graph, extracted elements, failed)`` tuples, see ``Pipeline.map_part()``.
+
+    :return: a tuple ``(graph, extracted elements)``.
+    '''
+    stopped = dict()  # (section title, domain) -> index of the first chunk on which the domain failed
+    for key, part_graph, part_elems, failed in mapped:
+        if key is not None and failed:
+            stopped[key[:2]] = min(stopped.get(key[:2], key[2]), key[2])
+    res_graph = rdflib.Graph()
+    extr_elems = 0
+    for key, part_graph, part_elems, failed in mapped:
+        if key is not None and key[:2] in stopped:
+            if key[2] > stopped[key[:2]]:
+                continue
+            part_elems = 0
+        for triple in part_graph:
+            res_graph.add(triple)
+        extr_elems += part_elems
+    return res_graph, extr_elems
+
+
+def split_resource(resDict, chunk_size):
+    ''' Splits the oversized sections of a resource dictionary in chunks of at most ``chunk_size`` list
+    elements, so that they can be mapped independently. Nested elements are kept in the chunk of the element
+    they belong to.
+
+    :param resDict: resource dictionary.
+    :param chunk_size: maximum number of list elements of a chunk; 0 not to split sections.
+
+    :return: list of dictionaries with the same section titles as keys: the sections that were not split,
+             then one dictionary for every chunk (a ``listItem.SectionChunk``). Just ``[resDict]`` if no section
+             is oversized.
+    '''
+    if not chunk_size or all(len(values) <= chunk_size for values in resDict.values()):
+        return [resDict]
+    parts = [dict()]
+    for title, values in resDict.items():
+        if len(values) <= chunk_size:
+            parts[0][title] = values
+            continue
+        for index, chunk in enumerate(chunk_section(values, chunk_size)):
+            parts.append({title: listItem.SectionChunk(chunk, index)})
+    if not parts[0]:
+        parts.pop(0)
+    return parts
+
+
+def chunk_section(values, chunk_size):
+    ''' Splits the list elements of a section in chunks. A chunk may hold a few more than ``chunk_size``
+    elements, since a new chunk only starts at an element of the outer list.
+
+    :param values: list elements of the section; nested elements are one-element tuples.
+    :param chunk_size: maximum number of list elements of a chunk.
+
+    :return: yields lists of list elements.
+    '''
+    chunk = []
+    for elem in values:
+        if len(chunk) >= chunk_size and type(elem) not in (list, tuple):
+            yield chunk
+            chunk = []
+        chunk.append(elem)
+    if chunk:
+        yield chunk
+
+
+def parse_resources(language, resources, fetch, batch_size):
+    ''' Parses every resource of a class with the selected ``JSONpedia wrapper`` strategy.
+
+    :param language: language of the resources.
+    :param resources: an iterable of resource names.
+    :param fetch: ``server``, ``spawn`` or ``batch`` (see ``listExtractor``); ``dump`` or ``scan`` to read pages
+                  from the local dump, seeking each of them or scanning the whole dump.
+    :param batch_size: number of resources handled by a single wrapper invocation in ``batch`` mode.
+
+    :return: yields ``(resource, resDict)`` pairs; ``resDict`` is ``None`` if the resource could not be parsed.
+    '''
+    if fetch == 'batch':
+        for res, resDict in wikiParser.main_parser_batch(language, resources, batch_size):
+            yield res, resDict
+        return
+    if fetch == 'scan':
+        for res, resDict in wikiParser.main_parser_dump_scan(language, resources):
+            yield res, resDict
+        return
+
+    for res in resources:
+        try:
+            resDict = wikiParser.main_parser(language, res)  # create a dict representing each resource
+        except:  #handle parsing errors; no dict found or no relevant sections found
+            resDict = None
+        yield res, resDict
+
+
+def run_workers(args, resources, g):
+    ''' Splits the resources across ``args.workers`` processes, each extracting its shard with a pipeline of
+    its own (with its own JSONpedia wrappers), and merges their partial graphs and counters.
+
+    :param args: parsed command-line arguments of ``listExtractor``.
+    :param resources: list of resource names.
+    :param g: RDF graph to be filled.
+
+    :return: a tuple ``(res_failed, tot_extracted_elems, tot_elems)``, as ``Pipeline.run()``.
+    '''
+    if len(mapper.MAPPING) == 0:  # load the mapping rules once, every worker inherits them
+        mapper.MAPPING = utilities.load_settings()
+        mapper.CUSTOM_MAPPERS = utilities.load_custom_mappers()
+    if wikiParser.page_cache is not None:  # SQLite connections must not be shared with forked processes
+        wikiParser.page_cache.close()
+
+    # interleaved shards, so that every worker gets a similar mix of (alphabetically sorted) resources
+    shard_dir = tempfile.mkdtemp(prefix='listextractor_')
+    jobs = [(args, resources[num::args.workers], os.path.join(shard_dir, str(num) + '.nt'))
+            for num in range(args.workers)]
+    pool = multiprocessing.Pool(args.workers)
+    try:
+        # map_async().get() with a timeout can be interrupted by Ctrl+C, unlike map()
+        results = pool.map_async(extract_shard, jobs).get(sys.maxint)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    try:
+        for args, shard, shard_path in jobs:  # merge partial graphs
+            g.parse(shard_path, format='nt')
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    if wikiParser.page_cache is not None:
+        wikiParser.page_cache = pageCache.open_cache(args.cache, args.cache_size, args.cache_ttl)
+        wikiParser.page_cache.hits = sum(result[3] for result in results)
+        wikiParser.page_cache.misses = sum(result[4] for result in results)
+    if wikiParser.section_filter is not None:
+        wikiParser.section_filter.sections = sum(result[5] for result in results)
+        wikiParser.section_filter.size = sum(result[6] for result in results)
+        wikiParser.section_filter.elems = sum(result[7] for result in results)
+    if sectionMemo.memo is not None:
+        sectionMemo.memo.hits = sum(result[8] for result in results)
+        sectionMemo.memo.misses = sum(result[9] for result in results)
+    client = httpClient.get_client()  # requests made by the workers, added to the ones of this process
+    client.requests += sum(result[10] for result in results)
+    client.connections += sum(result[11] for result in results)
+    if utilities.sparql_cache is not None:
+        utilities.sparql_cache.hits += sum(result[12] for result in results)
+        utilities.sparql_cache.misses += sum(result[13] for result in results)
+    return tuple(sum(result[num] for result in results) for num in range(3))
+
+
+def extract_shard(job):
+    ''' Worker process of ``run_workers()``: extracts a shard of resources and writes its partial graph.
+
+    :param job: a tuple ``(args, resources, shard_path)``, where ``shard_path`` is the N-Triples file to be
+                written.
+
+    :return: a tuple ``(res_failed, tot_extracted_elems, tot_elems, cache_hits, cache_misses, skipped_sections,
+             skipped_size, skipped_elems, memo_hits, memo_misses, http_requests, http_connections,
+             sparql_hits, sparql_misses)``.
+    '''
+    args, resources, shard_path = job
+    if wikiParser.page_cache is not None:
+        wikiParser.page_cache = pageCache.open_cache(args.cache, args.cache_size, args.cache_ttl)
+    if wikiParser.wiki_dump is not None:
+        wikiParser.wiki_dump.index = None  # reopen the dump index in this process
+    if args.fetch == 'server':
+        wikiParser.start_jsonpedia_server(args.fetch_workers)
+    shard_graph = rdflib.Graph()
+    try:
+        extraction = Pipeline(args.language, args.source, args.fetch, args.batch_size, args.fetch_workers,
+                              args.map_workers, args.queue_size, args.chunk_size)
+        result = extraction.run(resources, shard_graph)
+    finally:
+        wikiParser.stop_jsonpedia_server()
+    shard_graph.serialize(shard_path, format='nt')
+
+    hits = misses = 0
+    if wikiParser.page_cache is not None:
+        hits, misses = wikiParser.page_cache.hits, wikiParser.page_cache.misses
+        wikiParser.page_cache.close()
+    skipped = (0, 0, 0)
+    if wikiParser.section_filter is not None:
+        section_filter = wikiParser.section_filter
+        skipped = (section_filter.sections, section_filter.size, section_filter.elems)
+    memo = (0, 0)
+    if sectionMemo.memo is not None:
+        memo = (sectionMemo.memo.hits, sectionMemo.memo.misses)
+    sparql = (0, 0)
+    if utilities.sparql_cache is not None:
+        sparql = utilities.sparql_cache.stats()
+    return result + (hits, misses) + skipped + memo + httpClient.get_client().stats() + sparql
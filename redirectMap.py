@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+##############
+ RedirectMap
+##############
+
+* This module builds and loads a local map of Wikipedia redirects (``resource -> target resource``), so that
+  ``wikiParser`` can resolve a redirected resource name with a dictionary lookup before fetching the page,
+  instead of asking JSONpedia again.
+
+* DBpedia resource names come from an older Wikipedia snapshot, so pages renamed since then are reached
+  through a redirect. The map is built from the redirect pages of a local multistream dump (see ``wikiDump``)
+  and stored as a gzipped, tab separated file in the ``redirects`` subdirectory, one file per language.
+
+* Usage: ``python redirectMap.py enwiki-latest-pages-articles-multistream.xml.bz2 en``
+
+'''
+
+import argparse
+import gzip
+import os
+
+import utilities
+import wikiDump
+
+
+def map_path(lang):
+    ''' Returns the path of the redirect map for a language.
+
+    :param lang: language of the map.
+
+    :return: path of the ``redirects/<lang>.tsv.gz`` file.
+    '''
+    return utilities.get_subdirectory('redirects', lang + '.tsv.gz')
+
+
+def build_redirect_map(dump, out_path):
+    ''' Scans a whole dump and writes every redirect it contains in a compact on-disk file.
+
+    :param dump: a ``wikiDump.MultistreamDump``.
+    :param out_path: path of the ``.tsv.gz`` file to be written.
+
+    :return: number of redirects written.
+    '''
+    count = 0
+    out_file = gzip.open(out_path, 'wb')
+    try:
+        for page in dump.iter_pages():
+            if page['redirect']:
+                target = page['redirect'].split('#', 1)[0]  # redirects to a section point to the whole page
+                out_file.write(wikiDump.resource_name(page['title']) + '\t' + wikiDump.resource_name(target) + '\n')
+                count += 1
+    finally:
+        out_file.close()
+    return count
+
+
+def load_redirect_map(path):
+    ''' Loads a redirect map written by ``build_redirect_map()``.
+
+    :param path: path of the ``.tsv.gz`` file.
+
+    :return: dict mapping utf-8 encoded resource names to their redirect targets.
+    '''
+    redirects = dict()
+    in_file = gzip.open(path, 'rb')
+    try:
+        for line in in_file:
+            source, target = line.rstrip('\n').split('\t', 1)
+            redirects[source] = target
+    finally:
+        in_file.close()
+    return redirects
+
+
+def load_default_map(lang):
+    ''' Loads the redirect map of a language from the ``redirects`` subdirectory, if it has been built.
+
+    :param lang: language of the map.
+
+    :return: the redirect dict, empty if there is no map for this language.
+    '''
+    path = map_path(lang)
+    if not os.path.exists(path):
+        return dict()
+    return load_redirect_map(path)
+
+
+def main():
+    ''' Entry point: builds the redirect map of a language from a local multistream dump.
+
+    :return: void.
+    '''
+    parser = argparse.ArgumentParser(description='Build a local map of Wikipedia redirects from a dump.'
+                                                 '\nExample: `python redirectMap.py enwiki-latest-pages-articles-'
+                                                 'multistream.xml.bz2 en`',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('dump', type=str, help="Path of the pages-articles-multistream.xml.bz2 dump")
+    parser.add_argument('language', type=str, help="Language of the dump (e.g. en, it, de)")
+    args = parser.parse_args()
+
+    out_path = map_path(args.language)
+    print 'Scanning dump for redirects, please wait......'
+    count = build_redirect_map(wikiDump.MultistreamDump(args.dump), out_path)
+    print str(count) + ' redirects written in ' + out_path
+
+
+if __name__ == "__main__":
+    main()
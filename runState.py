@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+'''
+###########
+ Run State
+###########
+
+* This module keeps the state of the class runs made in ``--delta`` mode (see ``listExtractor``): for every
+  resource, the revision of its page that was extracted and the triples it produced, so that the next run only
+  fetches and parses the pages edited in the meantime.
+
+* Current revisions are asked to the MediaWiki API in bulk (``REVISION_BATCH`` titles per request), or read
+  from the local dump if one is used. A page is extracted again if its revision changed, if its revision is
+  not known, or if the mapping rules (``settings.json``, ``custom_mappers.json``, ``mapping_rules.py``) or
+  the code parsing and mapping the lists (``wikiParser.py``, ``listItem.py``, ``mapper.py``) changed since it
+  was extracted.
+
+* At the end of a delta run, the triples of the pages not extracted again are read back from the state, so
+  that the full dataset is still written, and the triples added and removed since the previous run are written
+  next to it, in N-Triples files ending with ``_added.nt`` and ``_removed.nt``.
+
+* The state is a SQLite file (``state/runs.db``); it can be shared by the processes forked by ``--workers``.
+
+'''
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import urllib
+import zlib
+
+import fixtures
+import mapping_rules
+import utilities
+import wikiParser
+
+REVISION_BATCH = 50  # maximum number of titles in a single MediaWiki API request
+LOAD_BATCH = 500  # number of resources whose stored triples are parsed at once
+CODE_FILES = ['wikiParser.py', 'listItem.py', 'mapper.py']  # code whose changes make every page be extracted again
+
+state = None  # RunState used by the current run, in --delta mode
+
+
+class RunState(object):
+    ''' SQLite store of the revision and triples of every extracted resource. '''
+
+    def __init__(self, path, rules):
+        '''
+        :param path: path of the SQLite file.
+        :param rules: signature of the mapping rules in use, see ``rules_signature()``.
+        '''
+        self.path = path
+        self.rules = rules
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def connect(self):
+        ''' Returns the connection of the current process, opening it if needed (a connection must not be
+        used across a fork). Must be called holding the lock.
+
+        :return: a SQLite connection.
+        '''
+        if self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self.conn.text_factory = str
+            self.conn.execute("CREATE TABLE IF NOT EXISTS resources (lang TEXT, class TEXT, resource TEXT, "
+                              "revision INTEGER, rules TEXT, updated REAL, triples BLOB, "
+                              "PRIMARY KEY (lang, class, resource))")
+            self.conn.commit()
+            self.pid = os.getpid()
+        return self.conn
+
+    def plan(self, lang, res_class, resources, revisions):
+        ''' Selects the resources to be extracted again.
+
+        :param lang: language of the resources.
+        :param res_class: class of the resources.
+        :param resources: current resources of the class.
+        :param revisions: dict mapping resource names to their current revision (``None`` if unknown).
+
+        :return: a tuple ``(changed, removed)``: resources to be extracted again, and resources extracted in a
+                 previous run that are not in the class any more.
+        '''
+        with self.lock:
+            rows = self.connect().execute("SELECT resource, revision, rules FROM resources WHERE lang = ? AND "
+                                          "class = ?", (lang, res_class)).fetchall()
+        stored = dict((res, (revision, rules)) for res, revision, rules in rows)
+        changed = []
+        for res in resources:
+            revision = revisions.get(res)
+            if revision is None or stored.get(res) != (revision, self.rules):
+                changed.append(res)
+        current = set(resources)
+        removed = [res for res in stored if res not in current]
+        return changed, removed
+
+    def put(self, lang, res_class, resource, revision, graph):
+        ''' Stores the triples extracted from a resource.
+
+        :param lang: language of the resource.
+        :param res_class: class of the resource.
+        :param resource: name of the resource.
+        :param revision: revision of the page that was extracted, if known.
+        :param graph: RDF graph of the resource.
+
+        :return: void.
+        '''
+        lines = sorted(set(line for line in graph.serialize(format='nt').splitlines() if line.strip()))
+        data = zlib.compress('\n'.join(lines))
+        with self.lock:
+            conn = self.connect()
+            conn.execute("INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (lang, res_class, resource, revision, self.rules, time.time(), sqlite3.Binary(data)))
+            conn.commit()
+
+    def triples(self, lang, res_class, resources):
+        ''' Reads the stored triples of some resources.
+
+        :param lang: language of the resources.
+        :param res_class: class of the resources.
+        :param resources: names of the resources.
+
+        :return: yields ``(resource, lines)`` pairs, where ``lines`` is the list of N-Triples lines stored for
+                 the resource; resources never stored are skipped.
+        '''
+        for num in range(0, len(resources), LOAD_BATCH):
+            batch = resources[num:num + LOAD_BATCH]
+            with self.lock:
+                rows = self.connect().execute("SELECT resource, triples FROM resources WHERE lang = ? AND class = ? "
+                                              "AND resource IN (" + ','.join('?' * len(batch)) + ")",
+                                              [lang, res_class] + batch).fetchall()
+            for res, data in rows:
+                text = zlib.decompress(data)
+                yield res, text.split('\n') if text else []
+
+    def updated_since(self, lang, res_class, started):
+        ''' Returns the resources stored since a given time, i.e. extracted by the current run.
+
+        :param lang: language of the resources.
+        :param res_class: class of the resources.
+        :param started: start time of the run.
+
+        :return: set of resource names.
+        '''
+        with self.lock:
+            rows = self.connect().execute("SELECT resource FROM resources WHERE lang = ? AND class = ? AND "
+                                          "updated >= ?", (lang, res_class, started)).fetchall()
+        return set(row[0] for row in rows)
+
+    def delete(self, lang, res_class, resources):
+        ''' Forgets some resources.
+
+        :param lang: language of the resources.
+        :param res_class: class of the resources.
+        :param resources: names of the resources.
+
+        :return: void.
+        '''
+        with self.lock:
+            conn = self.connect()
+            conn.executemany("DELETE FROM resources WHERE lang = ? AND class = ? AND resource = ?",
+                             [(lang, res_class, res) for res in resources])
+            conn.commit()
+
+
+def rules_signature():
+    ''' Computes a signature of the mapping rules in use, and of the code parsing and mapping the lists, so
+    that pages are extracted again when they change.
+
+    :return: hex digest of ``settings.json``, ``custom_mappers.json``, ``mapping_rules.py`` and of the
+             ``CODE_FILES``.
+    '''
+    digest = hashlib.md5()
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    for path in ['settings.json', 'custom_mappers.json', os.path.splitext(mapping_rules.__file__)[0] + '.py'] + \
+            [os.path.join(code_dir, name) for name in CODE_FILES]:
+        if os.path.exists(path):
+            with open(path, 'rb') as rules_file:
+                digest.update(rules_file.read())
+    return digest.hexdigest()
+
+
+def open_state():
+    ''' Opens the run state stored in the ``state`` subdirectory, and makes it the state of the current run.
+
+    :return: the ``RunState``.
+    '''
+    global state
+    state = RunState(utilities.get_subdirectory('state', 'runs.db'), rules_signature())
+    return state
+
+
+@fixtures.recorded('revisions')
+def query_revisions(lang, titles):
+    ''' Asks the MediaWiki API for the current revision of some pages, following redirects.
+
+    :param lang: language of the pages.
+    :param titles: list of at most ``REVISION_BATCH`` page titles (resource names are accepted).
+
+    :return: dict mapping each title to its current revision; missing pages are left out.
+    '''
+    url = "https://" + lang + ".wikipedia.org/w/api.php?action=query&format=json&prop=revisions&rvprop=ids" \
+          "&redirects&titles=" + urllib.quote('|'.join(title.encode('utf-8') for title in titles))
+    answer = utilities.json_req(url).get('query', {})
+    normalized = dict((item['from'], item['to']) for item in answer.get('normalized', []))
+    redirects = dict((item['from'], item['to']) for item in answer.get('redirects', []))
+    revisions = dict((page['title'], page['revisions'][0]['revid']) for page in answer.get('pages', {}).values()
+                     if 'revisions' in page)
+    found = dict()
+    for title in titles:
+        target = normalized.get(title, title)
+        target = redirects.get(target, target)
+        if target in revisions:
+            found[title] = revisions[target]
+    return found
+
+
+def current_revisions(lang, resources):
+    ''' Obtains the current revision of every resource, from the local dump if one is used, from the MediaWiki
+    API otherwise.
+
+    :param lang: language of the resources.
+    :param resources: utf-8 encoded resource names.
+
+    :return: dict mapping resource names to revisions; resources whose revision could not be obtained are
+             left out, so they are always extracted again.
+    '''
+    revisions = dict()
+    if wikiParser.wiki_dump is not None:
+        for res in resources:
+            page = wikiParser.wiki_dump.get_page(res)
+            if page is not None:
+                revisions[res] = page['revision']
+        return revisions
+
+    for num in range(0, len(resources), REVISION_BATCH):
+        batch = resources[num:num + REVISION_BATCH]
+        try:
+            found = query_revisions(lang, [res.decode('utf-8') for res in batch])
+        except Exception:  # the pages of this batch will just be extracted again
+            continue
+        for res in batch:
+            revision = found.get(res.decode('utf-8'))
+            if revision is not None:
+                revisions[res] = revision
+    return revisions
+
+
+def finish_delta(lang, res_class, resources, changed, removed, previous, started, g):
+    ''' Completes a delta run: adds to ``g`` the triples of the resources not extracted again, and computes the
+    triples added to and removed from the dataset since the previous run. A triple produced by several
+    resources is only added (or removed) when the first one produces it (or the last one stops producing it).
+
+    :param lang: language of the resources.
+    :param res_class: class of the resources.
+    :param resources: current resources of the class.
+    :param changed: resources that were extracted again.
+    :param removed: resources not in the class any more.
+    :param previous: dict mapping the changed and removed resources to their previously stored lines.
+    :param started: start time of the run.
+    :param g: RDF graph holding the triples extracted by the run; completed with the stored ones.
+
+    :return: a tuple ``(added, deleted)`` of sorted N-Triples lines.
+    '''
+    extracted = state.updated_since(lang, res_class, started)
+    old = set()
+    for res in changed + removed:
+        if res in extracted or res in removed:  # pages that failed keep their previous triples
+            old.update(previous.get(res, []))
+    new = set()
+    for res, res_lines in state.triples(lang, res_class, [res for res in changed if res in extracted]):
+        new.update(res_lines)
+    added = new - old
+    deleted = old - new
+
+    kept = [res for res in resources if res not in extracted]  # unchanged pages, and the ones that failed
+    lines = []
+    for res, res_lines in state.triples(lang, res_class, kept):
+        lines += res_lines
+        if len(lines) >= LOAD_BATCH * 20:
+            added.difference_update(lines)
+            deleted.difference_update(lines)
+            g.parse(data='\n'.join(lines), format='nt')
+            lines = []
+    if lines:
+        added.difference_update(lines)
+        deleted.difference_update(lines)
+        g.parse(data='\n'.join(lines), format='nt')
+
+    state.delete(lang, res_class, removed)
+    return sorted(added), sorted(deleted)
+
+
+def write_lines(path, lines):
+    ''' Writes a list of N-Triples lines in a file.
+
+    :param path: path of the file.
+    :param lines: N-Triples lines.
+
+    :return: void.
+    '''
+    out_file = open(path, 'w')
+    try:
+        for line in lines:
+            out_file.write(line + '\n')
+    finally:
+        out_file.close()
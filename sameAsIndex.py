@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+#############
+ SameAsIndex
+#############
+
+* This module builds and loads a local index of the ``owl:sameAs`` links between Wikidata entities and DBpedia
+  resources, so that ``mapper.find_DBpedia_uri()`` finds the DBpedia equivalent of a Wikidata URI with a local
+  lookup, instead of asking the SPARQL endpoint.
+
+* The index is built from a DBpedia links dump in N-Triples (e.g. ``sameas-all-wikis.ttl.bz2`` or the
+  ``wikidata`` links of a language), plain or compressed with bz2 or gzip. Only the links between a Wikidata
+  entity and a resource of the chosen DBpedia language are kept, in either direction.
+
+* The index is a SQLite file in the ``sameas`` subdirectory, one file per language, mapping the number of every
+  Wikidata entity (``Q42`` -> 42) to the name of its DBpedia resource; it can be shared by threads and by the
+  processes forked by ``--workers``. Since the endpoint serves the same DBpedia release, an entity missing from
+  the index has no DBpedia equivalent, and the endpoint is not asked.
+
+* Usage: ``python sameAsIndex.py sameas-all-wikis.ttl.bz2 en [--benchmark N]``; without a dump, the existing
+  index of the language is only benchmarked.
+
+'''
+
+import argparse
+import gzip
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+import utilities
+import wikiDump
+
+INSERT_BATCH = 100000  # links written to the index at once while building it
+
+SAMEAS = '<http://www.w3.org/2002/07/owl#sameAs>'
+WIKIDATA_ENTITY = re.compile(r'^https?://(?:www\.wikidata\.org/entity|wikidata\.dbpedia\.org/resource)/Q(\d+)$')
+UNICODE_ESCAPE = re.compile(r'\\u([0-9A-Fa-f]{4})|\\U([0-9A-Fa-f]{8})')  # N-Triples escapes in IRIs
+
+index = None  # SameAsIndex used by mapper.find_DBpedia_uri(), if any
+
+
+class SameAsIndex(object):
+    ''' SQLite index of the DBpedia resources equivalent to Wikidata entities, for a single language. '''
+
+    def __init__(self, path, lang):
+        '''
+        :param path: path of the SQLite file.
+        :param lang: language of the DBpedia resources in the index.
+        '''
+        self.path = path
+        self.lang = lang
+        self.namespace = resource_namespace(lang)
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def connect(self):
+        ''' Returns the connection of the current process, opening it if needed (a connection must not be
+        used across a fork). Must be called holding the lock.
+
+        :return: a SQLite connection.
+        '''
+        if self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.text_factory = str
+            self.pid = os.getpid()
+        return self.conn
+
+    def get(self, wk_uri):
+        ''' Finds the DBpedia equivalent of a Wikidata URI.
+
+        :param wk_uri: URI found using the WikiData API.
+
+        :return: DBpedia equivalent URI, or ``None`` if there is none.
+        '''
+        match = WIKIDATA_ENTITY.match(wk_uri)
+        if match is None:
+            return None
+        with self.lock:
+            row = self.connect().execute("SELECT resource FROM sameas WHERE qid = ?",
+                                         (int(match.group(1)),)).fetchone()
+        if row is None:
+            return None
+        return self.namespace + row[0].decode('utf-8')
+
+    def max_entity(self):
+        ''' Returns the highest Wikidata entity number in the index.
+
+        :return: entity number, 0 if the index is empty.
+        '''
+        with self.lock:
+            return self.connect().execute("SELECT MAX(qid) FROM sameas").fetchone()[0] or 0
+
+
+def resource_namespace(lang):
+    ''' Returns the namespace of the DBpedia resources of a language.
+
+    :param lang: language of the resources.
+
+    :return: e.g. ``http://dbpedia.org/resource/`` for ``en``, ``http://it.dbpedia.org/resource/`` for ``it``.
+    '''
+    if lang == 'en':
+        return 'http://dbpedia.org/resource/'
+    return 'http://' + lang + '.dbpedia.org/resource/'
+
+
+def index_path(lang):
+    ''' Returns the path of the sameAs index for a language.
+
+    :param lang: language of the index.
+
+    :return: path of the ``sameas/<lang>.db`` file.
+    '''
+    return utilities.get_subdirectory('sameas', lang + '.db')
+
+
+def iter_lines(path):
+    ''' Reads a dump line by line, decompressing it if needed (bz2 dumps may be made of several streams).
+
+    :param path: path of the ``.nt``/``.ttl`` dump, optionally ending with ``.bz2`` or ``.gz``.
+
+    :return: yields the lines of the dump.
+    '''
+    if path.endswith('.gz'):
+        in_file = gzip.open(path, 'rb')
+        try:
+            for line in in_file:
+                yield line
+        finally:
+            in_file.close()
+        return
+    reader = wikiDump.MultistreamReader(path) if path.endswith('.bz2') else open(path, 'rb')
+    try:
+        rest = ''
+        while True:
+            data = reader.read(wikiDump.CHUNK_SIZE)
+            if not data:
+                break
+            lines = (rest + data).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line
+        if rest:
+            yield rest
+    finally:
+        reader.close()
+
+
+def iter_links(lines, lang):
+    ''' Selects the links between Wikidata entities and DBpedia resources of a language.
+
+    :param lines: N-Triples lines.
+    :param lang: language of the DBpedia resources.
+
+    :return: yields ``(entity number, utf-8 encoded resource name)`` pairs.
+    '''
+    namespace = resource_namespace(lang)
+    for line in lines:
+        if SAMEAS not in line:
+            continue
+        parts = line.split()
+        if len(parts) < 3 or parts[1] != SAMEAS:
+            continue
+        subj, obj = parts[0][1:-1], parts[2][1:-1]
+        for entity, resource in [(obj, subj), (subj, obj)]:
+            match = WIKIDATA_ENTITY.match(entity)
+            if match is not None and resource.startswith(namespace):
+                yield int(match.group(1)), unescape(resource[len(namespace):])
+                break
+
+
+def unescape(name):
+    ''' Replaces the N-Triples ``\\uXXXX`` and ``\\UXXXXXXXX`` escapes of a resource name with the characters.
+
+    :param name: utf-8 encoded resource name.
+
+    :return: utf-8 encoded resource name.
+    '''
+    if '\\' not in name:
+        return name
+    return UNICODE_ESCAPE.sub(lambda match: unichr(int(match.group(1) or match.group(2), 16)).encode('utf-8'), name)
+
+
+def build_index(dump_path, lang, out_path):
+    ''' Reads a whole links dump and writes the links of a language in a new index, replacing the previous one
+    only when the new one is complete. If an entity has several equivalents, the first one is kept.
+
+    :param dump_path: path of the links dump.
+    :param lang: language of the DBpedia resources.
+    :param out_path: path of the SQLite file to be written.
+
+    :return: number of links written.
+    '''
+    tmp_path = out_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.text_factory = str
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("CREATE TABLE sameas (qid INTEGER PRIMARY KEY, resource TEXT)")
+    count = 0
+    batch = []
+    for link in iter_links(iter_lines(dump_path), lang):
+        batch.append(link)
+        if len(batch) >= INSERT_BATCH:
+            count += write_links(conn, batch)
+            batch = []
+    count += write_links(conn, batch)
+    conn.commit()
+    conn.close()
+    os.rename(tmp_path, out_path)
+    return count
+
+
+def write_links(conn, links):
+    ''' Inserts links in the index, ignoring the entities already in it.
+
+    :param conn: SQLite connection to the index being built.
+    :param links: list of ``(entity number, resource name)`` pairs.
+
+    :return: number of links inserted.
+    '''
+    before = conn.total_changes
+    conn.executemany("INSERT OR IGNORE INTO sameas VALUES (?, ?)", links)
+    return conn.total_changes - before
+
+
+def open_index(lang, path=None):
+    ''' Opens the sameAs index of a language, and makes it the index used by the mapper.
+
+    :param lang: language of the index.
+    :param path: path of the index; defaults to ``sameas/<lang>.db``.
+
+    :return: the ``SameAsIndex``, or ``None`` if the index has not been built.
+    '''
+    global index
+    index = None
+    if path is None:
+        path = index_path(lang)
+    if os.path.exists(path):
+        index = SameAsIndex(path, lang)
+    return index
+
+
+def benchmark_lookups(same_as, count):
+    ''' Measures the lookup speed of an index on random Wikidata entities, found in the index or not.
+
+    :param same_as: a ``SameAsIndex``.
+    :param count: number of lookups.
+
+    :return: a tuple ``(lookups per second, percentage of entities found)``.
+    '''
+    top = max(same_as.max_entity(), 1)
+    uris = ['http://www.wikidata.org/entity/Q' + str(random.randint(1, top)) for num in range(count)]
+    found = 0
+    start = time.time()
+    for uri in uris:
+        if same_as.get(uri) is not None:
+            found += 1
+    seconds = max(time.time() - start, 1e-6)
+    return count / seconds, 100.0 * found / max(count, 1)
+
+
+def main():
+    ''' Entry point: builds the sameAs index of a language from a links dump, and benchmarks its lookups.
+
+    :return: void.
+    '''
+    parser = argparse.ArgumentParser(description='Build a local index of the owl:sameAs links between Wikidata '
+                                                 'and DBpedia from a dump.\nExample: `python sameAsIndex.py '
+                                                 'sameas-all-wikis.ttl.bz2 en`',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('dump', type=str, nargs='?', help="Path of the N-Triples links dump (.bz2 and .gz are "
+                                                          "accepted); if omitted, the\nexisting index is only "
+                                                          "benchmarked")
+    parser.add_argument('language', type=str, help="Language of the DBpedia resources (e.g. en, it, de)")
+    parser.add_argument('--benchmark', type=int, default=100000, help="Number of random lookups timed after the "
+                                                                     "build (0 to skip)\n")
+    args = parser.parse_args()
+
+    out_path = index_path(args.language)
+    if args.dump:
+        print 'Reading sameAs links, please wait......'
+        start = time.time()
+        count = build_index(args.dump, args.language, out_path)
+        print str(count) + ' links written in ' + out_path + ' in ' + str(round(time.time() - start, 1)) + 's (' + \
+            str(round(os.path.getsize(out_path) / 1048576.0, 1)) + ' MB)'
+    if args.benchmark > 0:
+        same_as = open_index(args.language, out_path)
+        if same_as is None:
+            print 'No sameAs index built for ' + args.language
+            return
+        speed, found = benchmark_lookups(same_as, args.benchmark)
+        print str(int(speed)) + ' lookups/sec (' + str(round(found, 1)) + '% of the random entities found)'
+
+
+if __name__ == "__main__":
+    main()
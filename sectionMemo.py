@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+'''
+##############
+ Section Memo
+##############
+
+* This module memoizes the triples produced by ``mapper.select_mapping()`` for every list section, so that a
+  rerun on a page whose sections did not change reuses them, without any regular expression work and without
+  asking Wikidata or DBpedia again.
+
+* An entry is keyed by language, resource, domain (mapper) and section title, and stores a digest of the list
+  content of the section (text and spans of every element): it is reused only while the digest is the same.
+  The mapping rules and the code parsing and mapping the lists (``mapper.py``, ``wikiParser.py``, ``listItem.py``)
+  are part of the digest too, so changing them invalidates every entry.
+
+* Entries expire after the same time-to-live as the page cache, so that the answers of the reconciliation
+  services are refreshed from time to time.
+
+* The memo is a SQLite file (``cache/sections.db``); it can be shared by threads and by the processes forked by
+  ``--workers``.
+
+'''
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import listItem
+import runState
+import utilities
+
+MEMO_MODES = ['use', 'refresh', 'bypass']
+
+memo = None  # SectionMemo used by mapper.select_mapping(), if any
+
+
+class SectionMemo(object):
+    ''' SQLite store of the triples produced for every mapped section. '''
+
+    def __init__(self, path, signature, mode='use', ttl=7):
+        '''
+        :param path: path of the SQLite file.
+        :param signature: signature of the mapping code and rules, see ``code_signature()``.
+        :param mode: ``use`` (reuse and store entries) or ``refresh`` (only store them).
+        :param ttl: time-to-live of an entry, in days.
+        '''
+        self.path = path
+        self.signature = signature
+        self.mode = mode
+        self.ttl = ttl * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def connect(self):
+        ''' Returns the connection of the current process, opening it if needed (a connection must not be
+        used across a fork). Must be called holding the lock.
+
+        :return: a SQLite connection.
+        '''
+        if self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self.conn.text_factory = str
+            self.conn.execute("CREATE TABLE IF NOT EXISTS sections (lang TEXT, resource TEXT, domain TEXT, "
+                              "section TEXT, digest TEXT, stored REAL, elems INTEGER, triples BLOB, "
+                              "PRIMARY KEY (lang, resource, domain, section))")
+            self.conn.commit()
+            self.pid = os.getpid()
+        return self.conn
+
+    def get(self, lang, resource, domain, section, digest):
+        ''' Looks for the triples produced for a section with the same content.
+
+        :param lang: language of the resource.
+        :param resource: name of the resource.
+        :param domain: domain whose mapper is applied to the section.
+        :param section: title of the section.
+        :param digest: digest of the section content, see ``section_digest()``.
+
+        :return: a tuple ``(elems, lines)``, with the number of list elements extracted and the N-Triples lines,
+                 or ``None`` if the section must be mapped again.
+        '''
+        with self.lock:
+            row = None
+            if self.mode == 'use':
+                row = self.connect().execute("SELECT digest, stored, elems, triples FROM sections WHERE lang = ? AND "
+                                             "resource = ? AND domain = ? AND section = ?",
+                                             (lang, resource, domain, section.encode('utf-8'))).fetchone()
+            if row is None or row[0] != digest or time.time() - row[1] >= self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+        text = zlib.decompress(row[3])
+        return row[2], text.split('\n') if text else []
+
+    def put(self, lang, resource, domain, section, digest, elems, graph):
+        ''' Stores the triples produced for a section.
+
+        :param lang: language of the resource.
+        :param resource: name of the resource.
+        :param domain: domain whose mapper was applied to the section.
+        :param section: title of the section.
+        :param digest: digest of the section content.
+        :param elems: number of list elements extracted.
+        :param graph: RDF graph holding only the triples produced for the section.
+
+        :return: void.
+        '''
+        lines = sorted(line for line in graph.serialize(format='nt').splitlines() if line.strip())
+        data = zlib.compress('\n'.join(lines))
+        with self.lock:
+            conn = self.connect()
+            conn.execute("INSERT OR REPLACE INTO sections VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (lang, resource, domain, section.encode('utf-8'), digest, time.time(), elems,
+                          sqlite3.Binary(data)))
+            conn.commit()
+
+    def stats(self):
+        ''' Returns the hits and lookups of the current run, as shown by ``utilities.evaluate()``.
+
+        :return: a tuple ``(hits, lookups)``.
+        '''
+        return self.hits, self.hits + self.misses
+
+
+def code_signature():
+    ''' Computes a signature of the mapping rules and of the mapper functions (see
+    ``runState.rules_signature()``, which covers ``mapper.py``).
+
+    :return: hex digest.
+    '''
+    return runState.rules_signature()
+
+
+def section_digest(elem_list, signature):
+    ''' Computes the digest of the list content of a section.
+
+    :param elem_list: list elements of the section, as in the resource dictionary.
+    :param signature: signature of the mapping code and rules.
+
+    :return: hex digest.
+    '''
+    digest = hashlib.md5(signature)
+    update_digest(digest, elem_list)
+    return digest.hexdigest()
+
+
+def update_digest(digest, elem_list):
+    ''' Adds the text and spans of every list element to a digest, following nested lists.
+
+    :param digest: a ``hashlib`` digest.
+    :param elem_list: list elements.
+
+    :return: void.
+    '''
+    for elem in elem_list:
+        if type(elem) in (list, tuple):
+            digest.update('[')
+            update_digest(digest, elem)
+            digest.update(']')
+        else:
+            text = elem.encode('utf-8') if isinstance(elem, unicode) else elem
+            digest.update(repr(listItem.get_spans(elem)) + '\x00' + text + '\x00')
+
+
+def open_memo(mode='use', ttl=7):
+    ''' Opens the section memo stored in the ``cache`` subdirectory, and makes it the memo of the current run.
+
+    :param mode: one of ``MEMO_MODES``.
+    :param ttl: time-to-live of an entry, in days.
+
+    :return: the ``SectionMemo``, or ``None`` in ``bypass`` mode.
+    '''
+    global memo
+    memo = None
+    if mode != 'bypass':
+        memo = SectionMemo(utilities.get_subdirectory('cache', 'sections.db'), code_signature(), mode, ttl)
+    return memo
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+'''
+##############
+ SPARQL Cache
+##############
+
+* This module contains a persistent cache of the answers of the SPARQL endpoints, used by
+  ``utilities.sparql_query()``: the same queries are asked again and again across runs and resources (the pages
+  of the resources of a class, the types of a resource, the DBpedia equivalents of popular Wikidata entities).
+
+* Entries are keyed by endpoint and query text, normalized so that queries differing only in whitespace share
+  an entry. Each kind of query (see ``query_kind()``) has its own time-to-live (``KIND_TTL``), and empty
+  answers are kept for a shorter time (``NEGATIVE_TTL``), so that a resource added to DBpedia is found soon.
+
+* The cache is bounded in size: the least recently used entries are evicted first. Hits and misses are
+  counted and reported at the end of the run.
+
+* The cache is a SQLite file (``cache/sparql.db``); it can be shared by threads and by the processes forked by
+  ``--workers``, which count their own hits and misses.
+
+* The cache can be used in three modes: ``use`` (default), ``refresh`` (ask every query again and store the
+  answers) and ``bypass``.
+
+'''
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import utilities
+
+CACHE_MODES = ['use', 'refresh', 'bypass']
+DEFAULT_SIZE = 256  # default size cap, in MB
+
+# time-to-live of the answers of every kind of query, in days
+KIND_TTL = {
+    'sameas': 30,  # owl:sameAs links only change with a new DBpedia release
+    'types': 7,
+    'resources': 1,  # pages of the resources of a class, and their count
+    'other': 7,
+}
+NEGATIVE_TTL = 1  # time-to-live of an empty answer, in days
+TOUCH_INTERVAL = 3600  # seconds between two updates of the access time of an entry
+
+LITERAL = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')')
+
+
+class SparqlCache(object):
+    ''' A size-bounded, LRU-evicted, on-disk cache of SPARQL answers. '''
+
+    def __init__(self, path, mode='use', max_size=DEFAULT_SIZE):
+        '''
+        :param path: path of the SQLite file holding the cache.
+        :param mode: one of ``CACHE_MODES``.
+        :param max_size: maximum size of the cached answers, in MB.
+        '''
+        self.path = path
+        self.mode = mode
+        self.max_size = max_size * 1024 * 1024
+        self.size = None  # size of the answers stored, known once the cache is opened
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def connect(self):
+        ''' Returns the connection of the current process, opening it if needed (a connection must not be
+        used across a fork); a forked process counts its own hits and misses. Must be called holding the lock.
+
+        :return: a SQLite connection.
+        '''
+        if self.pid != os.getpid():
+            if self.pid is not None:
+                self.hits = self.misses = 0
+            self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self.conn.text_factory = str
+            self.conn.execute("CREATE TABLE IF NOT EXISTS answers (endpoint TEXT, digest TEXT, kind TEXT, "
+                              "expires REAL, accessed REAL, size INTEGER, data BLOB, "
+                              "PRIMARY KEY (endpoint, digest))")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed)")
+            self.conn.commit()
+            self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM answers").fetchone()[0]
+            self.pid = os.getpid()
+        return self.conn
+
+    def get(self, endpoint, query):
+        ''' Looks for the answer to a query.
+
+        :param endpoint: URL of the SPARQL endpoint.
+        :param query: query text.
+
+        :return: the JSON answer, or ``None`` if it is missing or expired.
+        '''
+        if self.mode != 'use':
+            return None
+        digest = query_digest(query)
+        with self.lock:
+            conn = self.connect()
+            row = conn.execute("SELECT expires, accessed, data FROM answers WHERE endpoint = ? AND digest = ?",
+                               (endpoint, digest)).fetchone()
+            now = time.time()
+            if row is None or row[0] <= now:
+                self.misses += 1
+                return None
+            if now - row[1] >= TOUCH_INTERVAL:  # keep popular entries from being evicted
+                conn.execute("UPDATE answers SET accessed = ? WHERE endpoint = ? AND digest = ?",
+                             (now, endpoint, digest))
+                conn.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(row[2]))
+
+    def put(self, endpoint, query, answer):
+        ''' Stores the answer to a query, evicting the least recently used entries if the cache grows over its
+        size cap.
+
+        :param endpoint: URL of the SPARQL endpoint.
+        :param query: query text.
+        :param answer: JSON answer of the endpoint.
+
+        :return: void.
+        '''
+        if self.mode == 'bypass':
+            return
+        kind = query_kind(query)
+        ttl = KIND_TTL[kind]
+        if not answer.get('results', {}).get('bindings'):  # negative caching
+            ttl = min(ttl, NEGATIVE_TTL)
+        data = zlib.compress(json.dumps(answer, separators=(',', ':')))
+        digest = query_digest(query)
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            old = conn.execute("SELECT size FROM answers WHERE endpoint = ? AND digest = ?",
+                               (endpoint, digest)).fetchone()
+            if old is not None:
+                self.size -= old[0]
+            conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (endpoint, digest, kind, now + ttl * 24 * 3600, now, len(data), sqlite3.Binary(data)))
+            self.size += len(data)
+            if self.size > self.max_size:
+                self._evict()
+            conn.commit()
+
+    def _evict(self):
+        ''' Deletes expired entries, then the least recently used ones, until the cache is back to 90% of its
+        size cap. Must be called holding the lock.
+
+        :return: void.
+        '''
+        conn = self.connect()
+        conn.execute("DELETE FROM answers WHERE expires <= ?", (time.time(),))
+        # other processes may have stored or evicted entries in the meantime
+        self.size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM answers").fetchone()[0]
+        target = self.max_size * 0.9
+        evicted = []
+        for endpoint, digest, size in conn.execute("SELECT endpoint, digest, size FROM answers ORDER BY accessed"):
+            if self.size <= target:
+                break
+            evicted.append((endpoint, digest))
+            self.size -= size
+        conn.executemany("DELETE FROM answers WHERE endpoint = ? AND digest = ?", evicted)
+
+    def stats(self):
+        ''' Returns the hits and misses of the current process.
+
+        :return: a tuple ``(hits, misses)``.
+        '''
+        with self.lock:
+            if self.pid != os.getpid():  # nothing asked yet by this forked process
+                return 0, 0
+            return self.hits, self.misses
+
+    def report(self):
+        ''' Prints the number of cache hits and misses of the current run.
+
+        :return: void.
+        '''
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        print "SPARQL cache:", self.hits, "hits,", self.misses, "misses (" + str(round(rate, 1)) + "% hit rate)"
+
+
+def normalize_query(query):
+    ''' Collapses the whitespace of a query outside its string literals.
+
+    :param query: query text.
+
+    :return: normalized query text.
+    '''
+    parts = LITERAL.split(query)
+    for num in range(0, len(parts), 2):  # even parts are outside literals
+        parts[num] = re.sub(r'\s+', ' ', parts[num])
+    return ''.join(parts).strip()
+
+
+def query_digest(query):
+    ''' Computes the key of a query in the cache.
+
+    :param query: query text.
+
+    :return: hex digest of the normalized query.
+    '''
+    if isinstance(query, unicode):
+        query = query.encode('utf-8')
+    return hashlib.md5(normalize_query(query)).hexdigest()
+
+
+def query_kind(query):
+    ''' Classifies a query, to choose the time-to-live of its answer.
+
+    :param query: query text.
+
+    :return: one of the keys of ``KIND_TTL``.
+    '''
+    if 'owl#sameAs' in query:
+        return 'sameas'
+    if 'wikiPageID' in query:  # resources of a class (see utilities.iter_resources() and count_query())
+        return 'resources'
+    if re.search(r'>\s+a\s+\?t\b', query):  # types of a resource (see utilities.get_resource_type())
+        return 'types'
+    return 'other'
+
+
+def open_cache(mode='use', max_size=DEFAULT_SIZE):
+    ''' Opens the SPARQL cache stored in the ``cache`` subdirectory.
+
+    :param mode: one of ``CACHE_MODES``.
+    :param max_size: maximum size of the cached answers, in MB.
+
+    :return: a ``SparqlCache``, or ``None`` in ``bypass`` mode.
+    '''
+    if mode == 'bypass':
+        return None
+    return SparqlCache(utilities.get_subdirectory('cache', 'sparql.db'), mode, max_size)
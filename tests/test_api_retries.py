@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+'''
+Checks the retries of the Wikidata and DBpedia API calls of ``mapper``, with the HTTP client and the SPARQL
+endpoint replaced by functions failing a given number of times: errors on the connection or on the server are
+retried at most ``API_ATTEMPTS`` times in all, client errors are not, and the answer of a retry is returned.
+
+Run from the repository root with ``python -m unittest discover tests``.
+'''
+
+import StringIO
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpClient
+import mapper
+import utilities
+
+WIKIDATA_ANSWER = json.dumps({'search': [{'concepturi': 'http://www.wikidata.org/entity/Q42'}]})
+SPARQL_ANSWER = {'results': {'bindings': [{'s': {'value': 'http://dbpedia.org/resource/Douglas_Adams'}}]}}
+
+
+class ApiRetriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = httpClient.get, utilities.sparql_query, mapper.API_RETRY_DELAY
+        mapper.API_RETRY_DELAY = 0
+        self.calls = 0
+        self.stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        httpClient.get, utilities.sparql_query, mapper.API_RETRY_DELAY = self.saved
+
+    def failing(self, errors, answer):
+        ''' Returns a function raising the given errors, one per call, and then returning the answer. '''
+        def call(*args, **kwargs):
+            self.calls += 1
+            if self.calls <= len(errors):
+                raise errors[self.calls - 1]
+            return answer
+        return call
+
+    def test_server_errors_are_retried(self):
+        httpClient.get = self.failing([httpClient.HTTPError('unavailable', 503),
+                                       httpClient.HTTPError('connection refused')], WIKIDATA_ANSWER)
+        self.assertEqual(mapper.wikidataAPI_call('Douglas Adams', 'en'), 'http://www.wikidata.org/entity/Q42')
+        self.assertEqual(self.calls, 3)
+
+    def test_client_errors_are_not_retried(self):
+        httpClient.get = self.failing([httpClient.HTTPError('not found', 404)], WIKIDATA_ANSWER)
+        self.assertEqual(mapper.wikidataAPI_call('Douglas Adams', 'en'), None)
+        self.assertEqual(self.calls, 1)
+
+    def test_retries_are_capped(self):
+        errors = [IOError('connection reset')] * (mapper.API_ATTEMPTS + 1)
+        utilities.sparql_query = self.failing(errors, SPARQL_ANSWER)
+        self.assertEqual(mapper.find_DBpedia_uri('http://www.wikidata.org/entity/Q42', 'en'), None)
+        self.assertEqual(self.calls, mapper.API_ATTEMPTS)
+
+        self.calls = 0
+        utilities.sparql_query = self.failing(errors[:1], SPARQL_ANSWER)
+        self.assertEqual(mapper.find_DBpedia_uri('http://www.wikidata.org/entity/Q42', 'en'),
+                         'http://dbpedia.org/resource/Douglas_Adams')
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
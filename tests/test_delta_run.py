@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+'''
+Runs ``listExtractor.py a Writer en --delta`` twice on the same pages, with the Wikipedia, Wikidata and SPARQL
+services replaced by functions: the second run finds no changed page, and must still write the whole dataset,
+empty ``_added``/``_removed`` files and its line of ``evaluation.csv``, without an accuracy.
+
+Run from the repository root with ``python -m unittest discover tests``.
+'''
+
+import StringIO
+import csv
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import rdflib
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import listExtractor
+import mapper
+import runState
+import utilities
+import wikiParser
+import wikitextParser
+
+PAGES = {
+    'Res1': u"== Bibliography ==\n* ''Work One'' (1990)\n* ''Work Two'' (1995)",
+    'Res2': u"== Bibliography ==\n* ''Work Three'' (2001)",
+}
+
+
+class DeltaRunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp(prefix='listextractor_')
+        for name in ['settings.json', 'custom_mappers.json']:
+            shutil.copy(os.path.join(REPO, name), self.directory)
+        for name in ['extracted', 'state']:  # utilities.get_subdirectory() paths are relative to the cwd
+            os.mkdir(os.path.join(self.directory, name))
+        os.chdir(self.directory)
+        self.saved = (utilities.iter_resources, utilities.sparql_query, runState.current_revisions,
+                      runState.open_state, wikiParser.fetch_sections, mapper.wikidataAPI_call, sys.argv)
+        utilities.iter_resources = lambda lang, page_type: iter(sorted(PAGES))
+        utilities.sparql_query = lambda query, lang: {'results': {'bindings': []}}
+        runState.current_revisions = lambda lang, resources: dict((res, 1) for res in resources)
+        runState.open_state = self.open_state
+        wikiParser.fetch_sections = lambda lang, res: wikitextParser.parse_wikitext(PAGES[res])
+        mapper.wikidataAPI_call = lambda res, lang: None
+
+    def tearDown(self):
+        (utilities.iter_resources, utilities.sparql_query, runState.current_revisions, runState.open_state,
+         wikiParser.fetch_sections, mapper.wikidataAPI_call, sys.argv) = self.saved
+        runState.state = None
+        wikiParser.section_filter = None
+        wikiParser.page_revisions = dict()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def open_state(self):
+        runState.state = runState.RunState(os.path.join(self.directory, 'state', 'runs.db'),
+                                           runState.rules_signature())
+        return runState.state
+
+    def run_delta(self):
+        ''' Runs a delta extraction, and reads back the files it wrote.
+
+        :return: a tuple ``(dataset graph, added lines, removed lines)``.
+        '''
+        for path in glob.glob(os.path.join(self.directory, 'extracted', '*')):
+            os.remove(path)
+        sys.argv = ['listExtractor.py', 'a', 'Writer', 'en', '--delta', '--parser', 'native', '--cache', 'bypass',
+                    '--section-memo', 'bypass', '--sparql-cache', 'bypass']
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            listExtractor.main()
+        finally:
+            sys.stdout = stdout
+        extracted = os.path.join(self.directory, 'extracted')
+        graph = rdflib.Graph()
+        for path in glob.glob(os.path.join(extracted, '*.ttl')):
+            graph.parse(path, format='turtle')
+        with open(glob.glob(os.path.join(extracted, '*_added.nt'))[0]) as added_file:
+            added = added_file.read().splitlines()
+        with open(glob.glob(os.path.join(extracted, '*_removed.nt'))[0]) as removed_file:
+            removed = removed_file.read().splitlines()
+        return graph, added, removed
+
+    def test_unchanged_rerun(self):
+        first, added, removed = self.run_delta()
+        self.assertTrue(len(first) > 0)
+        self.assertEqual(len(added), len(first))
+        self.assertEqual(removed, [])
+
+        second, added, removed = self.run_delta()
+        self.assertEqual(set(second), set(first))
+        self.assertEqual((added, removed), ([], []))
+
+        with open(os.path.join(self.directory, 'evaluation.csv')) as csv_file:
+            rows = list(csv.reader(csv_file, delimiter=',', quotechar='|'))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][2], '2')  # both pages extracted by the first run
+        self.assertEqual(rows[1][2:6], ['0', '0', '0', '0'])  # none by the second one
+        self.assertEqual(rows[1][7], '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+'''
+Checks the calls to the JSONpedia wrapper, replaced by scripts: ``wikiParser.JSONpediaServer`` only takes the
+line tagged with the id of a request as its answer, even if stray lines are printed on stdout before it, and
+``wikiParser.call_wrapper()`` gives up on a spawned wrapper which doesn't answer within ``PAGE_DEADLINE``.
+
+Run from the repository root with ``python -m unittest discover tests``.
+'''
+
+import StringIO
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wikiParser
+
+WRAPPER = r"""
+import json
+import sys
+
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        break
+    request = json.loads(line)
+    sys.stdout.write('INFO: processing a page\n')
+    sys.stdout.write('{"success": "true", "output": "not an answer"}\n')
+    sys.stdout.write('%s\t%s\n' % (request['id'], json.dumps({'resource': request['resource']})))
+    sys.stdout.flush()
+"""
+
+SPAWNED = r"""
+import sys
+import time
+
+if sys.argv[sys.argv.index('-r') + 1] == 'Slow':
+    time.sleep(60)
+sys.stdout.write('{"success": "true", "result": []}')
+"""
+
+
+class JSONpediaServerTest(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.script = tempfile.mkstemp(suffix='.py')
+        with os.fdopen(handle, 'w') as script:
+            script.write(WRAPPER)
+        self.saved = wikiParser.JSONPEDIA_WRAPPER
+        wikiParser.JSONPEDIA_WRAPPER = [sys.executable, self.script]
+        self.server = wikiParser.JSONpediaServer()
+        self.stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.server.stop()
+        wikiParser.JSONPEDIA_WRAPPER = self.saved
+        os.remove(self.script)
+
+    def test_stray_lines_are_skipped(self):
+        for resource in ['Res1', 'Res2', 'Res3']:
+            answer = self.server.request('en', resource, ['Structure'], ['section'])
+            self.assertEqual(json.loads(answer), {'resource': resource})
+            reader = self.server.open('en', resource + '_open', ['Structure'], ['section'])
+            answer = ''
+            chunk = reader.read(4)
+            while chunk:
+                answer += chunk
+                chunk = reader.read(4)
+            reader.close()
+            self.assertEqual(json.loads(answer), {'resource': resource + '_open'})
+
+
+class SpawnedWrapperTest(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.script = tempfile.mkstemp(suffix='.py')
+        with os.fdopen(handle, 'w') as script:
+            script.write(SPAWNED)
+        self.saved = wikiParser.JSONPEDIA_WRAPPER, wikiParser.PAGE_DEADLINE, wikiParser.jsonpedia_server
+        wikiParser.JSONPEDIA_WRAPPER = [sys.executable, self.script]
+        wikiParser.PAGE_DEADLINE = 1.0
+        wikiParser.jsonpedia_server = None
+
+    def tearDown(self):
+        wikiParser.JSONPEDIA_WRAPPER, wikiParser.PAGE_DEADLINE, wikiParser.jsonpedia_server = self.saved
+        os.remove(self.script)
+
+    def test_answer(self):
+        answer = wikiParser.call_wrapper('en', 'Fast', ['Structure'])
+        self.assertEqual(json.loads(answer), {'success': 'true', 'result': []})
+
+    def test_deadline(self):
+        start = time.time()
+        with self.assertRaises(wikiParser.JSONpediaError):
+            wikiParser.call_wrapper('en', 'Slow', ['Structure'])
+        self.assertTrue(time.time() - start < 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+'''
+Checks that the italic and quoted ranges found by ``listItem.ItemBuilder`` while the pieces of a list element are
+appended are the ones the regular expressions used by the extractors find in its whole text.
+
+Run from the repository root with ``python -m unittest discover tests``.
+'''
+
+import os
+import random
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import listItem
+
+ITALIC = re.compile(r'\'{2,}(.*?)\'{2,}')
+QUOTE = re.compile(r'\"(.*?)\"')
+PIECES = [u"'", u"''", u"'''", u"''''", u'"', u'\n', u'a', u'b c']
+
+
+def expected_spans(item):
+    ''' Computes the spans of a ``ListItem`` with regular expressions on its whole text.
+
+    :param item: a ``ListItem`` with known spans.
+
+    :return: tuple of spans.
+    '''
+    spans = [span for span in item.spans if span[0] in ('reference', 'link')]
+    spans += [('italic', match.start(), match.end(), match.group(0)) for match in ITALIC.finditer(item)]
+    spans += [('quote', match.start(), match.end(), match.group(0)) for match in QUOTE.finditer(item)]
+    return tuple(spans)
+
+
+def random_text(rand, size):
+    return u''.join(rand.choice(PIECES) for num in range(rand.randint(0, size)))
+
+
+class ItemBuilderTest(unittest.TestCase):
+
+    def build(self, *pieces):
+        builder = listItem.ItemBuilder()
+        for piece in pieces:
+            builder.add(piece)
+        return builder.build()
+
+    def test_italic_and_quote(self):
+        item = self.build(u"''Title'' ", u'"Song"')
+        self.assertEqual(item.spans, (('italic', 0, 9, u"''Title''"), ('quote', 10, 16, u'"Song"')))
+
+    def test_ranges_across_pieces(self):
+        builder = listItem.ItemBuilder()
+        builder.add(u"'")
+        builder.add(u"'")
+        builder.add_reference(u'Target')
+        builder.add(u"''")
+        item = builder.build()
+        self.assertEqual(item.spans, (('reference', 3, 13, u'Target'), ('italic', 0, 16, u"'' {{Target}} ''")))
+
+    def test_ranges_end_with_the_line(self):
+        self.assertEqual(self.build(u"''a\nb''").spans, ())
+        self.assertEqual(self.build(u'"a\n"b"').spans, (('quote', 3, 6, u'"b"'),))
+        self.assertEqual(self.build(u"''''a").spans, (('italic', 0, 4, u"''''"),))
+
+    def test_random_items(self):
+        rand = random.Random(0)
+        for num in range(20000):
+            builder = listItem.ItemBuilder()
+            for piece in range(rand.randint(0, 6)):
+                choice = rand.random()
+                if choice < 0.7:
+                    builder.add(random_text(rand, 5))
+                elif choice < 0.85:
+                    builder.add_reference(u''.join(rand.choice([u"'", u'"', u'x']) for char in range(3)))
+                else:
+                    builder.add_link(u'http://example.org', [random_text(rand, 3), random_text(rand, 3)])
+            item = builder.build()
+            if item.spans is not None:
+                self.assertEqual(item.spans, expected_spans(item), repr(item))
+
+
+if __name__ == '__main__':
+    unittest.main()
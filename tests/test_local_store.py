@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+'''
+Runs the SPARQL queries of the extractor against a local store: an in-memory ``rdflib`` graph, served over HTTP
+in the SPARQL JSON results format, standing for a store loaded with the DBpedia dumps (see the README). The
+store follows the SPARQL 1.1 standard, so the endpoint is configured with ``"keyset": "str"``.
+
+Run from the repository root with ``python -m unittest discover tests``.
+'''
+
+import BaseHTTPServer
+import SocketServer
+import os
+import sys
+import threading
+import time
+import unittest
+import urlparse
+
+import rdflib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpClient
+import mapper
+import utilities
+
+RESOURCES = 250
+PAGE_SIZE = 30
+MAX_CONCURRENCY = 2
+
+
+def make_graph():
+    ''' Builds a store of ``Writer`` resources, with page ids, types and Wikidata equivalents; one resource out
+    of seven has a non-ASCII name.
+
+    :return: an ``rdflib.Graph``.
+    '''
+    lines = []
+    for num in range(RESOURCES):
+        res = '<http://dbpedia.org/resource/W_%04d%s>' % (num, '_(\xc3\xa9crivain)' if num % 7 == 0 else '')
+        lines.append(res + ' <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://dbpedia.org/ontology/Writer> .')
+        lines.append(res + ' <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://dbpedia.org/ontology/Person> .')
+        lines.append(res + ' <http://dbpedia.org/ontology/wikiPageID> "%d"^^'
+                           '<http://www.w3.org/2001/XMLSchema#integer> .' % num)
+        lines.append(res + ' <http://www.w3.org/2002/07/owl#sameAs> <http://www.wikidata.org/entity/Q%d> .' % (num + 1))
+    graph = rdflib.Graph()
+    graph.parse(data='\n'.join(lines), format='nt')
+    return graph
+
+
+class StoreServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    ''' SPARQL endpoint answering from a ``rdflib`` graph, counting the queries in flight. '''
+    daemon_threads = True
+
+    def __init__(self, graph):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StoreHandler)
+        self.graph = graph
+        self.lock = threading.Lock()
+        self.queries = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+class StoreHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        query = urlparse.parse_qs(urlparse.urlsplit(self.path).query)['query'][0]
+        with server.lock:
+            server.queries.append(query)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if 'Q999999' in query:  # slow query, to check the concurrency bound
+                time.sleep(0.1)
+            with server.lock:  # rdflib graphs are not safe for concurrent queries
+                body = server.graph.query(query).serialize(format='json')
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/sparql-results+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class LocalStoreTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = httpClient.client
+        httpClient.client = httpClient.HttpClient()  # its connections are closed at the end
+        cls.server = StoreServer(make_graph())
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for idle in httpClient.client.pools.values():
+            for conn in idle:
+                conn.close()
+        httpClient.client = cls.client
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.endpoints = utilities.ENDPOINTS
+        self.cache = utilities.sparql_cache
+        utilities.sparql_cache = None
+        utilities.ENDPOINTS = {'default': {'url': 'http://127.0.0.1:%d/sparql' % self.server.server_address[1],
+                                           'max_concurrency': MAX_CONCURRENCY, 'page_size': PAGE_SIZE,
+                                           'keyset': 'str'}}
+        del self.server.queries[:]
+
+    def tearDown(self):
+        utilities.ENDPOINTS = self.endpoints
+        utilities.sparql_cache = self.cache
+
+    def test_enumeration(self):
+        resources = list(utilities.iter_resources('en', 'Writer'))
+        self.assertEqual(len(resources), RESOURCES)
+        self.assertEqual(resources, sorted(set(resources)))
+        self.assertTrue('W_0007_(\xc3\xa9crivain)' in resources)
+        self.assertEqual(len(self.server.queries), RESOURCES // PAGE_SIZE + 1)
+        self.assertTrue('FILTER(STR(?s) > "http://dbpedia.org/resource/W_0029")' in self.server.queries[1])
+
+    def test_types_and_equivalents(self):
+        self.assertEqual(sorted(utilities.get_resource_type('en', 'W_0001')), ['Person', 'Writer'])
+        self.assertEqual(mapper.find_DBpedia_uri('http://www.wikidata.org/entity/Q2', 'en'),
+                         'http://dbpedia.org/resource/W_0001')
+
+    def test_concurrency_bound(self):
+        query = 'SELECT ?s WHERE {?s ?p <http://www.wikidata.org/entity/Q999999>}'
+        self.server.max_in_flight = 0
+        threads = [threading.Thread(target=utilities.sparql_query, args=(query, 'en')) for num in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.server.queries), 10)
+        self.assertTrue(self.server.max_in_flight <= MAX_CONCURRENCY)
+
+    def test_keyset_filters(self):
+        last = 'http://dbpedia.org/resource/A_"B"'
+        self.assertEqual(utilities.keyset_filter(last, 'iri'), ' FILTER(?s > <' + last + '>)')
+        self.assertEqual(utilities.keyset_filter(last, 'str'),
+                         ' FILTER(STR(?s) > "http://dbpedia.org/resource/A_\\"B\\"")')
+        utilities.ENDPOINTS = {}
+        self.assertEqual(utilities.get_endpoint('it')['keyset'], 'iri')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+'''
+Checks that the fetch workers of ``pipeline.Pipeline`` parse the sections of a page while they are read: a
+section is released before the next one is read, so that the memory held is bounded by the largest section,
+not by the whole page.
+
+Run from the repository root with ``python -m unittest discover tests``.
+'''
+
+import StringIO
+import gc
+import os
+import sys
+import threading
+import unittest
+import weakref
+
+import rdflib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mapper
+import pipeline
+import wikiParser
+import wikitextParser
+
+SECTIONS = 30
+
+
+class Section(dict):
+    ''' A section as decoded from the wrapper output, which can be referenced weakly. '''
+
+
+def make_page(num):
+    ''' Builds the wikitext of a page with ``SECTIONS`` bibliography sections. '''
+    lines = []
+    for sect in range(SECTIONS):
+        lines.append(u'== Works %d ==' % sect)
+        lines += [u"* ''Work %d-%d'' (%d)" % (num, sect, 1950 + item) for item in range(20)]
+    return u'\n'.join(lines)
+
+
+class PipelineFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = wikiParser.fetch_sections, mapper.wikidataAPI_call
+        self.lock = threading.Lock()
+        self.live = []  # weak references to the sections handed over by the fetch function
+        self.peak = 0
+        wikiParser.fetch_sections = self.fetch_sections
+        mapper.wikidataAPI_call = lambda res, lang: None
+
+    def tearDown(self):
+        wikiParser.fetch_sections, mapper.wikidataAPI_call = self.saved
+
+    def fetch_sections(self, language, resource):
+        ''' Yields the sections of a page one at a time, keeping track of the ones still held. '''
+        for section in wikitextParser.parse_wikitext(make_page(int(resource[3:]))):
+            section = Section(section)
+            gc.collect()
+            with self.lock:
+                self.live = [ref for ref in self.live if ref() is not None]
+                self.peak = max(self.peak, len(self.live))
+                self.live.append(weakref.ref(section))
+            yield section
+            del section
+
+    def test_sections_are_parsed_while_read(self):
+        resources = ['Res%d' % num for num in range(6)]
+        graph = rdflib.Graph()
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            res_failed, extracted, found = pipeline.Pipeline('en', 'Writer', fetch='native',
+                                                             fetch_workers=2).run(resources, graph)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(res_failed, 0)
+        self.assertEqual(found, len(resources) * SECTIONS * 20)
+        self.assertTrue(len(graph) > 0)
+        self.assertTrue(self.peak <= 2 * 2, self.peak)  # at most about one section for each fetch worker
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+'''
+Checks that the ``owl:sameAs`` lookups of several resources, resolved together by the writer of
+``pipeline.Pipeline``, give the same graph as resources mapped one at a time by ``mapper.select_mapping()``,
+with fewer queries. The Wikidata API and the SPARQL endpoint are replaced by functions of the URIs.
+
+Run from the repository root with ``python -m unittest discover tests``.
+'''
+
+import StringIO
+import os
+import random
+import re
+import sys
+import unittest
+
+import rdflib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mapper
+import pipeline
+import utilities
+import wikiParser
+import wikitextParser
+
+WIKIDATA_URI = re.compile(r'<(http://www\.wikidata\.org/entity/Q(\d+))>')
+
+
+def make_page(seed):
+    ''' Builds the wikitext of a bibliography with a few linked works, the same for the same seed.
+
+    :param seed: seed of the random generator.
+
+    :return: wikitext of the page.
+    '''
+    rand = random.Random(seed)
+    lines = [u'== Bibliography ==']
+    for num in range(rand.randint(1, 5)):
+        lines.append(u"* [[Work %d]] (%d)" % (rand.randint(1, 300), rand.randint(1950, 2010)))
+    return u'\n'.join(lines)
+
+
+def wikidata_call(res, lang):
+    ''' Reconciles every other work with a Wikidata entity. '''
+    num = int(re.sub(r'\D', '', res) or 0)
+    return 'http://www.wikidata.org/entity/Q%d' % num if num % 2 else None
+
+
+class SameAsWindowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = mapper.wikidataAPI_call, utilities.sparql_query, wikiParser.fetch_sections
+        self.queries = []
+        self.pages = dict(('Res%d' % seed, wikitextParser.parse_wikitext(make_page(seed))) for seed in range(40))
+        mapper.wikidataAPI_call = wikidata_call
+        utilities.sparql_query = self.sparql_query
+        wikiParser.fetch_sections = lambda lang, res: self.pages[res]
+
+    def tearDown(self):
+        mapper.wikidataAPI_call, utilities.sparql_query, wikiParser.fetch_sections = self.saved
+
+    def sparql_query(self, query, lang):
+        ''' Answers the owl:sameAs queries: entities with a number multiple of 3 have no DBpedia equivalent. '''
+        self.queries.append(query)
+        bindings = [{'s': {'value': 'http://dbpedia.org/resource/D' + num}, 'wd': {'value': uri}}
+                    for uri, num in WIKIDATA_URI.findall(query) if int(num) % 3]
+        return {'results': {'bindings': bindings}}
+
+    def test_window_matches_single_resources(self):
+        expected = set()
+        for res in sorted(self.pages):
+            graph = rdflib.Graph()
+            resDict = wikiParser.parse_result('en', res, self.pages[res], follow_redirects=False)
+            mapper.select_mapping(resDict, res, 'en', 'Writer', graph, domains_mapped=[])
+            expected.update(graph)
+        single = len(self.queries)
+        del self.queries[:]
+
+        graph = rdflib.Graph()
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            pipeline.Pipeline('en', 'Writer', map_workers=4).run(sorted(self.pages), graph)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(set(graph), expected)
+        self.assertTrue(any('dbpedia.org/resource/D' in unicode(obj) for obj in graph.subjects()))
+        for subj in graph.subjects():  # only the entities without an equivalent are left
+            match = WIKIDATA_URI.match(u'<' + subj + u'>')
+            self.assertTrue(match is None or int(match.group(2)) % 3 == 0, subj)
+        self.assertTrue(0 < len(self.queries) < single / 4, (len(self.queries), single))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+'''
+Checks that ``wikiParser.SectionParser`` is re-entrant: pages parsed at the same time by several threads give
+the same dictionaries as pages parsed one after the other.
+
+Run from the repository root with ``python -m unittest discover tests``.
+'''
+
+import os
+import random
+import sys
+import unittest
+from multiprocessing.pool import ThreadPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wikiParser
+import wikitextParser
+
+HEADERS = ['Discography', 'Bibliography', 'Filmography', 'Awards', 'Career', 'Members', 'Works', 'Staff']
+
+
+def make_page(seed):
+    ''' Builds the wikitext of a page with nested sections and lists, the same for the same seed.
+
+    :param seed: seed of the random generator.
+
+    :return: wikitext of the page.
+    '''
+    rand = random.Random(seed)
+    lines = []
+    for header in rand.sample(HEADERS, 4):
+        lines.append(u'== ' + header + u' ==')
+        for num in range(rand.randint(0, 2)):
+            lines.append(u'=== Part ' + unicode(num) + u' ===')
+            for item in range(rand.randint(1, 6)):
+                text = rand.choice([u"''Title %d''", u'"Song %d"', u'[[Target %d|shown]]', u'(%d)', u'plain %d'])
+                lines.append(u'*' * rand.randint(1, 2) + u' ' + text % rand.randint(1, 2000))
+    return u'\n'.join(lines)
+
+
+def parse_page(sections):
+    ''' Parses the sections of a page with a new ``SectionParser``, as ``wikiParser.parse_result()`` does.
+
+    :param sections: sections of the page.
+
+    :return: dictionary of the lists of the page.
+    '''
+    parser = wikiParser.SectionParser()
+    lists = {}
+    for section in sections:
+        lists.update(parser.parse_section(section))
+    return lists
+
+
+class SectionParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pages = [wikitextParser.parse_wikitext(make_page(seed)) for seed in range(200)]
+        self.interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)  # switch threads as often as possible
+
+    def tearDown(self):
+        sys.setcheckinterval(self.interval)
+
+    def test_threads_match_sequential_run(self):
+        expected = [parse_page(sections) for sections in self.pages]
+        pool = ThreadPool(8)
+        try:
+            for run in range(3):
+                self.assertEqual(pool.map(parse_page, self.pages, chunksize=1), expected)
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_nested_titles(self):
+        titles = set()
+        for lists in [parse_page(sections) for sections in self.pages]:
+            titles.update(lists)
+        self.assertTrue(any(' - Part ' in title for title in titles))
+
+    def test_parse_section_uses_a_new_parser(self):
+        for sections in self.pages[:20]:
+            for section in sections:
+                self.assertEqual(wikiParser.parse_section(section),
+                                 wikiParser.SectionParser().parse_section(section))
+
+
+if __name__ == '__main__':
+    unittest.main()
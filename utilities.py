@@ -11,11 +11,14 @@
 
 import time
 import datetime
+import threading
 import os
 import urllib
 import csv
 import json
 import sys
+import fixtures
+import httpClient
 from mapping_rules import EXCLUDED_SECTIONS
 
 # These would contain the mapping rules and the custom defined mapping functions that would be used by the
@@ -23,6 +26,20 @@ from mapping_rules import EXCLUDED_SECTIONS
 MAPPING = dict()
 CUSTOM_MAPPERS = dict()
 
+sparql_cache = None  # SparqlCache used by sparql_query(), if any (see sparqlCache.py)
+
+RESOURCE_PAGE = 1000  # resources asked to the endpoint with a single query, unless set for the endpoint
+
+# SPARQL endpoint of a language not listed in the ``ENDPOINTS`` of settings.json; ``{local}`` is empty for
+# English, ``<lang>.`` otherwise. ``timeout`` (seconds) defaults to ``--http-timeout``; ``keyset`` is one of
+# ``KEYSET_FILTERS`` (see ``iter_resources()``).
+DEFAULT_ENDPOINT = {'url': 'http://{local}dbpedia.org/sparql', 'max_concurrency': 8, 'page_size': RESOURCE_PAGE,
+                    'timeout': None, 'keyset': 'iri'}
+KEYSET_FILTERS = ['iri', 'str']
+ENDPOINTS = dict()  # SPARQL endpoints of every language, loaded from settings.json
+endpoint_slots = dict()  # endpoint URL -> semaphore bounding the concurrent queries
+slots_lock = threading.Lock()
+
 def check_existing_class(class_name):
     ''' This function checks if there exists mapping rules for the domain name provided in the parameter.
 
@@ -52,6 +69,53 @@ def load_settings():
         print "Settings files doesn't exist!!! "
         sys.exit(1)
 
+def load_endpoints():
+    ''' This function loads the SPARQL endpoints of every language from the ``settings.json`` file into the
+    ``ENDPOINTS`` dict. Every endpoint is a dict with ``url``, ``max_concurrency`` (queries sent at the same time
+    by a process), ``page_size`` (resources asked by a single query, at most the row cap of the endpoint),
+    ``timeout`` and ``keyset`` (the filter paginating the resources of a class, see ``iter_resources()``); the
+    ``default`` entry applies to every language, and the missing keys are taken from ``DEFAULT_ENDPOINT``.
+
+    :return: latest ``ENDPOINTS`` dict.
+    '''
+    global ENDPOINTS
+    try:
+        with open('settings.json') as settings_file:
+            ENDPOINTS = json.load(settings_file).get('ENDPOINTS', {})
+    except IOError:
+        ENDPOINTS = {}
+    if 'default' not in ENDPOINTS:
+        ENDPOINTS['default'] = DEFAULT_ENDPOINT
+    return ENDPOINTS
+
+def get_endpoint(lang):
+    ''' Returns the SPARQL endpoint of a language, see ``load_endpoints()``.
+
+    :param lang: language/endpoint prefix (e.g. 'en', 'it'..).
+
+    :return: dict with the ``url``, ``max_concurrency``, ``page_size`` and ``timeout`` of the endpoint.
+    '''
+    if len(ENDPOINTS) == 0:
+        load_endpoints()
+    endpoint = dict(DEFAULT_ENDPOINT)
+    endpoint.update(ENDPOINTS.get('default', {}))
+    endpoint.update(ENDPOINTS.get(lang, {}))
+    local = "" if lang == 'en' else lang + "."
+    endpoint['url'] = endpoint['url'].replace('{local}', local).replace('{lang}', lang)
+    return endpoint
+
+def endpoint_slot(endpoint):
+    ''' Returns the semaphore bounding the queries sent at the same time to an endpoint by this process.
+
+    :param endpoint: endpoint dict, as returned by ``get_endpoint()``.
+
+    :return: a ``threading.BoundedSemaphore``, to be held while a query is sent.
+    '''
+    with slots_lock:
+        if endpoint['url'] not in endpoint_slots:
+            endpoint_slots[endpoint['url']] = threading.BoundedSemaphore(max(endpoint['max_concurrency'], 1))
+        return endpoint_slots[endpoint['url']]
+
 def load_custom_mappers():
     ''' This function loads the user defined mapping functions from the ``custom_mappers.json`` 
     file into ``CUSTOM_MAPPERS`` dict.
@@ -178,62 +242,63 @@ def remove_symbols(listDict_key):
 
     :return: a dictionary without empty values.
     '''
+    cleaned = None  # copy of a tuple (compact resDict value), made only if something must be replaced
     for i in range(len(listDict_key)):
         value = listDict_key[i]
-        if type(value)==list:   #handle recursive list elements
-            value=remove_symbols(value)
-        else: #replace this symbol from list values; as it broke the code in some cases
-            listDict_key[i] = value.replace('&nbsp;','')
+        if type(value) in (list, tuple):   #handle recursive list elements
+            new_value = remove_symbols(value)
+        elif '&nbsp;' in value: #replace this symbol from list values; as it broke the code in some cases
+            new_value = value.replace('&nbsp;','')
+        else:
+            continue
+        if new_value is value:
+            continue
+        if type(listDict_key) == tuple:
+            if cleaned is None:
+                cleaned = list(listDict_key)
+            cleaned[i] = new_value
+        else:
+            listDict_key[i] = new_value
 
+    if cleaned is not None:
+        return tuple(cleaned)
     return listDict_key
 
 
+@fixtures.recorded('sparql')
 def sparql_query(query, lang):
     ''' Returns a JSON representation of data from a query to a given SPARQL endpoint.
 
     :param query: string containing the query.
-    :param lang: prefix representing the local endpoint to query (e.g. 'en', 'it'..).
+    :param lang: prefix representing the local endpoint to query (e.g. 'en', 'it'..); the endpoint of every
+                 language is set in ``settings.json`` (see ``load_endpoints()``).
 
     :return: JSON result obtained from the endpoint.
     '''
-    if lang == 'en':
-        local = ""
-    else:
-        local = lang + "."
-    
+    endpoint = get_endpoint(lang)
+    if sparql_cache is not None:  # answers to the same query are reused across resources and runs
+        json_result = sparql_cache.get(endpoint['url'], query)
+        if json_result is not None:
+            return json_result
     enc_query = urllib.quote_plus(query)
-    endpoint_url = "http://" + local + "dbpedia.org/sparql?default-graph-uri=&query=" + enc_query + \
+    endpoint_url = endpoint['url'] + "?default-graph-uri=&query=" + enc_query + \
                    "&format=application%2Fsparql-results%2Bjson&debug=on"
-    json_result = json_req(endpoint_url)
+    with endpoint_slot(endpoint):  # at most max_concurrency queries at a time
+        json_result = json_req(endpoint_url, endpoint['timeout'])
+    if sparql_cache is not None:
+        sparql_cache.put(endpoint['url'], query, json_result)
     return json_result
 
 
 def get_resources(lang, page_type):
-    ''' Constructs a list containing all resources from specified type/class.
-
-    Firstly computes the number of resources from given type, then performs (tot_res modulo 1000) calls
-    to the endpoint and construct the final list containing all of them.
+    ''' Constructs a list containing all resources from specified type/class, see ``iter_resources()``.
 
     :param lang: prefix representing the local endpoint to query (e.g. 'en', 'it'..).
     :param page_type: a string containing the ontology class to query.
 
     :return: resource list.
     '''
-    tot_res = int(count_query(lang, page_type))
-    offset = 0
-    fin_list = []
-    while (offset < tot_res):
-        base_query = "SELECT distinct ?s as ?res WHERE{ ?s a <http://dbpedia.org/ontology/" + page_type \
-                        + "> .?s <http://dbpedia.org/ontology/wikiPageID> ?f} LIMIT 1000 OFFSET "
-        query = base_query + str(offset)
-        json_res = sparql_query(query, lang)
-        res_list = json_res['results']['bindings']
-        for json_res in res_list:
-            resource = json_res['res']['value']
-            resource_name = resource.split("/")[-1]
-            fin_res = resource_name.encode('utf-8')
-            fin_list.append(fin_res)
-        offset += 1000
+    fin_list = list(iter_resources(lang, page_type))
     if fin_list == []:  # No resource found
         print("Could not retrieve any resource! Check if the domain exists in the dbpedia ontology!")
         #raise
@@ -241,6 +306,56 @@ def get_resources(lang, page_type):
     return fin_list
 
 
+def iter_resources(lang, page_type, page_size=None):
+    ''' Enumerates the resources of the specified type/class, asking the endpoint for ``page_size`` of them at a
+    time, so that the first ones can be extracted while the following ones are still being asked.
+
+    Resources are paginated by keyset: they are ordered by URI, and every query asks for the ones following
+    the last URI received. Unlike ``OFFSET``, which gets slower on every page and is capped by the endpoint for
+    big classes, each query costs the same. The filter depends on the ``keyset`` of the endpoint: ``iri``
+    (default) compares the IRIs, ``FILTER(?s > <last>)``, which Virtuoso answers from its index; ``str``
+    compares their strings, ``FILTER(STR(?s) > "last")``, for the stores following the SPARQL 1.1 standard,
+    where ``>`` is not defined between IRIs (both orders are the one of ``ORDER BY ?s``).
+
+    :param lang: prefix representing the local endpoint to query (e.g. 'en', 'it'..).
+    :param page_type: a string containing the ontology class to query.
+    :param page_size: number of resources asked with a single query; defaults to the ``page_size`` of the
+                      endpoint.
+
+    :return: yields utf-8 encoded resource names, in URI order.
+    '''
+    endpoint = get_endpoint(lang)
+    if page_size is None:
+        page_size = endpoint['page_size']
+    last = None
+    while True:
+        where_clause = "?s a <http://dbpedia.org/ontology/" + page_type + \
+                       "> .?s <http://dbpedia.org/ontology/wikiPageID> ?f"
+        if last is not None:
+            where_clause += keyset_filter(last, endpoint['keyset'])
+        query = "SELECT DISTINCT (?s AS ?res) WHERE{" + where_clause + "} ORDER BY ?s LIMIT " + str(page_size)
+        res_list = sparql_query(query, lang)['results']['bindings']
+        for json_res in res_list:
+            resource = json_res['res']['value']
+            yield resource.split("/")[-1].encode('utf-8')
+        if len(res_list) < page_size:
+            return
+        last = res_list[-1]['res']['value'].encode('utf-8')
+
+
+def keyset_filter(last, keyset):
+    ''' Builds the filter asking for the resources following the last one received, see ``iter_resources()``.
+
+    :param last: utf-8 encoded URI of the last resource received.
+    :param keyset: one of ``KEYSET_FILTERS``.
+
+    :return: the ``FILTER`` clause.
+    '''
+    if keyset == 'str':
+        return ' FILTER(STR(?s) > "' + last.replace('\\', '\\\\').replace('"', '\\"') + '")'
+    return " FILTER(?s > <" + last + ">)"
+
+
 def count_query(lang, page_type):
     '''Gets the number of resources of the given type using a count query on the specified endpoint.
 
@@ -261,16 +376,16 @@ def count_query(lang, page_type):
         raise
 
 
-def json_req(req):
+def json_req(req, timeout=None):
     ''' Performs a request to an online service and returns the answer in JSON.
 
     :param req: URL representing the request.
+    :param timeout: seconds to wait for the answer; defaults to the timeout of the HTTP client (``--http-timeout``).
 
     :return: a JSON representation of data obtained from a call to an online service.
     '''
     try:
-        call = urllib.urlopen(req)
-        answer = call.read()
+        answer = httpClient.get(req, timeout=timeout)  # pooled keep-alive connections, see httpClient.py
         json_ans = json.loads(answer)
         return json_ans
     except:
@@ -287,7 +402,7 @@ def get_resource_type(lang, resource):
 
     :return: a list containing all types associated to the resource in the local endpoint.
     '''
-    if lang == 'en':
+    if lang == 'en':  # namespace of the resources; the endpoint asked is set in settings.json
         local = ""
     else:
         local = lang + "."
@@ -316,31 +431,36 @@ def count_listelem_dict(res_dict):
             list_el_num += 1
     return list_el_num
 
-def evaluate(lang, source, tot_res, tot_res_success, tot_extracted_elems, tot_elems, num_statements):
+def evaluate(lang, source, tot_res, tot_res_success, tot_extracted_elems, tot_elems, num_statements, memo_stats=None):
     ''' Evaluates the extaction process and stores it in a csv file.
 
     :param source: resource type(dbpedia ontology type).
     :param tot_extracted_elems: number of list elements extracted in the resources.
     :param tot_elems: total number of list elements present in the resources.
+    :param memo_stats: ``(hits, lookups)`` of the section memo (see ``sectionMemo``), if it was used.
 
     :return: void.
     '''
-    try:
-        print "\nEvaluation:\n===========\n"
-        print "Resource Type:", lang + ":" + source
-        print "Resources Found:", tot_res
-        print "Resources successfully processed:", tot_res_success
-        print "List elements found:", tot_elems
-        print "List elements extracted:", tot_extracted_elems
-        print "Triples Created:", num_statements
+    print "\nEvaluation:\n===========\n"
+    print "Resource Type:", lang + ":" + source
+    print "Resources Found:", tot_res
+    print "Resources successfully processed:", tot_res_success
+    print "List elements found:", tot_elems
+    print "List elements extracted:", tot_extracted_elems
+    print "Triples Created:", num_statements
+    if memo_stats is not None and memo_stats[1] > 0:
+        print "Section memo hit rate:", str(round(100.0 * memo_stats[0] / memo_stats[1], 1)) + "%", \
+            "(" + str(memo_stats[0]) + " of " + str(memo_stats[1]) + " sections)"
+    if tot_elems > 0:
         accuracy = (1.0*tot_extracted_elems)/tot_elems
         print "Accuracy:", accuracy
-        print ""
-
-        #write the evaluation results in evaluation.csv
-        with open('evaluation.csv', 'a') as csvfile:
-            filewriter = csv.writer(csvfile, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
-            filewriter.writerow([lang, source, tot_res, tot_res_success, tot_extracted_elems, tot_elems, 
-                                    num_statements, accuracy])
-    except ZeroDivisionError:
+    else:  # e.g. a --delta run finding no changed page: no accuracy, the run is still recorded
+        accuracy = ''
         print '\nNo elements extracted!'
+    print ""
+
+    #write the evaluation results in evaluation.csv
+    with open('evaluation.csv', 'a') as csvfile:
+        filewriter = csv.writer(csvfile, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+        filewriter.writerow([lang, source, tot_res, tot_res_success, tot_extracted_elems, tot_elems, 
+                                num_statements, accuracy])
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+'''
+##########
+ WikiDump
+##########
+
+* This module reads pages directly from a local Wikipedia XML dump in the **multistream** format
+  (``<lang>wiki-<date>-pages-articles-multistream.xml.bz2``), so that the list-extractor can run without
+  any network dependency.
+
+* A multistream dump is a concatenation of bz2 streams of about 100 pages each. Its index file
+  (``...-multistream-index.txt.bz2``) lists ``offset:page_id:title`` for every page, where ``offset`` is the
+  position of the stream containing the page. This module uses it to:
+
+    * **seek** to a single page, decompressing only the stream that contains it (``get_page()``).
+    * **scan** the whole dump sequentially, page by page (``iter_pages()``).
+
+* The index is converted once into a SQLite file next to it, so that opening the dump does not require
+  loading millions of titles in memory.
+
+'''
+
+import bz2
+import os
+import sqlite3
+import xml.etree.cElementTree as etree
+
+CHUNK_SIZE = 256 * 1024  # bytes read from the dump at a time
+
+
+class MultistreamReader(object):
+    ''' File-like object that decompresses every bz2 stream of a multistream dump in sequence
+    (``bz2.BZ2File`` stops at the end of the first stream in Python 2).
+    '''
+
+    def __init__(self, path):
+        '''
+        :param path: path of the ``.xml.bz2`` dump.
+        '''
+        self.raw = open(path, 'rb')
+        self.decompressor = bz2.BZ2Decompressor()
+        self.buffer = ''
+
+    def read(self, size=-1):
+        ''' Reads up to ``size`` decompressed bytes (the whole remaining dump if ``size`` is negative).
+
+        :param size: number of bytes to read.
+
+        :return: decompressed data; an empty string at the end of the dump.
+        '''
+        while size < 0 or len(self.buffer) < size:
+            data = self.raw.read(CHUNK_SIZE)
+            if not data:
+                break
+            while data:
+                try:
+                    self.buffer += self.decompressor.decompress(data)
+                except EOFError:  # previous stream ended exactly at the end of the last chunk
+                    self.decompressor = bz2.BZ2Decompressor()
+                    continue
+                data = self.decompressor.unused_data
+                if data:  # a new stream starts inside this chunk
+                    self.decompressor = bz2.BZ2Decompressor()
+        if size < 0:
+            size = len(self.buffer)
+        out, self.buffer = self.buffer[:size], self.buffer[size:]
+        return out
+
+    def close(self):
+        self.raw.close()
+
+
+class MultistreamDump(object):
+    ''' A Wikipedia multistream dump together with its index. '''
+
+    def __init__(self, dump_path, index_path=None):
+        '''
+        :param dump_path: path of the ``pages-articles-multistream.xml.bz2`` dump.
+        :param index_path: path of the ``multistream-index.txt(.bz2)`` index; derived from ``dump_path``
+                           if not given.
+        '''
+        if index_path is None:
+            index_path = dump_path.replace('multistream.xml.bz2', 'multistream-index.txt.bz2')
+        self.dump_path = dump_path
+        self.index_path = index_path
+        self.index = None
+
+    def open_index(self):
+        ''' Opens the SQLite version of the index, building it from the index file if needed.
+
+        :return: a SQLite connection.
+        '''
+        if self.index is not None:
+            return self.index
+        db_path = self.index_path + '.db'
+        building = not os.path.exists(db_path)
+        self.index = sqlite3.connect(db_path, check_same_thread=False)
+        if building:
+            print 'Building dump index, please wait......'
+            self.index.execute("CREATE TABLE titles (title TEXT PRIMARY KEY, offset INTEGER) WITHOUT ROWID")
+            if self.index_path.endswith('.bz2'):
+                index_file = bz2.BZ2File(self.index_path)  # the index is a single bz2 stream
+            else:
+                index_file = open(self.index_path)
+            rows = (line.rstrip('\n').split(':', 2) for line in index_file)
+            self.index.executemany("INSERT OR IGNORE INTO titles VALUES (?, ?)",
+                                   ((title.decode('utf-8'), int(offset)) for offset, page_id, title in rows))
+            self.index.commit()
+            index_file.close()
+        return self.index
+
+    def get_page(self, title, follow_redirects=True):
+        ''' Reads a single page from the dump, decompressing only the stream that contains it.
+
+        :param title: page title or resource name (underscores are accepted).
+        :param follow_redirects: if the page is a redirect, return the page it points to.
+
+        :return: a page dict (see ``page_to_dict()``), or ``None`` if the page is not in the dump.
+        '''
+        if isinstance(title, str):
+            title = title.decode('utf-8')
+        title = title.replace('_', ' ')
+        row = self.open_index().execute("SELECT offset FROM titles WHERE title = ?", (title,)).fetchone()
+        if row is None:
+            return None
+
+        for page in self.read_stream(row[0]):
+            if page['title'] == title:
+                if follow_redirects and page['redirect']:
+                    return self.get_page(page['redirect'], follow_redirects=False)
+                return page
+        return None
+
+    def read_stream(self, offset):
+        ''' Decompresses the bz2 stream starting at ``offset`` and parses the pages it contains.
+
+        :param offset: byte offset of the stream in the dump.
+
+        :return: list of page dicts.
+        '''
+        decompressor = bz2.BZ2Decompressor()
+        xml = []
+        with open(self.dump_path, 'rb') as dump:
+            dump.seek(offset)
+            while True:
+                data = dump.read(CHUNK_SIZE)
+                if not data:
+                    break
+                try:
+                    xml.append(decompressor.decompress(data))
+                except EOFError:
+                    break
+                if decompressor.unused_data:  # reached the end of this stream
+                    break
+        # a stream holds a sequence of <page> elements without a common root
+        xml = ''.join(xml).rstrip()
+        if xml.endswith('</mediawiki>'):  # last stream of the dump
+            xml = xml[:-len('</mediawiki>')]
+        root = etree.fromstring('<pages>' + xml + '</pages>')
+        return [page_to_dict(page) for page in root.iter('page')]
+
+    def iter_pages(self, namespace=0):
+        ''' Scans the whole dump sequentially, yielding one page at a time with bounded memory.
+
+        :param namespace: only pages in this namespace are returned (0 for articles); ``None`` for all pages.
+
+        :return: yields page dicts.
+        '''
+        reader = MultistreamReader(self.dump_path)
+        root = None
+        try:
+            for event, elem in etree.iterparse(reader, events=('start', 'end')):
+                if root is None:
+                    root = elem  # <mediawiki>
+                if event != 'end' or strip_ns(elem.tag) != 'page':
+                    continue
+                page = page_to_dict(elem)
+                root.clear()  # free the pages already read, they're not needed anymore
+                if namespace is None or page['ns'] == namespace:
+                    yield page
+        finally:
+            reader.close()
+
+
+def strip_ns(tag):
+    ''' Removes the XML namespace from a tag name, e.g. ``{http://www.mediawiki.org/xml/export-0.10/}page``.
+
+    :param tag: tag name.
+
+    :return: local tag name.
+    '''
+    return tag.rsplit('}', 1)[-1]
+
+
+def page_to_dict(page):
+    ''' Converts a ``<page>`` element into a dict.
+
+    :param page: a ``<page>`` element.
+
+    :return: dict with ``title``, ``ns``, ``id``, ``revision``, ``redirect`` (target title or ``None``)
+             and ``text`` (wikitext) of the page.
+    '''
+    info = {'title': None, 'ns': 0, 'id': None, 'revision': None, 'redirect': None, 'text': u''}
+    for child in page:
+        tag = strip_ns(child.tag)
+        if tag == 'title':
+            info['title'] = child.text
+        elif tag == 'ns':
+            info['ns'] = int(child.text)
+        elif tag == 'id':
+            info['id'] = int(child.text)
+        elif tag == 'redirect':
+            info['redirect'] = child.get('title')
+        elif tag == 'revision':
+            for rev_child in child:
+                rev_tag = strip_ns(rev_child.tag)
+                if rev_tag == 'id':
+                    info['revision'] = int(rev_child.text)
+                elif rev_tag == 'text':
+                    info['text'] = rev_child.text or u''
+    return info
+
+
+def resource_name(title):
+    ''' Converts a page title into the resource name used by the list-extractor.
+
+    :param title: page title (unicode).
+
+    :return: utf-8 encoded resource name, with underscores instead of spaces.
+    '''
+    return title.replace(' ', '_').encode('utf-8')
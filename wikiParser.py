@@ -17,18 +17,38 @@
 '''
 
 import utilities
+import mapping_rules
+import pageCache
+import wikitextParser
+import wikiDump
+import fixtures
+import listItem
 import time
 import json
 import sys
 import subprocess
+import itertools
+import tempfile
+import os
+import zlib
+import Queue
+import random
+import threading
+import re
+import select
+import urllib
 
 #set default encoding
 reload(sys)
 sys.setdefaultencoding('utf8')
 
-last_sec_title = ""  # last section title parsed
-header_title = ""  # last header (main section) title parsed
-last_sec_lev = 0  # last section level parsed
+PARSERS = ['jsonpedia', 'native']
+
+wiki_dump = None  # local Wikipedia dump (wikiDump.MultistreamDump) used instead of JSONpedia, if any
+parser_backend = 'jsonpedia'  # 'native': pages are fetched as wikitext and converted by wikitextParser
+redirect_map = {}  # resource -> redirect target, loaded from redirectMap.py and completed by JSONpedia answers
+section_filter = None  # SectionFilter applied while parsing the pages of a class, if any (collect_mode 'a')
+section_paths = {}  # full section titles seen so far, so that every page shares the same title strings
 
 
 def main_parser(language, resource):
@@ -44,96 +64,450 @@ def main_parser(language, resource):
     :return: a ``dictionary`` containing section names as keys and featured lists as values, without empty fields.
     '''
 
-    global header_title  # used to concatenate sections and subsections titles
+    result = fetch_sections(language, resource)  # result obtained from JSONpedia in form of a list of sections
+    return parse_result(language, resource, result, follow_redirects=uses_jsonpedia())
+
+
+def uses_jsonpedia():
+    ''' Tells whether pages are obtained from JSONpedia, which may need to be asked for redirects separately
+    (the local dump and the native parser resolve them while fetching the page).
+
+    :return: boolean result.
+    '''
+    return wiki_dump is None and parser_backend == 'jsonpedia'
+
+
+def fetch_sections(language, resource):
+    ''' Obtains the sections of a resource, from the local dump if one is used, from JSONpedia otherwise.
+    Known redirects are resolved before fetching.
+
+    :param language: ``Language`` of Wikipedia page.
+    :param resource: ``Resource name``.
+
+    :return: an iterable of sections, in the form returned by ``jsonpedia_convert()``.
+    '''
+    if wiki_dump is not None:  # read the page from the local dump instead of asking JSONpedia
+        return dump_convert(resource)
+
+    target = redirect_map.get(resource, resource)  # known redirects are resolved before fetching
+    if parser_backend == 'native':
+        return native_convert(language, target)
+    return jsonpedia_sections(language, target)  # sections are decoded one at a time, while they are read
+
+
+def main_parser_dump_scan(language, resources):
+    ''' Scans the whole local Wikipedia dump (``wiki_dump``) sequentially and parses the pages of the given
+    resources, in the order they are found in the dump. Much faster than seeking each page when most of
+    the dump is needed.
+
+    :param language: ``Language`` of the dump.
+    :param resources: an iterable of ``resource names`` to be parsed.
+
+    :return: yields ``(resource, dictionary)`` pairs, in the same form returned by ``main_parser()``;
+             the dictionary is ``None`` for resources that could not be parsed or are missing from the dump.
+    '''
+    pending = set(resources)
+    redirects = {}  # redirect target -> resources pointing to it
+    for page in wiki_dump.iter_pages():
+        resource = wikiDump.resource_name(page['title'])
+        if resource in pending and page['redirect']:
+            redirects.setdefault(wikiDump.resource_name(page['redirect']), []).append(resource)
+            pending.discard(resource)
+            continue
+        found = []
+        if resource in pending:
+            found.append(resource)
+            pending.discard(resource)
+        found.extend(redirects.pop(resource, []))
+        for res in found:
+            try:
+                res_dict = parse_result(language, res, wikitextParser.parse_wikitext(page['text']),
+                                        follow_redirects=False)
+            except:
+                res_dict = None
+            yield res, res_dict
+
+    # resources not found, or redirecting to a page seen before the redirect itself
+    for res in list(pending) + [r for targets in redirects.values() for r in targets]:
+        try:
+            yield res, main_parser(language, res)
+        except:
+            yield res, None
+
+
+def dump_convert(resource):
+    ''' Reads a page from the local Wikipedia dump and converts its wikitext into the same list of sections
+    returned by ``jsonpedia_convert()``. Redirects are followed.
+
+    :param resource: name of the resource.
+
+    :return: a list of sections.
+    '''
+    page = wiki_dump.get_page(resource)
+    if page is None:
+        raise KeyError(resource + ' not found in the dump')
+    return wikitextParser.parse_wikitext(page['text'])
+
+
+def native_convert(language, resource):
+    ''' Native alternative to ``jsonpedia_convert()``: fetches the wikitext of a page from the MediaWiki API and
+    converts it with ``wikitextParser`` into the same list of sections, without any Java process. Redirects are
+    followed by the API, and their targets are added to ``redirect_map``.
+
+    Failed requests are retried with the same policy as JSONpedia calls (``RETRY_ATTEMPTS``,
+    ``RETRY_BACKOFF``, ``PAGE_DEADLINE``); a page given up on is recorded in the ``failed_resources`` file.
+
+    :param language: language of the resource `(e.g. it, en, fr...)`.
+    :param resource:  name of the resource.
+
+    :return: a list of sections.
+    :raise KeyError: if the page does not exist.
+    '''
+    deadline = time.time() + PAGE_DEADLINE
+    attempt = 1
+    while True:
+        try:
+            page = fetch_wikitext(language, resource)
+            break
+        except (IOError, ValueError) as error:
+            delay = retry_delay(attempt)
+            if attempt >= RETRY_ATTEMPTS or time.time() + delay > deadline:
+                record_failure(language, resource, 'wikitext not obtained - ' + str(error))
+                raise
+            print("MediaWiki API error, retrying in " + str(round(delay, 1)) + "s... Error: " + str(error))
+            time.sleep(delay)
+            attempt += 1
+
+    if page is None:
+        record_failure(language, resource, 'missing page')
+        raise KeyError(resource + ' not found in Wikipedia')
+    if page['redirect']:
+        redirect_map[resource] = page['redirect'].replace(' ', '_').encode('utf-8')
+    return wikitextParser.parse_wikitext(page['text'])
+
+
+@fixtures.recorded('wikitext')
+def fetch_wikitext(language, resource):
+    ''' Asks the MediaWiki API for the current wikitext of a page, following redirects.
+
+    :param language: language of the resource.
+    :param resource: name of the resource (utf-8 encoded).
+
+    :return: a dict with the ``text`` of the page and the title it ``redirect``-s to (or ``None``), or ``None``
+             if the page does not exist.
+    '''
+    url = "https://" + language + ".wikipedia.org/w/api.php?action=query&format=json&formatversion=2" \
+          "&prop=revisions&rvprop=content&rvslots=main&redirects&titles=" + urllib.quote(resource)
+    answer = utilities.json_req(url)
+    if 'query' not in answer:
+        raise ValueError(answer.get('error', {}).get('info', 'unexpected answer'))
+    pages = answer['query'].get('pages', [])
+    if not pages or pages[0].get('missing') or pages[0].get('invalid') or 'revisions' not in pages[0]:
+        return None
+    redirects = answer['query'].get('redirects', [])
+    return {'text': pages[0]['revisions'][0]['slots']['main']['content'],
+            'redirect': redirects[-1]['to'] if redirects else None}
+
+
+def main_parser_batch(language, resources, batch_size=1000):
+    ''' Batch version of ``main_parser()``: a generator that parses a whole list of resources using one
+    ``JSONpedia wrapper`` invocation for every ``batch_size`` resources.
+
+    :param language: ``Language`` of Wikipedia pages, needed by JSONpedia to identify the resources.
+    :param resources: an iterable of ``resource names``.
+    :param batch_size: number of resources handled by a single wrapper invocation.
+
+    :return: yields ``(resource, dictionary)`` pairs, in the same form returned by ``main_parser()``; the
+             dictionary is ``None`` if the resource could not be parsed.
+    '''
+    resources = iter(resources)
+    while True:
+        batch = list(itertools.islice(resources, batch_size))
+        if batch == []:
+            break
+        origins = {}  # fetched page -> resources asking for it (known redirects are resolved before fetching)
+        for resource in batch:
+            origins.setdefault(redirect_map.get(resource, resource), []).append(resource)
+        for target, result in jsonpedia_convert_batch(language, list(origins)):
+            for resource in origins.get(target, []):
+                if result is None:
+                    yield resource, None
+                    continue
+                try:
+                    res_dict = parse_result(language, resource, result)
+                except:
+                    res_dict = None
+                yield resource, res_dict
+
+
+def parse_result(language, resource, result, follow_redirects=True):
+    ''' Parses the sections obtained from JSONpedia for a resource, and stores the lists found in a dictionary.
+
+    :param language: ``Language`` of Wikipedia page.
+    :param resource: ``Resource name``, used to look for redirects if the result is empty.
+    :param result: list (or iterable) of sections obtained from ``jsonpedia_convert()``.
+    :param follow_redirects: if the result is empty, ask JSONpedia whether the resource is a redirect.
+
+    :return: a ``dictionary`` containing section names as keys and featured lists as values, without empty fields.
+    '''
     lists = {}  # initialize dictionary
-    result = jsonpedia_convert(language, resource)  # result obtained from JSONpedia in form of a list of sections
-    
-    if result == []:  #if the result is empty, try again looking for page redirects
-        new_resource = find_page_redirects(resource, language)
-        result = jsonpedia_convert(language, new_resource)
+    parser = SectionParser(section_filter)  # keeps the titles of the enclosing sections, for this page only
     
+    sect_num = 0
     for res in result:  # iterate on every section
+        sect_num += 1
         if '@type' in res and res['@type'] == 'section':
-            parsed_sect = parse_section(res)
+            parsed_sect = parser.parse_section(res)
             lists.update(parsed_sect)
+
+    if sect_num == 0 and follow_redirects:  #if the result is empty, try again looking for page redirects
+        new_resource = find_page_redirects(resource, language)
+        if new_resource:
+            for res in jsonpedia_sections(language, new_resource):
+                if '@type' in res and res['@type'] == 'section':
+                    lists.update(parser.parse_section(res))
     cleanlists = utilities.clean_dictionary(language, lists)  #clean resulting dictionary and leave only meaningful keys
+    if section_filter is not None:
+        section_filter.add_page(parser)
     
     return cleanlists
 
 
 def parse_section(section):
-    ''' Parses each section of the Wikipedia page searching for lists and calling ``parse_list()`` in turn.
+    ''' Parses a single section on its own, with a new ``SectionParser``: its title is not concatenated with
+    the titles of the sections before it. Use a ``SectionParser`` to parse the sections of a whole page.
 
-    Returns a dictionary with section names as keys and their list contents as values.
+    :param section: section to parse in json format.
 
-    :param section: current section to parse in json format.
-    :param title: a string used to concatenate names of nested sections.
-    
     :return: a ``dictionary`` representing the section.
     '''
-    
-    global last_sec_lev
-    global last_sec_title
-    global header_title
-    
-    section_lists = {}  #initializing dictionary
-    if ('content' in section and section['content'] != ""):  # parse only if there is available content
-        # checks current level to know whether to concatenate the title or not
-        if section['level'] == 0:  #this is a 'header title'
-            title = section['title']
-            header_title = title
-        elif section['level'] > last_sec_lev:
-            #must concatenate with the previous title and update 'header' for possible further depth
-            title = last_sec_title + " - " + section['title']
-            header_title = last_sec_title
-        else:
-            #just concatenate its title with current 'header'
-            title = header_title + " - " + section['title']
-        
-        last_sec_title = title
-        last_sec_lev = section['level']
-        content = section['content'].values()  # don't consider keys since they are non-relevant (e.g. @an0, @an1,..)
-        sect_list = []  # will contain the list extracted from current section
-        """Extract section content - values inside dictionary inside 'content' key """
+    return SectionParser().parse_section(section)
+
+
+class SectionParser(object):
+    ''' Parses the sections of a single Wikipedia page, in order. Section titles are concatenated with the
+    titles of their enclosing sections (e.g. ``Discography - Studio albums``), so the parser keeps track of
+    the last titles and level seen. Every page must be parsed with a new ``SectionParser``: since no state is
+    shared, different pages can be parsed at the same time by different threads.
+
+    If a ``SectionFilter`` is given, the lists of the sections it rejects are not parsed at all; their
+    titles are still followed, since they are part of the titles of the sections below them.
+    '''
+
+    def __init__(self, section_filter=None):
+        '''
+        :param section_filter: a ``SectionFilter``, or ``None`` to parse every section.
+        '''
+        self.last_sec_title = ""  # last section title parsed
+        self.header_title = ""  # last header (main section) title parsed
+        self.last_sec_lev = 0  # last section level parsed
+        self.section_filter = section_filter
+        self.skipped_sections = 0  # sections rejected by the filter
+        self.skipped_size = 0  # characters of list text in the rejected sections
+        self.skipped_elems = {}  # title -> number of list elements, for the rejected sections not excluded
+
+    def parse_section(self, section):
+        ''' Parses each section of the Wikipedia page searching for lists and calling ``parse_list()`` in turn.
+
+        Returns a dictionary with section names as keys and their list contents as values. List contents are
+        tuples, where nested list elements are one-element tuples, and section names are shared by every page.
+
+        :param section: current section to parse in json format.
         
-        for val in content:
-            if ('@type' in val):
-                if (val['@type'] == 'list'):  # look for lists inside current section
-                    level = 1  # level is used to keep trace of list inception
-                    nest_list = []  # will contain a nested list if there is one
-                    for cont in val['content']:  # pass list elements to be parsed
-                        if ('level' in cont and cont['level'] > level):  # check if current list element is nested
-                            nest_cont = parse_list(cont)  #call parse_list on nested list and store it in nest_cont
-                            nest_list.append(nest_cont)
-                            sect_list.append(nest_list)
-                            nest_list = []
-                        else:
-                            sect_list.append(parse_list(cont))
-                    '''adds a new field in the dictionary representing list in the given section'''
-                    section_lists[title] = sect_list
-    return section_lists
+        :return: a ``dictionary`` representing the section.
+        '''
+        section_lists = {}  #initializing dictionary
+        if ('content' in section and section['content'] != ""):  # parse only if there is available content
+            # checks current level to know whether to concatenate the title or not
+            if section['level'] == 0:  #this is a 'header title'
+                title = section['title']
+                self.header_title = title
+            elif section['level'] > self.last_sec_lev:
+                #must concatenate with the previous title and update 'header' for possible further depth
+                title = self.last_sec_title + " - " + section['title']
+                self.header_title = self.last_sec_title
+            else:
+                #just concatenate its title with current 'header'
+                title = self.header_title + " - " + section['title']
+            if type(title) == unicode:  # the same titles (e.g. 'Discography - Studio albums') recur in most pages
+                title = section_paths.setdefault(title, title)
+            
+            self.last_sec_title = title
+            self.last_sec_lev = section['level']
+            content = section['content'].values()  # don't consider keys since they are non-relevant (e.g. @an0, @an1,..)
+            if self.section_filter is not None and not self.section_filter.keep(title):
+                self.skip_section(title, content)
+                return section_lists
+            sect_list = []  # will contain the list extracted from current section
+            found = False  # whether the section contains a list
+            """Extract section content - values inside dictionary inside 'content' key """
+            
+            for val in content:
+                if ('@type' in val):
+                    if (val['@type'] == 'list'):  # look for lists inside current section
+                        found = True
+                        level = 1  # level is used to keep trace of list inception
+                        parent = None  # last element of the outer list, owning the following nested ones
+                        for cont in val['content']:  # pass list elements to be parsed
+                            if ('level' in cont and cont['level'] > level):  # check if current list element is nested
+                                nest_cont = parse_list(cont)  #call parse_list on nested list and store it in nest_cont
+                                sect_list.append((nest_cont,))  # a nested list is a one-element tuple
+                                if parent is not None:
+                                    parent.children += (nest_cont,)
+                            else:
+                                parent = parse_list(cont)
+                                sect_list.append(parent)
+            if found:
+                '''adds a new field in the dictionary representing list in the given section'''
+                section_lists[title] = tuple(sect_list)  # tuples take less memory than growable lists
+        return section_lists
+
+    def skip_section(self, title, content):
+        ''' Counts the lists of a section rejected by the filter, without parsing them.
+
+        :param title: full title of the section.
+        :param content: content nodes of the section.
+
+        :return: void.
+        '''
+        lists = [val for val in content if type(val) == dict and val.get('@type') == 'list']
+        self.skipped_sections += 1
+        self.skipped_size += sum(text_size(val['content']) for val in lists)
+        if lists and not self.section_filter.excluded(title):
+            # as for the parsed sections, the last lists found under a title replace the previous ones
+            self.skipped_elems[title] = sum(len(val['content']) for val in lists)
+
+
+class SectionFilter(object):
+    ''' Selects the sections worth parsing for a class of resources: the ones whose title matches a header
+    keyword of the domains mapped for the class (the same keywords looked for by ``mapper.select_mapping()``)
+    and is not in ``EXCLUDED_SECTIONS``. Any other section would be dropped by ``utilities.clean_dictionary()``
+    or ignored by the mapper, so its lists are never flattened.
+
+    The filter also keeps the totals of the sections skipped during the run. Since the elements of the
+    non-excluded sections used to be counted in the evaluation, their number is kept as well.
+    '''
+
+    def __init__(self, excluded, keywords):
+        '''
+        :param excluded: titles of the sections to be dropped.
+        :param keywords: header keywords (regular expressions) of the sections to be parsed.
+        '''
+        self.excluded_titles = set(excluded)
+        self.pattern = None
+        if keywords:
+            self.pattern = re.compile('|'.join('(?:' + key + ')' for key in keywords), re.IGNORECASE)
+        self.lock = threading.Lock()
+        self.sections = 0  # sections skipped
+        self.size = 0  # characters of list text skipped
+        self.elems = 0  # list elements skipped, not counting the excluded sections
+
+    def excluded(self, title):
+        ''' Tells whether a section is one of ``EXCLUDED_SECTIONS``.
+
+        :param title: full title of the section.
+
+        :return: ``True`` if the section is excluded.
+        '''
+        return title in self.excluded_titles
+
+    def keep(self, title):
+        ''' Tells whether the lists of a section must be parsed.
+
+        :param title: full title of the section (e.g. ``Discography - Studio albums``).
+
+        :return: ``True`` if the section is relevant for the class.
+        '''
+        return not self.excluded(title) and self.pattern is not None and self.pattern.search(title) is not None
+
+    def add_page(self, parser):
+        ''' Adds the sections skipped by the parser of a page to the totals of the run.
+
+        :param parser: the ``SectionParser`` of the page.
+
+        :return: void.
+        '''
+        with self.lock:
+            self.sections += parser.skipped_sections
+            self.size += parser.skipped_size
+            self.elems += sum(parser.skipped_elems.values())
+
+    def report(self):
+        ''' Prints the number of sections skipped in the current run.
+
+        :return: void.
+        '''
+        print "Section filter:", self.sections, "sections skipped,", str(self.size / 1024) + "KB of list text,", \
+            self.elems, "list elements not parsed"
+
+
+def build_section_filter(language, res_class, mapping, custom_mappers):
+    ''' Builds the ``SectionFilter`` of a class of resources.
+
+    :param language: language of the resources.
+    :param res_class: class of the resources (e.g. ``Writer``).
+    :param mapping: ``MAPPING`` dict, loaded from ``settings.json``.
+    :param custom_mappers: custom mapper settings, loaded from ``custom_mappers.json``.
+
+    :return: a ``SectionFilter``, or ``None`` if the header keywords of the class are not known (every
+             section is then parsed, and the mapper reports the missing rules as usual).
+    '''
+    if res_class not in mapping:
+        return None
+    keywords = []
+    for domain in mapping[res_class]:
+        if hasattr(mapping_rules, domain):
+            rules = getattr(mapping_rules, domain)
+        elif domain in custom_mappers:
+            rules = custom_mappers[domain]['headers']
+        else:
+            return None
+        if language not in rules:
+            return None
+        keywords += [key if type(key) == unicode else key.decode('utf-8') for key in rules[language]]
+    return SectionFilter(mapping_rules.EXCLUDED_SECTIONS.get(language, []), keywords)
+
+
+def text_size(node):
+    ''' Counts the characters of text in a JSONpedia node, without flattening it.
+
+    :param node: a node (or list of nodes) decoded from JSONpedia.
+
+    :return: number of characters in the strings of the node.
+    '''
+    if type(node) == dict:
+        return sum(text_size(val) for key, val in node.items() if key != '@type')
+    if type(node) == list:
+        return sum(text_size(val) for val in node)
+    if isinstance(node, basestring):
+        return len(node)
+    return 0
 
 
 def parse_list(list_elem):
     '''Parses a list element extracting relevant info and to be put in a string.
 
     It also marks `references (links)` with double curly brackets ``{{...}}`` in order to be recognizable 
-    for mapping.
+    for mapping, and records them (with external links, italic and quoted text) as typed spans of the
+    resulting ``listItem.ListItem``, so that mappers don't need to look for them again.
     
     :param list_elem: current list item in json format.
 
-    :return: a string containing useful info from list element.
+    :return: a ``ListItem`` (a unicode string) containing useful info from list element.
     '''
-    list_content = ""  # initializing output
+    item = listItem.ItemBuilder()  # initializing output
     if ('content' in list_elem and list_elem['content'] != None):
         for cont in list_elem['content']:
-            if ('@type' in cont and cont['@type'] != 'list_element'):
+            if type(cont) != dict:  # plain text
+                item.add(cont)
+            elif ('@type' in cont and cont['@type'] != 'list_element'):
                 cont_type = cont['@type']
                 if (cont_type == 'template' or cont_type == 'link'):  #Take only content field
                     tl_cont = cont['content']
+                    texts = []
                     if type(tl_cont) == list:
                         for tl_val in tl_cont.values():  # look for significant info in templates or links
-                            list_content += tl_val[0] + " "
+                            texts.append(tl_val[0] + " ")
                     elif type(tl_cont) == dict:
                         if '@an0' in tl_cont:  # recurring structure type with an anonymous field '@an0'
                             tl_val = tl_cont['@an0']  # template content lies inside first anonymus value
@@ -141,17 +515,20 @@ def parse_list(list_elem):
                                 for tlv in tl_val:
                                     if type(tlv) == dict:
                                         if 'label' in tlv:
-                                            list_content += tlv['label']  # for references
+                                            texts.append(tlv['label'])  # for references
                                     else:
-                                        list_content += tlv + " "  # for actual values
+                                        texts.append(tlv + " ")  # for actual values
+                    if cont_type == 'link' and 'url' in cont:
+                        item.add_link(cont['url'], texts)
+                    else:
+                        for text in texts:
+                            item.add(text)
                 elif (cont_type == 'reference'):
-                    list_content += " {{" + cont['label'] + "}} "  #this format helps me to discriminate the references
+                    item.add_reference(cont['label'])  #this format helps me to discriminate the references
             elif ('label' in cont):  # if there is a label key, take only its value
-                cont = cont['label']
-                list_content = list_content + " " + cont + " "  # necessary to avoid lack of spaces between words
-            elif ('attributes' not in cont):  # Take everything else but ignore bottom page references
-                list_content += cont
-    return list_content
+                item.add(" " + cont['label'] + " ")  # necessary to avoid lack of spaces between words
+            # anything else (e.g. bottom page references, with 'attributes') is ignored
+    return item.build()
 
 
 
@@ -246,6 +623,558 @@ def parse_list(list_elem):
 
 ### Comment the lines below to use the web-request version.
 
+JSONPEDIA_WRAPPER = ['java', '-jar', 'jsonpedia_wrapper.jar']  # command used to run the JSONpedia wrapper
+CHUNK_SIZE = 64 * 1024  # bytes of wrapper output decoded at a time
+jsonpedia_server = None  # pool of long-lived wrapper processes, used instead of spawning one process per call
+page_cache = None  # on-disk cache of the sections obtained from JSONpedia (see pageCache.py)
+page_revisions = {}  # resource -> current revision of its page, if known (--delta mode, see runState.py)
+
+# retry policy for failed JSONpedia calls
+RETRY_ATTEMPTS = 5  # maximum number of attempts for a page
+RETRY_BACKOFF = 1.0  # delay before the first retry, in seconds; doubled at every following attempt
+RETRY_MAX_DELAY = 60.0  # maximum delay between two attempts, in seconds
+PAGE_DEADLINE = 300.0  # time after which a page is given up on, in seconds
+failed_resources = None  # path of the file where the resources given up on are recorded, if any
+failures_lock = threading.Lock()
+
+
+class JSONpediaError(Exception):
+    ''' Raised when the ``JSONpedia wrapper`` could not return the sections of a page. '''
+
+    def __init__(self, message, retryable=True):
+        '''
+        :param message: error message.
+        :param retryable: whether the same call may succeed if made again.
+        '''
+        Exception.__init__(self, message)
+        self.message = message
+        self.retryable = retryable
+
+
+class JSONpediaServer(object):
+    ''' Keeps a single ``JSONpedia wrapper`` process running in ``--server`` mode, so that the JVM startup
+    and the JSONpedia initialization are paid once per run instead of once per resource.
+
+    Requests are sent as one JSON object per line on the wrapper's stdin, and each response is read back
+    as one line from its stdout, prefixed by the id of its request: any other line on stdout (e.g. printed by a
+    library) is skipped, so that it can't be taken for the answer to a request. If the wrapper crashes, it is transparently restarted and the request
+    is sent again. If it doesn't answer before the deadline of the request, it is killed, so that the next
+    request starts a new one.
+    '''
+
+    def __init__(self, max_restarts=3):
+        '''
+        :param max_restarts: number of times a request is retried on a freshly restarted wrapper
+                             before giving up.
+        '''
+        self.proc = None
+        self.max_restarts = max_restarts
+        self.pending = ''  # output read past the end of a chunk of the current answer
+        self.requests = 0  # number of requests sent, used as the id of the next one
+
+    def start(self):
+        ''' Spawns the wrapper process in server mode.
+
+        :return: void.
+        '''
+        self.proc = subprocess.Popen(JSONPEDIA_WRAPPER + ['--server'], stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE)
+        self.pending = ''
+
+    def is_alive(self):
+        ''' Checks whether the wrapper process is still running.
+
+        :return: boolean result.
+        '''
+        return self.proc is not None and self.proc.poll() is None
+
+    def request(self, language, resource, procs, filters, deadline=None):
+        ''' Sends a request to the wrapper and returns its answer, (re)starting the wrapper if needed.
+
+        :param language: language of the resource `(e.g. it, en, fr...)`.
+        :param resource: name of the resource.
+        :param procs: list of JSONpedia processors to be used.
+        :param filters: list of JSONpedia filters to be used.
+        :param deadline: time (as returned by ``time.time()``) after which the answer is not waited for anymore.
+
+        :return: the wrapper answer, as a JSON string.
+        :raise JSONpediaError: if the wrapper did not answer before the deadline.
+        '''
+        req, tag = self.make_request(language, resource, procs, filters)
+        for attempt in range(self.max_restarts + 1):
+            if not self.is_alive():
+                self.start()
+            try:
+                self.proc.stdin.write(req + '\n')
+                self.proc.stdin.flush()
+                answer = chunk = self.read_answer(tag, deadline)
+                while chunk and not chunk.endswith('\n'):
+                    chunk = self.read_line(CHUNK_SIZE, deadline)
+                    answer += chunk
+            except IOError:  # broken pipe, the wrapper died while we were talking to it
+                answer = ''
+            if answer.endswith('\n'):
+                return answer
+            print('JSONpedia wrapper stopped unexpectedly, restarting...')
+            self.stop()
+        raise OSError('JSONpedia wrapper keeps crashing on ' + language + ':' + resource)
+
+    def open(self, language, resource, procs, filters, deadline=None):
+        ''' Sends a request to the wrapper, like ``request()``, but returns a reader over the answer instead of
+        the whole answer, so that it can be decoded while it is being read.
+
+        :param language: language of the resource `(e.g. it, en, fr...)`.
+        :param resource: name of the resource.
+        :param procs: list of JSONpedia processors to be used.
+        :param filters: list of JSONpedia filters to be used.
+        :param deadline: time (as returned by ``time.time()``) after which the answer is not waited for anymore.
+
+        :return: a ``LineReader`` over the wrapper answer.
+        :raise JSONpediaError: if the wrapper did not answer before the deadline.
+        '''
+        req, tag = self.make_request(language, resource, procs, filters)
+        for attempt in range(self.max_restarts + 1):
+            if not self.is_alive():
+                self.start()
+            try:
+                self.proc.stdin.write(req + '\n')
+                self.proc.stdin.flush()
+                first = self.read_answer(tag, deadline)
+            except IOError:  # broken pipe, the wrapper died while we were talking to it
+                first = ''
+            if first:
+                return LineReader(lambda size: self.read_line(size, deadline), first)
+            print('JSONpedia wrapper stopped unexpectedly, restarting...')
+            self.stop()
+        raise OSError('JSONpedia wrapper keeps crashing on ' + language + ':' + resource)
+
+    def make_request(self, language, resource, procs, filters):
+        ''' Builds a request with a new id.
+
+        :param language: language of the resource `(e.g. it, en, fr...)`.
+        :param resource: name of the resource.
+        :param procs: list of JSONpedia processors to be used.
+        :param filters: list of JSONpedia filters to be used.
+
+        :return: a tuple ``(request, tag)``, where ``tag`` is the prefix of the line answering the request.
+        '''
+        self.requests += 1
+        req_id = str(self.requests)
+        req = json.dumps({'id': req_id, 'lang': language, 'resource': resource, 'procs': procs,
+                          'filters': filters})
+        return req, req_id + '\t'
+
+    def read_answer(self, tag, deadline=None):
+        ''' Reads the first chunk of the answer prefixed by ``tag``, skipping every line before it.
+
+        :param tag: prefix of the answer line, as returned by ``make_request()``.
+        :param deadline: time (as returned by ``time.time()``) after which the answer is not waited for anymore.
+
+        :return: the first chunk of the answer, without its prefix; an empty string if the wrapper is not
+                 running anymore.
+        :raise JSONpediaError: if the wrapper did not answer before the deadline.
+        '''
+        while True:
+            head = chunk = self.read_line(CHUNK_SIZE, deadline)
+            while chunk and len(head) < len(tag) + 1 and not head.endswith('\n'):
+                chunk = self.read_line(CHUNK_SIZE, deadline)
+                head += chunk
+            if not head:
+                return ''
+            if head.startswith(tag):
+                return head[len(tag):]
+            print('Skipping unexpected JSONpedia wrapper output: ' + head[:80].strip())
+            while chunk and not chunk.endswith('\n'):  # drop the rest of the line
+                chunk = self.read_line(CHUNK_SIZE, deadline)
+            if not chunk:
+                return ''
+
+    def read_line(self, size, deadline=None):
+        ''' Reads up to ``size`` bytes of the current answer, without going past its end, waiting for the
+        wrapper at most until the deadline. A wrapper that doesn't answer in time is killed.
+
+        :param size: maximum number of bytes to read.
+        :param deadline: time (as returned by ``time.time()``) after which the answer is not waited for anymore.
+
+        :return: a chunk of the answer, ending with a newline if it is the last one; an empty string if the
+                 wrapper is not running anymore.
+        :raise JSONpediaError: if the wrapper did not answer before the deadline.
+        '''
+        if not self.pending:
+            if self.proc is None:
+                return ''
+            try:
+                wait_output(self.proc.stdout, deadline)
+            except JSONpediaError:
+                self.stop()
+                raise
+            self.pending = os.read(self.proc.stdout.fileno(), max(size, CHUNK_SIZE))
+        end = self.pending.find('\n', 0, size)
+        if end < 0:
+            end = size - 1
+        data, self.pending = self.pending[:end + 1], self.pending[end + 1:]
+        return data
+
+    def stop(self):
+        ''' Closes the wrapper's stdin, which makes it exit, and reaps the process.
+
+        :return: void.
+        '''
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+            if self.proc.poll() is None:
+                self.proc.kill()
+            self.proc.wait()
+        except (IOError, OSError):
+            pass
+        self.proc = None
+        self.pending = ''
+
+
+class ServerPool(object):
+    ''' A fixed set of ``JSONpediaServer`` processes shared by concurrent threads: every request is served by
+    an idle wrapper, so that several pages can be fetched at the same time (see ``pipeline``).
+    '''
+
+    def __init__(self, size=1):
+        '''
+        :param size: number of wrapper processes.
+        '''
+        self.servers = [JSONpediaServer() for num in range(size)]
+        self.idle = Queue.Queue()
+        for server in self.servers:
+            self.idle.put(server)
+
+    def start(self):
+        ''' Spawns every wrapper process of the pool.
+
+        :return: void.
+        '''
+        for server in self.servers:
+            server.start()
+
+    def request(self, language, resource, procs, filters, deadline=None):
+        ''' Sends a request to an idle wrapper, waiting for one if they're all busy; see
+        ``JSONpediaServer.request()``.
+        '''
+        server = self.idle.get()
+        try:
+            return server.request(language, resource, procs, filters, deadline)
+        finally:
+            self.idle.put(server)
+
+    def open(self, language, resource, procs, filters, deadline=None):
+        ''' Sends a request to an idle wrapper, which is given back to the pool once the returned reader is
+        closed; see ``JSONpediaServer.open()``.
+        '''
+        server = self.idle.get()
+        try:
+            reader = server.open(language, resource, procs, filters, deadline)
+        except:
+            self.idle.put(server)
+            raise
+        reader.on_close = lambda: self.idle.put(server)
+        return reader
+
+    def stop(self):
+        ''' Stops every wrapper process of the pool.
+
+        :return: void.
+        '''
+        for server in self.servers:
+            server.stop()
+
+
+class LineReader(object):
+    ''' Reads a single line (one answer of the wrapper in server mode) in chunks, without going past its end.
+    '''
+
+    def __init__(self, read_line, first=''):
+        '''
+        :param read_line: a function returning up to ``n`` more bytes of the line, without going past its end
+                          (see ``JSONpediaServer.read_line()``).
+        :param first: a chunk of the line already read.
+        '''
+        self.read_line = read_line
+        self.pending = first
+        self.done = first.endswith('\n')
+        self.on_close = None  # called once the line has been read, e.g. to give a server back to its pool
+
+    def read(self, size):
+        ''' Reads up to ``size`` bytes of the line.
+
+        :param size: maximum number of bytes to read.
+
+        :return: a chunk of the line; an empty string once the whole line has been read.
+        '''
+        if self.pending:
+            data, self.pending = self.pending, ''
+            return data
+        if self.done:
+            return ''
+        data = self.read_line(size)
+        if not data or data.endswith('\n'):
+            self.done = True
+        return data
+
+    def close(self):
+        ''' Skips what is left of the line, so that the next answer can be read.
+
+        :return: void.
+        '''
+        try:
+            while not self.done:
+                self.read(CHUNK_SIZE)
+        except JSONpediaError:  # the wrapper timed out and has been killed
+            self.done = True
+        if self.on_close is not None:
+            self.on_close()
+            self.on_close = None
+
+
+class ProcessReader(object):
+    ''' Reads the output of a wrapper process spawned for a single call. '''
+
+    def __init__(self, proc, deadline=None):
+        '''
+        :param proc: the spawned ``subprocess.Popen`` object.
+        :param deadline: time (as returned by ``time.time()``) after which the output is not waited for anymore.
+        '''
+        self.proc = proc
+        self.deadline = deadline
+
+    def read(self, size):
+        wait_output(self.proc.stdout, self.deadline)
+        return os.read(self.proc.stdout.fileno(), size)
+
+    def close(self):
+        self.proc.kill()  #kill the spawned process
+        self.proc.wait()
+
+
+class SectionStream(object):
+    ''' Incremental decoder for the JSON answer of the wrapper: iterating on it yields the elements of the
+    top-level ``result`` array (the sections of the page) one at a time, while they are read. Only one
+    section is held in memory at a time, and only the ``list`` nodes of its content are kept, since
+    nothing else is used by ``SectionParser.parse_section()``.
+
+    The other top-level fields of the answer (e.g. ``success``, ``message``, ``redirect``) are available in
+    ``header`` once the iteration is over.
+    '''
+
+    decoder = json.JSONDecoder()
+
+    def __init__(self, read, key='result'):
+        '''
+        :param read: a function returning up to ``n`` more bytes of the answer, or an empty string at its end.
+        :param key: name of the top-level array to be streamed.
+        '''
+        self.read = read
+        self.key = key
+        self.header = {}
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def __iter__(self):
+        if self.peek() != '{':
+            raise ValueError('JSON object expected from the JSONpedia wrapper')
+        self.pos += 1
+        while True:
+            char = self.peek()
+            if char == '}' or char == '':
+                self.pos += 1
+                return
+            if char == ',':
+                self.pos += 1
+                continue
+            key = self.decode()
+            if self.peek() != ':':
+                raise ValueError('Malformed JSON from the JSONpedia wrapper')
+            self.pos += 1
+            if key == self.key and self.peek() == '[':
+                self.pos += 1
+                for elem in self.iter_array():
+                    yield elem
+            else:
+                self.header[key] = self.decode()
+
+    def iter_array(self):
+        ''' Yields the elements of the array being read, up to its closing bracket. '''
+        while True:
+            char = self.peek()
+            if char == ']':
+                self.pos += 1
+                return
+            if char == ',':
+                self.pos += 1
+                continue
+            if char == '':
+                raise ValueError('Truncated JSON from the JSONpedia wrapper')
+            yield prune_section(self.decode())
+
+    def peek(self):
+        ''' Skips whitespaces and returns the next character, reading more data if needed.
+
+        :return: next significant character, or an empty string at the end of the answer.
+        '''
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                return ''
+            self.fill(CHUNK_SIZE)
+
+    def decode(self):
+        ''' Decodes the next JSON value, reading more data until the value is complete. The amount of data
+        read is doubled at every attempt, so that big values are decoded in linear time.
+
+        :return: the decoded value.
+        '''
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+                self.fill(max(CHUNK_SIZE, len(self.buffer) - self.pos))
+                continue
+            if type(value) in (int, long, float) and not self.eof and \
+                    self.buffer[end:].lstrip('0123456789.eE+-') == '':  # the number could continue in the next chunk
+                self.fill(CHUNK_SIZE)
+                continue
+            self.pos = end
+            return value
+
+    def fill(self, size):
+        ''' Reads ``size`` more bytes, dropping the part of the buffer already decoded.
+
+        :param size: number of bytes to read.
+
+        :return: void.
+        '''
+        data = self.read(size)
+        if not data:
+            self.eof = True
+            return
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+
+
+def wait_output(stream, deadline):
+    ''' Waits until the output of a wrapper process can be read, at most until the deadline.
+
+    :param stream: stdout of the wrapper process.
+    :param deadline: time (as returned by ``time.time()``) after which the output is not waited for anymore;
+                     ``None`` to wait forever.
+
+    :return: void.
+    :raise JSONpediaError: if nothing could be read before the deadline (retryable).
+    '''
+    if deadline is None:
+        return
+    left = deadline - time.time()
+    if left <= 0 or not select.select([stream], [], [], left)[0]:
+        raise JSONpediaError('JSONpedia wrapper timed out', retryable=True)
+
+
+def prune_section(section):
+    ''' Drops from a section everything but its lists (paragraphs, templates, etc.), which would only take
+    memory since ``SectionParser.parse_section()`` ignores them.
+
+    :param section: a section node decoded from JSONpedia.
+
+    :return: the pruned section.
+    '''
+    if type(section) == dict and type(section.get('content')) == dict:
+        section['content'] = dict((key, val) for key, val in section['content'].items()
+                                  if type(val) == dict and val.get('@type') == 'list')
+    return section
+
+
+def start_jsonpedia_server(size=1):
+    ''' Starts a long-lived ``JSONpedia wrapper`` that will be used by every following call to
+    ``jsonpedia_convert()`` and ``find_page_redirects()``.
+
+    :param size: number of wrapper processes to be started, for concurrent callers.
+
+    :return: void.
+    '''
+    global jsonpedia_server
+    if jsonpedia_server is None:
+        jsonpedia_server = ServerPool(size)
+    jsonpedia_server.start()
+
+
+def stop_jsonpedia_server():
+    ''' Stops the long-lived ``JSONpedia wrapper``, if any. Following calls spawn one process each again.
+
+    :return: void.
+    '''
+    global jsonpedia_server
+    if jsonpedia_server is not None:
+        jsonpedia_server.stop()
+        jsonpedia_server = None
+
+
+def call_wrapper(language, resource, procs, filters=[]):
+    ''' Makes a call to the ``JSONpedia wrapper``, either through the long-lived server (if started) or by
+    spawning a new process, and returns its output.
+
+    :param language: language of the resource `(e.g. it, en, fr...)`.
+    :param resource: name of the resource.
+    :param procs: list of JSONpedia processors to be used.
+    :param filters: list of JSONpedia filters to be used.
+
+    :return: the wrapper output, as a JSON string.
+    :raise JSONpediaError: if the wrapper did not answer within ``PAGE_DEADLINE``; a spawned wrapper still
+                           running then is killed.
+    '''
+    deadline = time.time() + PAGE_DEADLINE
+    if jsonpedia_server is not None:
+        return jsonpedia_server.request(language, resource, procs, filters, deadline)
+
+    # spawn a new process that makes a call to the json wrapper, which creates the required
+    # json for the given resource; the process is killed once read, or when the deadline is over
+    reader = open_wrapper(language, resource, procs, filters, deadline)
+    try:
+        chunks = []
+        chunk = reader.read(CHUNK_SIZE)
+        while chunk:
+            chunks.append(chunk)
+            chunk = reader.read(CHUNK_SIZE)
+    finally:
+        reader.close()
+    return ''.join(chunks)
+
+
+def open_wrapper(language, resource, procs, filters=[], deadline=None):
+    ''' Like ``call_wrapper()``, but returns a reader over the wrapper output instead of the whole output.
+
+    :param language: language of the resource `(e.g. it, en, fr...)`.
+    :param resource: name of the resource.
+    :param procs: list of JSONpedia processors to be used.
+    :param filters: list of JSONpedia filters to be used.
+    :param deadline: time (as returned by ``time.time()``) after which the output is not waited for anymore;
+                     a wrapper still running then is killed.
+
+    :return: a reader object, with ``read(size)`` and ``close()`` methods; reading raises ``JSONpediaError``
+             once the deadline is over.
+    '''
+    if jsonpedia_server is not None:
+        return jsonpedia_server.open(language, resource, procs, filters, deadline)
+
+    args = JSONPEDIA_WRAPPER + ['-l', language, '-r', resource, '-p', ','.join(procs)]
+    if filters:
+        args += ['-f', ','.join(filters)]
+    return ProcessReader(subprocess.Popen(args, stdout=subprocess.PIPE), deadline)
+
+
 def jsonpedia_convert(language, resource):
     ''' Uses the ``JSONpedia wrapper`` to use the JSONpedia library to get a JSON representation of the 
         Wikipedia page divided in sections.
@@ -255,46 +1184,242 @@ def jsonpedia_convert(language, resource):
 
     :return: a JSON with significant info about the resource.
     '''
+    return list(jsonpedia_sections(language, resource))
+
+
+@fixtures.recorded_stream('jsonpedia')
+def jsonpedia_sections(language, resource):
+    ''' Streaming version of ``jsonpedia_convert()``: yields the sections of the page one at a time, while the
+    wrapper output is being decoded, so that the whole page is never held in memory.
+
+    Failed calls are retried according to the retry policy (``RETRY_ATTEMPTS``, ``RETRY_BACKOFF``,
+    ``PAGE_DEADLINE``), waiting an exponentially growing, jittered delay between attempts. Permanent errors
+    are not retried. Every attempt is bounded by the time left before the deadline: a wrapper that doesn't
+    answer in time is killed. A page given up on is recorded in the ``failed_resources`` file.
+
+    :param language: language of the resource we want to parse `(e.g. it, en, fr...)`.
+    :param resource:  name of the resource.
+
+    :return: yields the sections of the page.
+    :raise JSONpediaError: if the page could not be obtained.
+    '''
+    result = cached_result(language, resource)
+    if result is not None:
+        for section in result:
+            yield section
+        return
+
+    deadline = time.time() + PAGE_DEADLINE
+    attempt = 1
+    while True:
+        started = False  # once a section has been handed over, the call can't be retried transparently
+        try:
+            for section in jsonpedia_attempt(language, resource, deadline):
+                started = True
+                yield section
+            return
+        except JSONpediaError as error:
+            if not error.retryable or started or attempt >= RETRY_ATTEMPTS:
+                record_failure(language, resource, error.message)
+                raise
+            delay = retry_delay(attempt)
+            if time.time() + delay > deadline:
+                record_failure(language, resource, 'deadline exceeded - ' + error.message)
+                raise
+            print("JSONpedia error! - the web service may be currently overloaded, retrying in " +
+                  str(round(delay, 1)) + "s... Error: " + error.message)
+            time.sleep(delay)
+            attempt += 1
+
+
+def jsonpedia_attempt(language, resource, deadline=None):
+    ''' Makes a single call to the ``JSONpedia wrapper`` and yields the sections of the page while they are
+    decoded; see ``jsonpedia_sections()``.
+
+    :param language: language of the resource `(e.g. it, en, fr...)`.
+    :param resource:  name of the resource.
+    :param deadline: time (as returned by ``time.time()``) after which the wrapper is not waited for anymore.
+
+    :return: yields the sections of the page.
+    :raise JSONpediaError: if the call failed, telling whether it's worth retrying it.
+    '''
     try:
-        # spawn a new process that makes a call to the json wrapper, which creates the required
-        # json for the given resource, then load the string into a dict using json.loads()
-        proc = subprocess.Popen(['java','-jar','jsonpedia_wrapper.jar','-l', language, 
-                            '-r', resource, '-p', 'Structure', '-f', 'section'], stdout=subprocess.PIPE)
-        pipe_output = proc.stdout.read()  #redirect the input into python variable
-        proc.kill()  #kill the spawned process
-        sections = json.loads(pipe_output) #load the string as a python dict
+        # make a call to the json wrapper, which creates the required json for the given resource,
+        # then decode its output one section at a time
+        reader = open_wrapper(language, resource, ['Structure'], ['section'], deadline)
+        sections = SectionStream(reader.read)
+        compressor = zlib.compressobj()  # sections are compressed as they go, for the page cache
+        cached = [compressor.compress('[')]
+        try:
+            for num, section in enumerate(sections):
+                if page_cache is not None:
+                    cached.append(compressor.compress((',' if num else '') + json.dumps(section, separators=(',', ':'))))
+                yield section
+        finally:
+            reader.close()
 
     #handle different errors
-    except (IOError):
+    except (IOError) as error:
         print('Network Error - please check your connection and try again')
-        raise
-    except (ValueError):
-        raise
-    except (OSError):
+        raise JSONpediaError('network error: ' + str(error), retryable=True)
+    except (ValueError) as error:  # malformed or truncated output, e.g. the wrapper died while answering
+        raise JSONpediaError('invalid wrapper output: ' + str(error), retryable=True)
+    except (OSError) as error:
         print('Error spawning process!')
-        raise
-    
-    else:
-        #JSONpedia call was succesfull
-        if 'success' in sections and sections['success'] == "false":
-            if sections['message'] == 'Invalid page metadata.':
-                print("JSONpedia error: Invalid wiki page."),
-                raise
-            elif 'Expected DocumentElement found' in sections['message']:
-                print(("JSONpedia error: something went wrong (DocumentElement expected).")),
-                raise
-            else:
-                print("JSONpedia error! - the web service may be currently overloaded, retrying... "
-                      "Error: " + sections['message'])
-                time.sleep(1)  # wait one second before retrying
-                return jsonpedia_convert(language, resource)  #try again JSONpedia call
-        
+        raise JSONpediaError(str(error), retryable=False)
+
+    sections = sections.header
+    #JSONpedia call was succesfull
+    if 'success' in sections and sections['success'] == "false":
+        message = sections.get('message', '')
+        if message == 'Invalid page metadata.':
+            print("JSONpedia error: Invalid wiki page."),
+        elif 'Expected DocumentElement found' in message:
+            print(("JSONpedia error: something went wrong (DocumentElement expected).")),
+        raise JSONpediaError(message, retryable=is_retryable(message))
+
+    if 'redirect' in sections:  # the wrapper followed a redirect and answered for its target
+        redirect_map[resource] = sections['redirect'].encode('utf-8')
+    if page_cache is not None:
+        cached.append(compressor.compress(']') + compressor.flush())
+        page_cache.put_data(language, resource, ''.join(cached), page_revisions.get(resource))
+
+
+def is_retryable(message):
+    ''' Classifies an error reported by JSONpedia: invalid pages and malformed documents fail again on every
+    attempt, while anything else (typically an overload) may be transient.
+
+    :param message: error message reported by JSONpedia.
+
+    :return: boolean result.
+    '''
+    return message != 'Invalid page metadata.' and 'Expected DocumentElement found' not in message
+
+
+def retry_delay(attempt):
+    ''' Computes how long to wait before the next attempt: ``RETRY_BACKOFF`` doubled at every attempt, up to
+    ``RETRY_MAX_DELAY``, with a random jitter so that concurrent workers don't retry all at once.
+
+    :param attempt: number of attempts made so far.
+
+    :return: delay in seconds.
+    '''
+    delay = min(RETRY_MAX_DELAY, RETRY_BACKOFF * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def record_failure(language, resource, message):
+    ''' Appends a resource given up on to the ``failed_resources`` file, if one is set, so that it can be
+    inspected or extracted again later.
+
+    :param language: language of the resource.
+    :param resource: name of the resource.
+    :param message: reason of the failure.
+
+    :return: void.
+    '''
+    if failed_resources is None:
+        return
+    with failures_lock:
+        with open(failed_resources, 'a') as failed_file:
+            failed_file.write(language + '\t' + resource + '\t' + message.encode('utf-8').replace('\n', ' ') + '\n')
+
+
+def cached_result(language, resource):
+    ''' Looks for the JSONpedia result of a resource in the page cache, if one is in use.
+
+    :param language: language of the resource `(e.g. it, en, fr...)`.
+    :param resource: name of the resource.
+
+    :return: the cached result, or ``None`` if it must be fetched.
+    :raise pageCache.CacheMiss: if the page is not cached and the cache is in ``offline`` mode.
+    '''
+    if page_cache is None:
+        return None
+    result = page_cache.get(language, resource, page_revisions.get(resource))  # stale if the page was edited
+    if result is None and page_cache.mode == 'offline':
+        raise pageCache.CacheMiss(language + ':' + resource)
+    return result
+
+
+def jsonpedia_convert_batch(language, resources):
+    ''' Uses the ``JSONpedia wrapper`` in batch mode (``-i``) to get the JSON representation of many Wikipedia
+    pages with a single wrapper invocation. The wrapper streams one NDJSON record per page, so each page is
+    handed over as soon as it is ready.
+
+    Pages reported as failed because of an overload, or left unanswered because the wrapper stopped, are
+    retried one by one with ``jsonpedia_convert()``.
+
+    :param language: language of the resources `(e.g. it, en, fr...)`.
+    :param resources: list of resource names.
+
+    :return: yields ``(resource, result)`` pairs, where ``result`` is the same returned by
+             ``jsonpedia_convert()``, or ``None`` if JSONpedia could not process the page.
+    '''
+    to_fetch = []
+    for resource in resources:  # serve cached pages first, and fetch only the others
+        try:
+            result = cached_result(language, resource)
+        except pageCache.CacheMiss:
+            yield resource, None
+            continue
+        if result is not None:
+            yield resource, result
         else:
-            result = sections['result']  #JSON index with actual content
-            return result
+            to_fetch.append(resource)
+    if to_fetch == []:
+        return
+    resources = to_fetch
 
-    pass
+    list_file = tempfile.NamedTemporaryFile(prefix='jsonpedia_', suffix='.txt', delete=False)
+    pending = set(resources)
+    proc = None
+    try:
+        for resource in resources:
+            list_file.write(resource + '\n')
+        list_file.close()
+        proc = subprocess.Popen(JSONPEDIA_WRAPPER + ['-l', language, '-i', list_file.name, '-p', 'Structure',
+                                '-f', 'section'], stdout=subprocess.PIPE)
+        for line in iter(proc.stdout.readline, ''):
+            try:
+                record = json.loads(line)
+            except ValueError:  # not a NDJSON record
+                continue
+            resource = record['resource'].encode('utf-8')
+            if resource not in pending:
+                continue
+            pending.discard(resource)
+            sections = record.get('output', record)
+            if record['success'] == 'false' or ('success' in sections and sections['success'] == 'false'):
+                message = sections.get('message', record.get('message', ''))
+                if not is_retryable(message):
+                    print("JSONpedia error on " + language + ":" + resource + " - " + message)
+                    record_failure(language, resource, message)
+                    yield resource, None
+                    continue
+                pending.add(resource)  # possibly transient, try again on its own
+                continue
+            if 'redirect' in sections:  # the wrapper followed a redirect and answered for its target
+                redirect_map[resource] = sections['redirect'].encode('utf-8')
+            if page_cache is not None:
+                page_cache.put(language, resource, sections['result'], page_revisions.get(resource))
+            yield resource, sections['result']
+        proc.wait()
+    finally:
+        if proc is not None and proc.poll() is None:  # the generator was closed early
+            proc.kill()
+        os.remove(list_file.name)
+
+    for resource in resources:  # pages the batch could not handle
+        if resource in pending:
+            try:
+                result = jsonpedia_convert(language, resource)
+            except:
+                result = None
+            yield resource, result
 
+
+@fixtures.recorded('redirect')
 def find_page_redirects(res, lang):
     '''Calls ``JSONpedia wrapper`` to find out whether the resource name provided redirects to 
     another Wikipedia page. Returns the actual page if found, thus preventing from losing pages 
@@ -305,14 +1430,14 @@ def find_page_redirects(res, lang):
     
     :return: the redirection page, if found.
     '''
+    if res in redirect_map:  # already known, no need to ask JSONpedia
+        return redirect_map[res]
+
     try:
-        # spawn a new process that makes a call to the json wrapper, which creates the required
-        # json for the given resource, then load the string into a dict using json.loads()
-        proc = subprocess.Popen(['java','-jar','jsonpedia_wrapper.jar','-l', language, 
-                            '-r', resource, '-p', 'Structure'], stdout=subprocess.PIPE)
-        pipe_output = proc.stdout.read()   #redirect the input into python variable
-        proc.kill()  #kill the spawned process
-        result = json.load(pipe_output)  #load the string as a python dict
+        # make a call to the json wrapper, which creates the required json for the given resource,
+        # then load the string into a dict using json.loads()
+        pipe_output = call_wrapper(lang, res, ['Structure'])
+        result = json.loads(pipe_output)  #load the string as a python dict
         
     #handle different exceptions
     except (IOError):
@@ -331,4 +1456,5 @@ def find_page_redirects(res, lang):
         if 'structure' in dom:
             new_res = dom['structure'][1]['label']
             redirect = new_res.replace(" ", "_").encode('utf-8')
-    return redirect
\ No newline at end of file
+            redirect_map[res] = redirect
+    return redirect
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+'''
+#################
+ WikitextParser
+#################
+
+* This module converts raw wikitext (e.g. pages read from a Wikipedia XML dump, or fetched from the MediaWiki
+  API with ``--parser native``) into the same section structure returned by JSONpedia, so that it can be
+  handed over to ``wikiParser.SectionParser``.
+
+* Only what the list-extractor needs is reproduced: section headings and their levels, bulleted and
+  numbered lists with their nesting level, internal links (``reference``), external links (``link``)
+  and templates, whose first anonymous parameter is kept.
+
+'''
+
+import re
+
+HEADING = re.compile(r'^(={2,6})\s*(.+?)\s*\1\s*$')
+LIST_ITEM = re.compile(r'^([*#]+)\s*(.*)$')
+COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+REF = re.compile(r'<ref[^>/]*/>|<ref[^>]*>.*?</ref>', re.DOTALL | re.IGNORECASE)
+
+
+def parse_wikitext(text):
+    ''' Converts the wikitext of a page into a list of JSONpedia-like ``section`` nodes.
+
+    Every heading produces a section, even if it contains no lists, because ``wikiParser.SectionParser`` needs them
+    to build the full section titles. Lists found before the first heading are ignored, as JSONpedia does.
+
+    :param text: wikitext of the page.
+
+    :return: a list of sections, in the form returned by ``wikiParser.jsonpedia_convert()``.
+    '''
+    text = REF.sub('', COMMENT.sub('', text))
+    sections = []
+    section = None
+    current_list = None
+    for line in text.split('\n'):
+        heading = HEADING.match(line)
+        if heading:
+            level = len(heading.group(1)) - 2  # JSONpedia counts levels from '==' (level 0)
+            section = {'@type': 'section', 'title': strip_markup(heading.group(2)), 'level': level,
+                       'content': {}}
+            sections.append(section)
+            current_list = None
+            continue
+
+        item = LIST_ITEM.match(line)
+        if item and section is not None:
+            if current_list is None:  # a new list starts in this section
+                current_list = {'@type': 'list', 'content': []}
+                section['content']['@an' + str(len(section['content']))] = current_list
+            current_list['content'].append({'@type': 'list_item', 'level': len(item.group(1)),
+                                            'content': parse_inline(item.group(2))})
+        elif line.strip() != '':
+            current_list = None  # any other content closes the current list
+
+    return sections
+
+
+def parse_inline(text):
+    ''' Splits a line of wikitext into plain strings and JSONpedia-like ``reference``, ``link`` and
+    ``template`` nodes.
+
+    :param text: a line of wikitext (e.g. a list item without its leading ``*``).
+
+    :return: list of strings and nodes.
+    '''
+    content = []
+    plain = ''
+    i = 0
+    while i < len(text):
+        if text.startswith('[[', i):
+            end = find_closing(text, i, '[[', ']]')
+            if end != -1:
+                node = make_reference(text[i + 2:end])
+                if node is not None:
+                    if plain:
+                        content.append(plain)
+                        plain = ''
+                    content.append(node)
+                i = end + 2
+                continue
+        elif text.startswith('{{', i):
+            end = find_closing(text, i, '{{', '}}')
+            if end != -1:
+                if plain:
+                    content.append(plain)
+                    plain = ''
+                content.append(make_template(text[i + 2:end]))
+                i = end + 2
+                continue
+        elif text[i] == '[' and re.match(r'\[(?:https?:)?//', text[i:]):
+            end = text.find(']', i)
+            if end != -1:
+                if plain:
+                    content.append(plain)
+                    plain = ''
+                parts = text[i + 1:end].split(' ', 1)
+                label = parts[1] if len(parts) > 1 else ''
+                content.append({'@type': 'link', 'url': parts[0], 'content': {'@an0': [label]}})
+                i = end + 1
+                continue
+        plain += text[i]
+        i += 1
+    if plain:
+        content.append(plain)
+    return content
+
+
+def find_closing(text, start, opening, closing):
+    ''' Finds the position of the ``closing`` marker matching the ``opening`` one found at ``start``,
+    taking nested markers into account.
+
+    :param text: text to be scanned.
+    :param start: position of the opening marker.
+    :param opening: opening marker, e.g. ``{{``.
+    :param closing: closing marker, e.g. ``}}``.
+
+    :return: the position of the matching closing marker, or -1 if there is none.
+    '''
+    depth = 0
+    i = start
+    while i < len(text):
+        if text.startswith(opening, i):
+            depth += 1
+            i += len(opening)
+        elif text.startswith(closing, i):
+            depth -= 1
+            if depth == 0:
+                return i
+            i += len(closing)
+        else:
+            i += 1
+    return -1
+
+
+def make_reference(link):
+    ''' Builds a ``reference`` node from the inside of an internal link, e.g. ``Target|shown text``.
+    Links to files, images and categories are dropped.
+
+    :param link: text between ``[[`` and ``]]``.
+
+    :return: a reference node, or ``None`` if the link must be dropped.
+    '''
+    target = link.split('|', 1)[0].strip()
+    if re.match(r'(?:File|Image|Category|Media):', target, re.IGNORECASE):
+        return None
+    target = target.split('#', 1)[0].lstrip(':')
+    if target == '':  # link to a section of the same page
+        return {'@type': 'reference', 'label': strip_markup(link.split('|')[-1])}
+    return {'@type': 'reference', 'label': target}
+
+
+def make_template(body):
+    ''' Builds a ``template`` node from the inside of a template call, e.g. ``Name|first|key=value``.
+    Only the first anonymous parameter is kept, split into strings and references.
+
+    :param body: text between ``{{`` and ``}}``.
+
+    :return: a template node.
+    '''
+    params = split_params(body)
+    name = params[0].strip()
+    values = []
+    for param in params[1:]:
+        if '=' not in param.split('[[', 1)[0].split('{{', 1)[0]:  # first anonymous parameter
+            for part in parse_inline(param.strip()):
+                if isinstance(part, dict):
+                    if part['@type'] == 'reference':
+                        values.append({'label': part['label']})
+                else:
+                    values.append(part)
+            break
+    return {'@type': 'template', 'name': name, 'content': {'@an0': values}}
+
+
+def split_params(body):
+    ''' Splits the body of a template on the ``|`` that are not nested in links or other templates.
+
+    :param body: text between ``{{`` and ``}}``.
+
+    :return: list of the template name and its parameters.
+    '''
+    params = []
+    depth = 0
+    last = 0
+    i = 0
+    while i < len(body):
+        if body.startswith('{{', i) or body.startswith('[[', i):
+            depth += 1
+            i += 2
+        elif body.startswith('}}', i) or body.startswith(']]', i):
+            depth -= 1
+            i += 2
+        else:
+            if body[i] == '|' and depth == 0:
+                params.append(body[last:i])
+                last = i + 1
+            i += 1
+    params.append(body[last:])
+    return params
+
+
+def strip_markup(text):
+    ''' Removes links and emphasis markup from a short text, such as a heading.
+
+    :param text: wikitext to be cleaned.
+
+    :return: plain text.
+    '''
+    text = re.sub(r'\[\[(?:[^|\]]*\|)?([^\]]*)\]\]', r'\1', text)
+    text = re.sub(r"'{2,}", '', text)
+    return text.strip()